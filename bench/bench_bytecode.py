@@ -0,0 +1,87 @@
+"""Time taken to load a large cmd file with and without the bytecode cache.
+
+Usage:
+    $ python bench/bench_bytecode.py [function_count ...]
+
+Each cmd file is a single OttoCmd with function_count helper functions."""
+import os
+import os.path
+import sys
+import imp
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from otto.loader import load_source
+
+REPEAT = 10
+
+FUNC = '''
+def helper%d(a, b=1, *args, **kwargs):
+    total = 0
+    for i in range(a):
+        if i %% 3 == 0:
+            total += i * b
+        else:
+            total -= len(args) + len(kwargs)
+    return {'value': total, 'name': "helper%d", 'items': [a, b, args]}
+'''
+
+CMD = '''
+import otto.utils as otto
+
+class Big(otto.OttoCmd):
+    def run(self):
+        pass
+'''
+
+
+def make_cmd(root, func_count):
+    path = os.path.join(root, 'big.py')
+    with open(path, 'w') as outp:
+        for i in range(func_count):
+            outp.write(FUNC % (i, i))
+        outp.write(CMD)
+    return path
+
+
+def best_of(func):
+    times = []
+    for _ in range(REPEAT):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main(counts):
+    # Stop imp.load_source from leaving big.pyc behind (and then using it)
+    sys.dont_write_bytecode = True
+
+    print "%8s %10s %14s %12s %12s" % (
+            'funcs', 'lines', 'imp.load_src', 'cache cold', 'cache warm')
+    for count in counts:
+        root = tempfile.mkdtemp(prefix='otto-bench-')
+        try:
+            path = make_cmd(root, count)
+            cache_dir = os.path.join(root, 'cache')
+            lines = sum(1 for _ in open(path))
+
+            plain = best_of(lambda: imp.load_source('big', path))
+
+            def _cold():
+                shutil.rmtree(cache_dir, True)
+                load_source('big', path, cache_dir)
+            cold = best_of(_cold)
+
+            warm = best_of(lambda: load_source('big', path, cache_dir))
+
+            print "%8d %10d %12.2fms %10.2fms %10.2fms" % (
+                    count, lines, plain * 1000, cold * 1000, warm * 1000)
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 1000, 5000])
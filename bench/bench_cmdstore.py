@@ -0,0 +1,66 @@
+"""Memory use and lookup latency of CmdStore as the number of cmds grows.
+
+Usage:
+    $ python bench/bench_cmdstore.py [cmd_count ...]
+
+Each cmd count is measured in a fresh child process so that max RSS is
+meaningful. Cmds are spread over packs of 100, like a large install."""
+import os
+import os.path
+import sys
+import time
+import resource
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CMDS_PER_PACK = 100
+LOOKUPS = 100000
+
+
+def measure(cmd_count):
+    from otto.base import BASE_CMDS
+    from otto.cmdstore import CmdStore
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    store = CmdStore()
+    store.init_base(BASE_CMDS)
+    for i in range(cmd_count):
+        pack = u'pack%d' % (i // CMDS_PER_PACK)
+        store._add_cmd(pack, u'cmd%d' % i, u'/opt/otto/%s/cmd%d.py' % (pack, i), False)
+
+    start = time.time()
+    store.owners()
+    index_time = time.time() - start
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+
+    names = ['cmd%d' % (i * 7919 % cmd_count) for i in range(1000)]
+    names += ['pack0:cmd0', 'new', 'missing']
+    start = time.time()
+    for i in xrange(LOOKUPS):
+        store.find_pack(names[i % len(names)])
+    lookup_time = (time.time() - start) / LOOKUPS
+
+    start = time.time()
+    for i in xrange(LOOKUPS):
+        store.is_used('pack0', 'cmd0')
+    used_time = (time.time() - start) / LOOKUPS
+
+    print "%10d %10.1fMB %10.2fms %10.3fus %10.3fus" % (
+            cmd_count, rss / 1024.0, index_time * 1000,
+            lookup_time * 1e6, used_time * 1e6)
+
+
+def main(counts):
+    print "%10s %12s %12s %12s %12s" % (
+            'cmds', 'max rss', 'index build', 'find_pack', 'is_used')
+    for count in counts:
+        subprocess.check_call([sys.executable, __file__, '--measure', str(count)])
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--measure']:
+        measure(int(sys.argv[2]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 100000])
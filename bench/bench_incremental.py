@@ -0,0 +1,80 @@
+"""Cost of deciding whether a cmd with many inputs is up to date.
+
+Usage:
+    $ python bench/bench_incremental.py [file_count ...]
+
+Builds a tree of file_count small files and times the first fingerprint (every
+file read), an unchanged one (stat only) and one after touching 1% of files."""
+import os
+import os.path
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FILES_PER_DIR = 500
+
+
+class Cmd(object):
+    inputs = ['tree']
+    outputs = []
+
+
+def make_tree(root, file_count):
+    for i in range(file_count):
+        dir_path = os.path.join(root, 'tree', 'd%d' % (i // FILES_PER_DIR))
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        path = os.path.join(dir_path, 'f%d.proto' % i)
+        with open(path, 'w') as outp:
+            outp.write('message M%d { optional int32 x = 1; }\n' % i * 8)
+        os.utime(path, (1e9, 1e9))
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def measure(file_count):
+    from otto.incremental import State, fingerprint
+
+    root = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        make_tree(root, file_count)
+        os.chdir(root)
+        state_path = os.path.join(root, '.otto', 'state')
+
+        cold, (digest, files) = timed(fingerprint, Cmd, [])
+        save, _ = timed(State(state_path).put, 'p:cmd', digest, files)
+        load, state = timed(State, state_path)
+        warm, _ = timed(fingerprint, Cmd, [], None, state.get('p:cmd')[1])
+
+        for i in range(0, file_count, 100):
+            path = os.path.join('tree', 'd%d' % (i // FILES_PER_DIR), 'f%d.proto' % i)
+            os.utime(path, (2e9, 2e9))
+        touched, _ = timed(fingerprint, Cmd, [], None, state.get('p:cmd')[1])
+
+        size = os.path.getsize(state_path)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root)
+
+    return cold, warm, touched, load, save, size
+
+
+def main(counts):
+    print "%8s %10s %10s %10s %10s %10s %10s" % (
+            'files', 'cold', 'unchanged', '1% touched', 'load', 'save', 'state')
+    for count in counts:
+        cold, warm, touched, load, save, size = measure(count)
+        print "%8d %9.3fs %9.3fs %9.3fs %9.3fs %9.3fs %8dkB" % (
+                count, cold, warm, touched, load, save, size // 1024)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
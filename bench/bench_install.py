@@ -0,0 +1,83 @@
+"""`otto install` time, extracting the whole archive with tar and copying the
+pack into place against streaming it with otto.packing.
+
+Usage:
+    $ python bench/bench_install.py [file_count ...]
+
+For each file count a throwaway pack is generated (see bench_pack.py) and
+installed from:
+    * one pack: an archive written by `otto pack`,
+    * two packs: an archive holding two copies of the pack, made with
+      `tar -czf` as `otto pack` used to, so ROOT_FILE comes last and the
+      archive is streamed twice.
+Archives are installed into a scratch dir beside them, put it on tmpfs
+(TMPDIR=/dev/shm) to leave the disk out of it."""
+import os
+import os.path
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from otto import ROOT_FILE
+from otto.packing import install_pack, pack
+from bench_pack import make_pack, timed
+
+
+def make_archives(root, src_dir):
+    single = os.path.join(root, 'single.opack')
+    pack(single, src_dir, 'a')
+
+    stage = os.path.join(root, 'stage')
+    pack_root = os.path.join(stage, 'pack_root')
+    os.makedirs(pack_root)
+    for pack_name in ('a', 'b'):
+        shutil.copytree(src_dir, os.path.join(pack_root, pack_name))
+    with open(os.path.join(pack_root, ROOT_FILE), 'w') as outp:
+        json.dump({'packs': {'a': 'a', 'b': 'b'}}, outp)
+    double = os.path.join(root, 'double.opack')
+    subprocess.check_call(['tar', '-czf', double, '-C', stage, 'pack_root'])
+    shutil.rmtree(stage)
+    return single, double
+
+
+def extract_and_copy(root, path):
+    dest_root = tempfile.mkdtemp(dir=root)
+    install_temp = os.path.join(dest_root, '_installing')
+    os.mkdir(install_temp)
+    subprocess.check_call(['tar', '-xf', path, '-C', install_temp])
+    shutil.copytree(os.path.join(install_temp, 'pack_root', 'a'),
+            os.path.join(dest_root, 'a'))
+    shutil.rmtree(install_temp)
+    shutil.rmtree(dest_root)
+
+
+def stream(root, path):
+    dest_root = tempfile.mkdtemp(dir=root)
+    install_pack(path, dest_root, lambda pack_names: 'a')
+    shutil.rmtree(dest_root)
+
+
+def main(counts):
+    print "%8s %16s %16s %16s %16s" % ('files',
+            'one tar+copy', 'one stream', 'two tar+copy', 'two stream')
+    for count in counts:
+        root = tempfile.mkdtemp(prefix='otto-bench-')
+        try:
+            single, double = make_archives(root, make_pack(root, count))
+            print "%8d %14.0fms %14.0fms %14.0fms %14.0fms" % (
+                    count,
+                    timed(extract_and_copy, root, single) * 1000,
+                    timed(stream, root, single) * 1000,
+                    timed(extract_and_copy, root, double) * 1000,
+                    timed(stream, root, double) * 1000,
+                    )
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 1000, 5000])
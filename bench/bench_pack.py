@@ -0,0 +1,105 @@
+"""`otto pack` throughput, copying the pack and shelling out to tar against
+streaming it with otto.packing.
+
+Usage:
+    $ python bench/bench_pack.py [file_count ...]
+
+For each file count a throwaway pack (FILE_SIZE bytes of source per file, with
+a .pyc beside each) is generated, then packed:
+    * copy+tar: the pack is copied to a scratch dir, the .pyc files deleted
+      and `tar -czf` run, as `otto pack` used to,
+    * gz/bz2/xz: written by otto.packing at the default level (xz only if
+      Python has lzma)."""
+import os
+import os.path
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from otto import CMDS_FILE
+from otto.packing import _lzma, pack
+
+FILE_SIZE = 4096
+FILES_PER_DIR = 50
+REPEAT = 3
+
+SOURCE = """import otto.utils as otto
+
+class Cmd%d(otto.OttoCmd):
+    def run(self, *args):
+        otto.shell(['echo'] + list(args))
+"""
+
+
+def make_pack(root, file_count):
+    src_dir = os.path.join(root, 'local')
+    cmds = {}
+    for f in range(file_count):
+        dir_path = os.path.join(src_dir, 'lib%d' % (f // FILES_PER_DIR))
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        path = os.path.join(dir_path, 'cmd%d.py' % f)
+        source = SOURCE % f
+        with open(path, 'w') as outp:
+            outp.write((source * (FILE_SIZE // len(source) + 1))[:FILE_SIZE])
+        with open(path + 'c', 'wb') as outp:
+            outp.write(os.urandom(FILE_SIZE // 2))
+        cmds['cmd%d' % f] = path
+    with open(os.path.join(src_dir, CMDS_FILE), 'w') as outp:
+        json.dump({'cmds': cmds}, outp)
+    return src_dir
+
+
+def copy_and_tar(root, src_dir, path):
+    pack_root = os.path.join(root, 'pack_root')
+    shutil.copytree(src_dir, os.path.join(pack_root, 'bench'))
+    for dir_path, _, file_names in os.walk(pack_root):
+        for name in file_names:
+            if name.endswith('.pyc'):
+                os.remove(os.path.join(dir_path, name))
+    subprocess.check_call(['tar', '-czf', path, '-C', root, 'pack_root'])
+    shutil.rmtree(pack_root)
+
+
+def timed(func, *args):
+    best = None
+    for _ in range(REPEAT):
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(counts):
+    compressions = ['gz', 'bz2'] + (['xz'] if _lzma() is not None else [])
+    methods = ['copy+tar'] + compressions
+    print "%8s %10s" % ('files', 'source') + ''.join(
+            " %20s" % method for method in methods)
+    for count in counts:
+        root = tempfile.mkdtemp(prefix='otto-bench-')
+        try:
+            src_dir = make_pack(root, count)
+            megabytes = count * FILE_SIZE / 1e6
+            path = os.path.join(root, 'bench.opack')
+
+            cells = []
+            for method in methods:
+                if method == 'copy+tar':
+                    elapsed = timed(copy_and_tar, root, src_dir, path)
+                else:
+                    elapsed = timed(pack, path, src_dir, 'bench', method)
+                cells.append("%6.1fMB/s %6.1fkB" % (
+                    megabytes / elapsed, os.path.getsize(path) / 1e3))
+            print "%8d %8.1fMB" % (count, megabytes) + ''.join(
+                    " %20s" % cell for cell in cells)
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 1000, 10000])
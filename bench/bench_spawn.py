@@ -0,0 +1,57 @@
+"""Per call latency of shell() for the ways a command can be started.
+
+Usage:
+    $ python bench/bench_spawn.py [calls] [ballast_mb]
+
+ballast_mb allocates that much memory first, fork() has to copy the page
+tables of a big process (a warm daemon, say) while posix_spawn doesn't."""
+import os
+import os.path
+import sys
+import time
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(calls, func):
+    start = time.time()
+    for _ in xrange(calls):
+        func()
+    return (time.time() - start) / calls
+
+
+def main(calls, ballast_mb):
+    import otto.shell
+    from otto.shell import run
+
+    ballast = ' ' * (ballast_mb << 20)
+
+    def without_posix_spawn(cmd):
+        real_funcs = otto.shell._spawn_funcs[:]
+        otto.shell._spawn_funcs[:] = [None]
+        try:
+            return run(cmd)
+        finally:
+            otto.shell._spawn_funcs[:] = real_funcs
+
+    cases = [
+            ("check_output('true', shell=True) (before)",
+                lambda: subprocess.check_output('true', shell=True)),
+            ("run('true') via /bin/sh",
+                lambda: run('true')),
+            ("run(['true']) with fork/exec",
+                lambda: without_posix_spawn(['true'])),
+            ("run(['true']) with posix_spawn",
+                lambda: run(['true'])),
+            ]
+
+    print "%d calls, %dMB resident ballast" % (calls, ballast_mb)
+    for name, func in cases:
+        func()
+        print "%-45s %8.3fms" % (name, timed(calls, func) * 1000)
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [500, 0][len(args):]))
@@ -0,0 +1,102 @@
+"""Cmd lookup latency with the JSON CmdIndex against the SqliteIndex.
+
+Usage:
+    $ python bench/bench_sqliteindex.py [cmd_count ...]
+
+For each cmd count a throwaway tree of packs (CMDS_PER_PACK cmds each) is
+generated and indexed, then with each backend:
+    * lookup: a warm CmdStore is built and a cmd looked up, as every run does,
+    * update: one pack's cmds.json changes, the store is rebuilt and the
+      index saved."""
+import os
+import os.path
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from otto import CMDS_FILE
+from otto.cmdstore import CmdStore
+from otto.cmdindex import CmdIndex
+from otto.sqliteindex import SqliteIndex
+
+CMDS_PER_PACK = 10
+REPEAT = 5
+
+
+def make_packs(root, cmd_count):
+    packs = {}
+    for p in range(max(1, cmd_count // CMDS_PER_PACK)):
+        pack_name = 'pack%d' % p
+        pack_dir = os.path.join(root, pack_name)
+        os.makedirs(pack_dir)
+
+        cmds = {}
+        for c in range(min(CMDS_PER_PACK, cmd_count)):
+            cmd_name = 'cmd%d' % c
+            cmd_path = os.path.join(pack_dir, '%s.py' % cmd_name)
+            with open(cmd_path, 'w') as outp:
+                outp.write('pass\n')
+            cmds[cmd_name] = cmd_path
+
+        with open(os.path.join(pack_dir, CMDS_FILE), 'w') as outp:
+            json.dump({'cmds': cmds}, outp)
+        packs[pack_name] = pack_dir
+    return packs
+
+
+def lookup(packs, index):
+    start = time.time()
+    store = CmdStore()
+    store.init_base({})
+    store.init_index(index())
+    for pack_name, pack_dir in packs.iteritems():
+        store.load_pack(pack_name, pack_dir)
+    store.save_index()
+    store.lookup('cmd0')
+    return time.time() - start
+
+
+def update(packs, index):
+    config_path = os.path.join(packs['pack0'], CMDS_FILE)
+    with open(config_path, 'r+') as outp:
+        config = json.load(outp)
+        outp.seek(0)
+        outp.write(json.dumps(config) + ' ')
+    return lookup(packs, index)
+
+
+def best_of(func, *args):
+    return min(func(*args) for _ in range(REPEAT))
+
+
+def main(counts):
+    print "%8s %14s %14s %14s %14s" % (
+            'cmds', 'json lookup', 'sqlite lookup', 'json update', 'sqlite update')
+    for count in counts:
+        root = tempfile.mkdtemp(prefix='otto-bench-')
+        try:
+            packs = make_packs(root, count)
+            index_path = os.path.join(root, 'index.json')
+            sqlite_path = os.path.join(root, 'index.db')
+
+            json_index = lambda: CmdIndex(index_path)
+            sqlite_index = lambda: SqliteIndex(sqlite_path)
+            lookup(packs, json_index)
+            lookup(packs, sqlite_index)
+
+            print "%8d %12.2fms %12.2fms %12.2fms %12.2fms" % (
+                    count,
+                    best_of(lookup, packs, json_index) * 1000,
+                    best_of(lookup, packs, sqlite_index) * 1000,
+                    best_of(update, packs, json_index) * 1000,
+                    best_of(update, packs, sqlite_index) * 1000,
+                    )
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 1000, 100000])
@@ -0,0 +1,83 @@
+"""Cold-start time of CmdStore against the number of installed packs.
+
+Usage:
+    $ python bench/bench_startup.py [pack_count ...]
+
+For each pack count a throwaway tree of packs is generated, then loaded:
+    * without a CmdIndex (every cmds.json is parsed and every cmd stat'd),
+    * with an empty CmdIndex (first run, the index gets built),
+    * with a warm CmdIndex (subsequent runs)."""
+import os
+import os.path
+import sys
+import json
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from otto import CMDS_FILE
+from otto.cmdstore import CmdStore
+from otto.cmdindex import CmdIndex
+
+CMDS_PER_PACK = 10
+REPEAT = 5
+
+
+def make_packs(root, pack_count):
+    packs = {}
+    for p in range(pack_count):
+        pack_name = 'pack%d' % p
+        pack_dir = os.path.join(root, pack_name)
+        os.makedirs(pack_dir)
+
+        cmds = {}
+        for c in range(CMDS_PER_PACK):
+            cmd_name = 'cmd%d' % c
+            cmd_path = os.path.join(pack_dir, '%s.py' % cmd_name)
+            with open(cmd_path, 'w') as outp:
+                outp.write('pass\n')
+            cmds[cmd_name] = cmd_path
+
+        with open(os.path.join(pack_dir, CMDS_FILE), 'w') as outp:
+            json.dump({'cmds': cmds}, outp)
+        packs[pack_name] = pack_dir
+    return packs
+
+
+def load(packs, index_path=None):
+    start = time.time()
+    store = CmdStore()
+    store.init_base({})
+    if index_path is not None:
+        store.init_index(CmdIndex(index_path))
+    for pack_name, pack_dir in packs.iteritems():
+        store.load_pack(pack_name, pack_dir)
+    store.save_index()
+    return time.time() - start
+
+
+def best_of(func, *args):
+    return min(func(*args) for _ in range(REPEAT))
+
+
+def main(counts):
+    print "%8s %12s %12s %12s" % ('packs', 'no index', 'cold index', 'warm index')
+    for count in counts:
+        root = tempfile.mkdtemp(prefix='otto-bench-')
+        try:
+            packs = make_packs(root, count)
+            index_path = os.path.join(root, 'index.json')
+
+            plain = best_of(load, packs)
+            cold = load(packs, index_path)
+            warm = best_of(load, packs, index_path)
+
+            print "%8d %10.2fms %10.2fms %10.2fms" % (
+                    count, plain * 1000, cold * 1000, warm * 1000)
+        finally:
+            shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10, 100, 500, 1000])
@@ -13,8 +13,17 @@ CMDS_FILE = 'cmds.json'
 # Global paths
 GLOBAL_DIR = os.path.expanduser('~/.otto')
 GLOBAL_CONFIG = os.path.join(GLOBAL_DIR, ROOT_FILE)
+HISTORY_FILE = os.path.join(GLOBAL_DIR, 'history')
+CACHE_DIR = os.path.join(GLOBAL_DIR, '_cache')
+INDEX_FILE = os.path.join(CACHE_DIR, 'index.json')
+SQLITE_INDEX_FILE = os.path.join(CACHE_DIR, 'index.db')
+SCAN_JOURNAL = os.path.join(CACHE_DIR, 'scan')
+DAEMON_SOCKET = os.path.join(CACHE_DIR, 'daemon.sock')
+BYTECODE_DIR = os.path.join(CACHE_DIR, 'bytecode')
+ARTIFACT_DIR = os.path.join(CACHE_DIR, 'artifacts')
 
 # Local paths
 LOCAL_DIR = os.path.join(os.getcwd(), '.otto')
 LOCAL_CONFIG = os.path.join(LOCAL_DIR, ROOT_FILE)
 LOCAL_CMDS_DIR = os.path.join(LOCAL_DIR, 'local')
+LOCAL_STATE = os.path.join(LOCAL_DIR, 'state')
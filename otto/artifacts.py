@@ -0,0 +1,220 @@
+"""A content addressed cache of cmd outputs, shared by every checkout.
+
+Cmds that declare inputs and outputs (see otto.incremental) are fingerprinted
+by their source, args and inputs, none of which depend on where the checkout
+is. After such a cmd runs its outputs are copied into ARTIFACT_DIR under that
+fingerprint; when the same cmd is later run with the same fingerprint, in this
+checkout or another, the outputs are restored (hardlinked where possible)
+instead of running it.
+
+Entries are directories, ARTIFACT_DIR/<key[:2]>/<key[2:]>/, holding the outputs
+and their total size. An entry's mtime is bumped whenever it's used so that
+once the cache grows past max_size the least recently used are evicted."""
+import os
+import os.path
+import shutil
+import marshal
+import tempfile
+from hashlib import sha1
+
+from otto import ARTIFACT_DIR
+
+DEFAULT_MAX_SIZE = 1 << 30
+COUNTERS = ('hits', 'misses', 'stores', 'evictions')
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _copy_file(src, dest, link):
+    dest_dir = os.path.dirname(dest)
+    if dest_dir and not os.path.isdir(dest_dir):
+        os.makedirs(dest_dir)
+
+    if link:
+        try:
+            os.link(src, dest)
+            return
+        except OSError:
+            # Different filesystems, fall back to copying
+            pass
+    shutil.copy2(src, dest)
+
+
+def _copy(src, dest, link=False):
+    """Copy (or hardlink) the file or tree at src to dest, returns its size."""
+    if not os.path.isdir(src):
+        _copy_file(src, dest, link)
+        return os.path.getsize(src)
+
+    size = 0
+    for dir_path, _, file_names in os.walk(src):
+        dest_dir = os.path.join(dest, os.path.relpath(dir_path, src))
+        if not os.path.isdir(dest_dir):
+            os.makedirs(dest_dir)
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            _copy_file(path, os.path.join(dest_dir, name), link)
+            size += os.path.getsize(path)
+    return size
+
+
+def _files(path):
+    if not os.path.isdir(path):
+        return [path]
+    return [os.path.join(dir_path, name)
+            for dir_path, _, file_names in os.walk(path) for name in file_names]
+
+
+def cacheable(outputs):
+    """Only outputs inside the checkout can be restored in another one."""
+    return bool(outputs) and not any(
+            os.path.isabs(path) or os.path.normpath(path).startswith(os.pardir)
+            for path in outputs)
+
+
+class ArtifactCache(object):
+    def __init__(self, root=None, max_size=DEFAULT_MAX_SIZE):
+        self.root = root or ARTIFACT_DIR
+        self.max_size = max_size
+        self.stats_path = os.path.join(self.root, 'stats')
+
+    @staticmethod
+    def key(name, digest):
+        """The cache key for a run of name with fingerprint digest."""
+        return sha1("%s\0%s" % (name, digest)).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def restore(self, key, outputs):
+        """Replace outputs with the cached copies for key, returns False if
+        there aren't any."""
+        entry = self._entry(key)
+        if not cacheable(outputs) or not os.path.isdir(entry):
+            self.count('misses')
+            return False
+
+        try:
+            for path in outputs:
+                _remove(path)
+                _copy(os.path.join(entry, 'outputs', path), path, link=True)
+        except (IOError, OSError):
+            # A damaged entry, the cmd will run and replace it
+            shutil.rmtree(entry, ignore_errors=True)
+            self.count('misses')
+            return False
+
+        os.utime(entry, None)
+        self.count('hits')
+        return True
+
+    def detach(self, outputs):
+        """Give restored outputs their own copy before a cmd rewrites them,
+        so that the cached copy they're hardlinked to isn't changed too."""
+        for output in outputs:
+            if not os.path.exists(output):
+                continue
+            for path in _files(output):
+                if os.path.islink(path) or os.stat(path).st_nlink < 2:
+                    continue
+                temp_path = "%s.%d.tmp" % (path, os.getpid())
+                shutil.copy2(path, temp_path)
+                os.rename(temp_path, path)
+
+    def store(self, key, outputs):
+        """Copy outputs into the cache under key, evicting old entries if the
+        cache is now too big. Returns False if they couldn't be stored."""
+        entry = self._entry(key)
+        if not cacheable(outputs) or os.path.isdir(entry):
+            return False
+        if not all(os.path.exists(path) for path in outputs):
+            return False
+
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        temp_dir = tempfile.mkdtemp(dir=self.root, prefix='.tmp')
+        try:
+            size = sum(_copy(path, os.path.join(temp_dir, 'outputs', path))
+                    for path in outputs)
+            with open(os.path.join(temp_dir, 'size'), 'w') as outp:
+                outp.write(str(size))
+
+            if not os.path.isdir(os.path.dirname(entry)):
+                os.makedirs(os.path.dirname(entry))
+            os.rename(temp_dir, entry)
+        except (IOError, OSError):
+            # Most likely another process stored the same key first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return False
+
+        self.count('stores')
+        self.evict()
+        return True
+
+    def entries(self):
+        """Returns [(last_used, size, path), ...] for every entry."""
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, name)
+                try:
+                    with open(os.path.join(path, 'size'), 'r') as inp:
+                        size = int(inp.read())
+                    entries.append((os.stat(path).st_mtime, size, path))
+                except (IOError, OSError, ValueError):
+                    continue
+        return entries
+
+    def evict(self):
+        """Remove the least recently used entries until under max_size."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+
+        evicted = 0
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+
+        if evicted:
+            self.count('evictions', evicted)
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
+        if os.path.exists(self.stats_path):
+            os.remove(self.stats_path)
+
+    def counters(self):
+        """Returns {counter: count} for each of COUNTERS."""
+        try:
+            with open(self.stats_path, 'rb') as inp:
+                counters = marshal.load(inp)
+        except (IOError, EOFError, ValueError, TypeError):
+            counters = {}
+        return dict((name, counters.get(name, 0)) for name in COUNTERS)
+
+    def count(self, name, amount=1):
+        from otto.locking import locked, atomic_write
+        try:
+            if not os.path.isdir(self.root):
+                os.makedirs(self.root)
+            with locked(self.root):
+                counters = self.counters()
+                counters[name] += amount
+                atomic_write(self.stats_path, marshal.dumps(counters))
+        except (IOError, OSError):
+            pass
@@ -0,0 +1,41 @@
+"""The registry of base cmds.
+
+Importing otto.cmds (and everything it depends on) just to list or look up
+the base cmds is wasteful, so they're registered here by name and only
+imported once one of them is actually needed."""
+
+
+class BaseCmd(object):
+    """A lazy reference to an OttoCmd subclass defined in a module."""
+    __slots__ = ('name', 'module', 'attr')
+
+    def __init__(self, name, module='otto.cmds', attr=None):
+        self.name = name
+        self.module = module
+        self.attr = attr or name.capitalize()
+
+    def load(self):
+        """Import and return the OttoCmd class."""
+        module = __import__(self.module, fromlist=[self.attr])
+        return getattr(module, self.attr)
+
+    def __repr__(self):
+        return "BaseCmd(%s:%s)" % (self.module, self.attr)
+
+
+BASE_CMDS = dict((name, BaseCmd(name)) for name in (
+        'new',
+        'edit',
+        'mv',
+        'remember',
+        'pack',
+        'install',
+        'uninstall',
+        'wait',
+        'dr',
+        'cache',
+        'watch',
+        'stats',
+        'check',
+        ))
+BASE_CMDS['check-json'] = BaseCmd('check-json', attr='CheckJson')
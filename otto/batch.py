@@ -0,0 +1,110 @@
+"""Run many otto invocations from one process.
+
+`otto --batch` reads one `cmd [arg ...]` invocation per line from stdin (or
+NUL delimited ones with -0), skipping blank ones and comments (starting with
+#), and runs them all with the same, already loaded,
+OttoDispatcher. Each invocation runs in a child forked from the dispatcher, so
+it costs a fork rather than an interpreter startup, and a cmd that exits, bails
+or changes directory can't affect the others. At most `jobs` run at once.
+
+The exit status of each invocation is reported on stderr as it finishes:
+    otto: [<line number>] <status> <invocation>"""
+import sys
+import shlex
+import traceback
+
+from otto import jobserver
+from otto.utils import exit_status, fork_call
+
+
+def read_invocations(stream, null=False):
+    """Yields (line_number, invocation) for each invocation that isn't blank
+    or a comment."""
+    if null:
+        chunks = stream.read().split('\0')
+    else:
+        chunks = stream
+
+    for number, chunk in enumerate(chunks, 1):
+        chunk = chunk.strip()
+        if chunk and not chunk.startswith('#'):
+            yield number, chunk
+
+
+def run_invocation(dispatcher, invocation, jobs=1):
+    """Run a single invocation in this process and return its exit status."""
+    try:
+        words = shlex.split(invocation)
+        dispatcher.handle(words[0], words[1:], tone=False, jobs=jobs)
+        return 0
+    except SystemExit as e:
+        return exit_status(e)
+    except KeyboardInterrupt:
+        return 130
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+
+def report(number, status, invocation):
+    label = 'ok' if status == 0 else 'exit %d' % status
+    sys.stderr.write("otto: [%d] %s %s\n" % (number, label, invocation))
+    sys.stderr.flush()
+
+
+def run_batch(dispatcher, stream, jobs=1, null=False):
+    """Run every invocation read from stream, jobs at a time.
+
+    Returns 0 if they all succeeded, otherwise 1."""
+    jobs = jobs if jobs is None else max(1, jobs)
+    running = {}
+    failed = False
+
+    # Every invocation run alongside another needs a jobserver token
+    server = jobserver.current()
+    tokens = {}
+
+    def _wait(want_token=False):
+        """Returns the status of the next invocation to finish, or None if
+        a token may have become free or some other child (a tone player,
+        say) was reaped first."""
+        pid, status = jobserver.wait_child(server if want_token else None)
+        if pid is None or pid not in running:
+            return None
+        if pid in tokens:
+            server.release(tokens.pop(pid))
+        number, invocation = running.pop(pid)
+        report(number, status, invocation)
+        return status
+
+    try:
+        for number, invocation in read_invocations(stream, null):
+            token = None
+            while running:
+                room = jobserver.has_room(len(running), jobs)
+                if room:
+                    if server is None:
+                        break
+                    token = server.acquire()
+                    if token is not None:
+                        break
+                status = _wait(room)
+                failed = status not in (0, None) or failed
+
+            pid = fork_call(run_invocation, dispatcher, invocation, jobs)
+            running[pid] = (number, invocation)
+            if token is not None:
+                tokens[pid] = token
+
+        while running:
+            failed = _wait() not in (0, None) or failed
+    except KeyboardInterrupt:
+        # Children get the ^C too, collect them before leaving
+        while running:
+            _wait()
+        return 130
+    finally:
+        for token in tokens.itervalues():
+            server.release(token)
+
+    return 1 if failed else 0
@@ -0,0 +1,236 @@
+"""Compile and import every cmd ahead of time, for `otto check`.
+
+A broken cmd is otherwise only found when somebody runs it. Each cmd is
+checked the way CmdStore._load_cmd would load it:
+
+* its file compiles (through otto.loader, so this warms the bytecode cache and
+  the next run of the cmd doesn't compile it),
+* it imports,
+* it defines a class named cmd_name.capitalize() that directly subclasses
+  OttoCmd and implements run(),
+* run() accepts the cmd instance (its signature is reported as the cmd's usage)
+  and deps is a list of cmd names.
+
+Each cmd is checked in a child process, several at once, so that cmds can't
+interfere with each other or with otto, and a pack of hundreds of cmds takes
+about as long as its slowest import. Children's output goes to /dev/null. A
+child that dies (os._exit() or a crash in a C extension while importing, say)
+or takes longer than TIMEOUT is reported as an error for its cmd."""
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import marshal
+
+# Seconds a single cmd may take to check
+TIMEOUT = 60
+
+
+def _describe(e):
+    return "%s: %s" % (type(e).__name__, e)
+
+
+def usage(run):
+    """run()'s arguments after self, like `src [dest] [more...]`."""
+    import inspect
+    args, varargs, _, defaults = inspect.getargspec(run)
+    args = args[1:]
+    optional = len(defaults or ())
+    words = args[:len(args) - optional]
+    words.extend("[%s]" % arg for arg in args[len(args) - optional:])
+    if varargs:
+        words.append("[%s...]" % varargs)
+    return ' '.join(words)
+
+
+def check_cmd(job):
+    """Check one cmd, job is (pack_name, cmd_name, path). Returns a dict
+    with the cmd's name, path, errors and usage."""
+    import inspect
+    from otto.loader import import_cmd, load_code
+    from otto.utils import isOttoCmd
+
+    pack_name, cmd_name, path = job
+    result = {
+            'cmd': "%s:%s" % (pack_name, cmd_name),
+            'path': path,
+            'errors': [],
+            'usage': None,
+            }
+    errors = result['errors']
+
+    try:
+        load_code(path)
+    except SyntaxError as e:
+        errors.append("syntax error at line %s: %s" % (e.lineno, e.msg))
+        return result
+    except (IOError, OSError) as e:
+        errors.append(_describe(e))
+        return result
+
+    try:
+        module = import_cmd(pack_name, cmd_name, path)
+    except BaseException as e:
+        errors.append("import failed: %s" % _describe(e))
+        return result
+
+    class_name = cmd_name.capitalize()
+    cmd_class = getattr(module, class_name, None)
+    if cmd_class is None:
+        found = sorted(name for name, value in vars(module).iteritems()
+                if isOttoCmd(value))
+        errors.append("no class %s%s" % (
+            class_name, " (found %s)" % ', '.join(found) if found else ''))
+        return result
+    if not isOttoCmd(cmd_class):
+        errors.append("%s doesn't subclass OttoCmd" % class_name)
+        return result
+    if 'run' in getattr(cmd_class, '__abstractmethods__', ()):
+        errors.append("%s doesn't implement run()" % class_name)
+        return result
+
+    try:
+        args, varargs, _, _ = inspect.getargspec(cmd_class.run)
+    except TypeError:
+        errors.append("run isn't a method")
+        return result
+    if not args and not varargs:
+        errors.append("run() doesn't take self")
+    else:
+        result['usage'] = usage(cmd_class.run)
+
+    deps = cmd_class.deps
+    if not isinstance(deps, (list, tuple)) or \
+            not all(isinstance(dep, basestring) for dep in deps):
+        errors.append("deps isn't a list of cmd names")
+
+    return result
+
+
+def _init_worker():
+    # Ctrl-C is handled by the parent, which kills the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+
+
+def _failed(job, error):
+    pack_name, cmd_name, path = job
+    return {
+            'cmd': "%s:%s" % (pack_name, cmd_name),
+            'path': path,
+            'errors': [error],
+            'usage': None,
+            }
+
+
+def _start(job):
+    """Fork a worker to check job, returns (pid, fd its result is read from)."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            _init_worker()
+            data = marshal.dumps(check_cmd(job))
+            while data:
+                data = data[os.write(write_fd, data):]
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    return pid, read_fd
+
+
+def _finish(job, pid, data):
+    """The result of the worker that checked job, once its output has been
+    read."""
+    _, wait_status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(wait_status):
+        return _failed(job, "worker killed by signal %d" % os.WTERMSIG(wait_status))
+    if os.WEXITSTATUS(wait_status) or not data:
+        return _failed(job, "worker exited with status %d while importing" %
+                os.WEXITSTATUS(wait_status))
+    return marshal.loads(data)
+
+
+def _kill(pid):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    os.waitpid(pid, 0)
+
+
+def check_all(jobs, processes=None, timeout=TIMEOUT):
+    """check_cmd() each of jobs in a worker process, up to processes (one
+    per CPU by default) at once. Returns the results in the same order."""
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    if processes is None:
+        from multiprocessing import cpu_count
+        processes = cpu_count()
+    waiting = list(enumerate(jobs))
+    results = [None] * len(jobs)
+    # {fd: [index, pid, deadline, output so far]}
+    running = {}
+
+    sys.stdout.flush()
+    try:
+        while waiting or running:
+            while waiting and len(running) < processes:
+                index, job = waiting.pop(0)
+                pid, fd = _start(job)
+                running[fd] = [index, pid, time.time() + timeout, []]
+
+            wait = max(0, min(worker[2] for worker in running.itervalues()) - time.time())
+            try:
+                ready, _, _ = select.select(list(running), [], [], wait)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                ready = []
+
+            for fd in ready:
+                index, pid, _, output = running[fd]
+                data = os.read(fd, 65536)
+                if data:
+                    output.append(data)
+                    continue
+                del running[fd]
+                os.close(fd)
+                results[index] = _finish(jobs[index], pid, ''.join(output))
+
+            now = time.time()
+            for fd, (index, pid, deadline, _) in running.items():
+                if now >= deadline:
+                    del running[fd]
+                    os.close(fd)
+                    _kill(pid)
+                    results[index] = _failed(jobs[index],
+                            "timed out after %d seconds" % timeout)
+    finally:
+        for fd, (_, pid, _, _) in running.iteritems():
+            os.close(fd)
+            _kill(pid)
+    return results
+
+
+def check_store(store, names=()):
+    """check_all() the cmds in a CmdStore, apart from the base cmds. If names
+    are given, only the packs and cmds (cmd or pack:cmd) they name."""
+    jobs = []
+    for pack in sorted(store.cmds_by_pack):
+        if pack == 'base':
+            continue
+        for cmd_name, path in sorted(store.cmds_by_pack[pack].iteritems()):
+            if names and not set(names) & set(
+                    [pack, cmd_name, "%s:%s" % (pack, cmd_name)]):
+                continue
+            jobs.append((pack, cmd_name, path))
+    return check_all(jobs)
@@ -0,0 +1,157 @@
+"""Thin client for the otto daemon (see otto.daemon).
+
+This module is imported before anything else when OTTO_DAEMON is set, so it
+should stay as light as possible (hence _socket and ctypes rather than the
+socket and multiprocessing modules).
+
+The protocol over the Unix socket is:
+    * client -> server: a length prefixed marshal of (argv, cwd, environ)
+    * client -> server: the stdin, stdout and stderr file descriptors
+    * server -> client: the pid of the worker handling the request
+    * server -> client: the exit status of the request"""
+import os
+import marshal
+import signal
+import struct
+import _socket
+
+_INT = struct.Struct('!i')
+SOL_SOCKET = 1
+SCM_RIGHTS = 1
+
+
+def _fd_msghdr(fds):
+    """Build a struct msghdr carrying a single byte and an SCM_RIGHTS
+    control message for fds, returns (msghdr, keepalive)."""
+    import ctypes
+
+    class iovec(ctypes.Structure):
+        _fields_ = [
+                ('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t),
+                ]
+
+    class cmsghdr(ctypes.Structure):
+        _fields_ = [
+                ('cmsg_len', ctypes.c_size_t),
+                ('cmsg_level', ctypes.c_int),
+                ('cmsg_type', ctypes.c_int),
+                ('cmsg_data', ctypes.c_int * len(fds)),
+                ]
+
+    class msghdr(ctypes.Structure):
+        _fields_ = [
+                ('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint),
+                ('msg_iov', ctypes.POINTER(iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int),
+                ]
+
+    data = ctypes.create_string_buffer(1)
+    iov = iovec(ctypes.cast(data, ctypes.c_void_p), 1)
+    cmsg = cmsghdr(
+            cmsghdr.cmsg_data.offset + ctypes.sizeof(ctypes.c_int) * len(fds),
+            SOL_SOCKET,
+            SCM_RIGHTS,
+            (ctypes.c_int * len(fds))(*fds),
+            )
+    msg = msghdr(
+            None, 0,
+            ctypes.pointer(iov), 1,
+            ctypes.cast(ctypes.pointer(cmsg), ctypes.c_void_p),
+            ctypes.sizeof(cmsg),
+            0,
+            )
+    return msg, (data, iov, cmsg)
+
+
+def _libc():
+    import ctypes
+    return ctypes.CDLL(None, use_errno=True)
+
+
+def send_fds(sock, fds):
+    """Pass fds to the other end of a Unix socket."""
+    import ctypes
+    msg, _keepalive = _fd_msghdr(fds)
+    if _libc().sendmsg(sock.fileno(), ctypes.byref(msg), 0) < 0:
+        raise OSError(ctypes.get_errno(), "sendmsg failed")
+
+
+def recv_fds(sock, count):
+    """Receive count fds passed with send_fds."""
+    import ctypes
+    msg, keepalive = _fd_msghdr([-1] * count)
+    if _libc().recvmsg(sock.fileno(), ctypes.byref(msg), 0) <= 0:
+        raise EOFError("connection closed")
+
+    cmsg = keepalive[2]
+    if cmsg.cmsg_level != SOL_SOCKET or cmsg.cmsg_type != SCM_RIGHTS:
+        raise EOFError("no fds received")
+    return list(cmsg.cmsg_data)
+
+
+def recv_exactly(sock, size):
+    data = ''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError("connection closed")
+        data += chunk
+    return data
+
+
+def send_int(sock, value):
+    sock.sendall(_INT.pack(value))
+
+
+def recv_int(sock):
+    return _INT.unpack(recv_exactly(sock, _INT.size))[0]
+
+
+def send_msg(sock, obj):
+    payload = marshal.dumps(obj)
+    send_int(sock, len(payload))
+    sock.sendall(payload)
+
+
+def recv_msg(sock):
+    return marshal.loads(recv_exactly(sock, recv_int(sock)))
+
+
+def forward(socket_path, argv):
+    """Run argv on the server listening at socket_path.
+
+    Returns the exit status, or None if no server could be reached."""
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except _socket.error:
+        sock.close()
+        return None
+
+    try:
+        send_msg(sock, (list(argv), os.getcwd(), dict(os.environ)))
+        send_fds(sock, [0, 1, 2])
+        worker = recv_int(sock)
+    except (_socket.error, OSError, EOFError):
+        sock.close()
+        return None
+
+    # The worker has our stdio, but the terminal sends ^C to us
+    try:
+        while True:
+            try:
+                return recv_int(sock)
+            except KeyboardInterrupt:
+                try:
+                    os.kill(worker, signal.SIGINT)
+                except OSError:
+                    pass
+            except (_socket.error, EOFError):
+                return 1
+    finally:
+        sock.close()
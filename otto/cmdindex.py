@@ -0,0 +1,117 @@
+"""A persistent index of every pack's cmds.json.
+
+Reading each pack's CMDS_FILE (and checking each cmd file exists) on every
+invocation gets slow once a few hundred packs are installed. The CmdIndex
+keeps the cmds of every pack it has seen in a single file, along with the
+mtime and size of the CMDS_FILE they were read from. Only packs whose config
+has changed since it was indexed need to be read again."""
+import os
+import os.path
+import json
+
+INDEX_VERSION = 1
+
+
+def stat_sig(path):
+    """Returns an (mtime, size) pair for path, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime, st.st_size]
+
+
+class CmdIndex(object):
+    """Maps the absolute path of a CMDS_FILE to the cmds it contained when it
+    was last read."""
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}
+        self._dirty = False
+        self._read()
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as inp:
+                data = json.load(inp)
+        except (IOError, ValueError):
+            return
+
+        if isinstance(data, dict) and data.get('version') == INDEX_VERSION:
+            self._entries = data.get('packs', {})
+
+    def get(self, config_path):
+        """Returns {cmd_name: cmd_path} for config_path, or None if the index
+        doesn't have an up to date copy."""
+        config_path = os.path.abspath(config_path)
+        entry = self._entries.get(config_path)
+        if entry is None:
+            return None
+
+        if entry['sig'] != stat_sig(config_path):
+            return None
+
+        return entry['cmds']
+
+    def put(self, config_path, cmds):
+        """Record the cmds that were just read from config_path."""
+        config_path = os.path.abspath(config_path)
+        sig = stat_sig(config_path)
+        if sig is None:
+            return
+
+        self._entries[config_path] = {'sig': sig, 'cmds': cmds}
+        self._dirty = True
+
+    def discard(self, config_path):
+        if self._entries.pop(os.path.abspath(config_path), None) is not None:
+            self._dirty = True
+
+    def save(self):
+        """Write the index back to disk if anything changed."""
+        if not self._dirty:
+            return
+
+        # Forget packs that have been deleted since they were indexed
+        for config_path in self._entries.keys():
+            if not os.path.isfile(config_path):
+                del self._entries[config_path]
+
+        index_dir = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(index_dir):
+                os.makedirs(index_dir)
+
+            temp_path = "%s.%d.tmp" % (self.path, os.getpid())
+            with open(temp_path, 'w') as outp:
+                json.dump(
+                        {'version': INDEX_VERSION, 'packs': self._entries},
+                        outp,
+                        separators=(',', ':'),
+                        )
+            os.rename(temp_path, self.path)
+        except (IOError, OSError):
+            # The index is only a cache, failing to write it isn't fatal
+            return
+
+        self._dirty = False
+
+    def state(self):
+        """Fingerprints of this local dir's runs (see otto.incremental)."""
+        from otto.incremental import State
+        return State()
+
+
+def open_index():
+    """The SqliteIndex if `otto cache migrate` has created one (and sqlite3 is
+    available), otherwise the CmdIndex."""
+    from otto import INDEX_FILE, SQLITE_INDEX_FILE
+    if os.path.isfile(SQLITE_INDEX_FILE):
+        try:
+            import sqlite3
+        except ImportError:
+            pass
+        else:
+            from otto.sqliteindex import SqliteIndex
+            return SqliteIndex(SQLITE_INDEX_FILE)
+    return CmdIndex(INDEX_FILE)
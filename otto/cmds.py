@@ -1,9 +1,9 @@
 import os
 import os.path
-
-from lament import ConfigFile
+import sys
 
 from otto import *
+from otto.base import BASE_CMDS
 from otto.utils import *
 from otto.config import CmdsConfig
 
@@ -31,7 +31,7 @@ class %s(otto.OttoCmd):
 
         touch_pack(pack_name)
 
-        with ConfigFile(cmds_file, True) as local_cmds:
+        with config_file(cmds_file, True) as local_cmds:
             local_cmds['cmds'][cmd_name] = cmd_path
 
         # Create template for cmd
@@ -46,6 +46,7 @@ class %s(otto.OttoCmd):
         # Allow user to implement new cmd
         edit_file(cmd_path)
 
+    @in_config_session
     def run(self, *args):
         if not args:
             self.cmd_usage(['new_cmd_name', '[cmd_arg_1 ...]'])
@@ -85,6 +86,7 @@ class Edit(OttoCmd):
 class Mv(OttoCmd):
     """Move a cmd from one pack to an other."""
 
+    @in_config_session
     def run(self, src, dest):
         src_pack, src_cmd = cmd_split(src, default_pack='local')
         dest_pack, dest_cmd = cmd_split(dest, default_pack='local')
@@ -132,7 +134,7 @@ class Remember(OttoCmd):
             arg_d = {cmd_name: cmd_args}
 
             # Open local config
-            with ConfigFile(LOCAL_CONFIG, True) as config:
+            with config_file(LOCAL_CONFIG, True) as config:
                 config.update(
                         remember=arg_d
                         )
@@ -141,25 +143,27 @@ class Pack(OttoCmd):
     """Turn all local cmds into a package to be distributed/installed.
 
     The resulting .opack file and the pack it contains will get their name from the argument you provide:
-	$ otto pack pack_name"""
+	$ otto pack pack_name
 
-    def run(self, pack_name):
-        pack_path = os.path.basename(pack_name + PACK_EXT)
-        pack_root = './pack_root'
+    Packs are gzipped, to use bz2, xz (if Python has lzma) or no compression instead, optionally at a different level:
+	$ otto pack pack_name bz2 9"""
 
-        # Make copy of .otto/
-        info("Cloning local...")
-        clone_pack(LOCAL_DIR, 'local', pack_root, pack_name)
+    def run(self, pack_name, compression='gz', level=None):
+        from otto.packing import COMPRESSIONS, pack
+        pack_path = os.path.basename(pack_name + PACK_EXT)
 
-        info("Cleaning up a bit...")
-        shell(r'find %s -type f -name "*.pyc" -exec rm -f {} \;' % pack_root)
+        if not os.path.isdir(LOCAL_CMDS_DIR):
+            bail("There are no local cmds to pack")
+        if compression not in COMPRESSIONS or (level is not None and not level.isdigit()):
+            self.cmd_usage(['pack_name', '[%s [level]]' % '|'.join(sorted(COMPRESSIONS))])
 
-        # Tar up package
         info("Packing up...")
-        shell(r'tar -czf %s %s' % (pack_path, pack_root))
-
-        # Cleanup
-        rmtree(pack_root)
+        try:
+            pack(pack_path, LOCAL_CMDS_DIR, os.path.basename(pack_name),
+                    compression, None if level is None else int(level))
+        except ValueError as e:
+            bail(e)
+        info("Packed %s" % pack_path)
 
 class Install(OttoCmd):
     """Install any pack from a .opack.
@@ -169,42 +173,35 @@ class Install(OttoCmd):
 
     If the .opack contains multiple packs, it will ask you to choose which to install."""
 
+    @in_config_session
     def run(self, pack_path):
-        from shutil import copytree, rmtree
-        install_temp = os.path.join(GLOBAL_DIR, '_installing')
-
-        ensure_dir(install_temp)
-
-        # Untar pack
-        if os.path.isfile(pack_path):
-            shell(r'tar -xzf %s -C %s' % (
-                pack_path,
-                install_temp,
-                ))
-        else:
+        from otto.packing import install_pack
+        if not os.path.isfile(pack_path):
             bail("%s doesn't exist" % pack_path)
 
-        temp_dir = os.path.join(install_temp, 'pack_root')
-
-        # Copy pack info to global config
-        to_install = get_packs(temp_dir)
-        if len(to_install) > 1:
+        def choose(pack_names):
             d = Dialog("Which pack would you like to install")
-            pack_name = d.result
-        elif len(to_install) == 1:
-            pack_name = to_install.keys()[0]
-        else:
-            bail("No packs found in %s" % pack_path)
-        clone_pack(temp_dir, pack_name, GLOBAL_DIR)
+            d.choose(dict((name, name) for name in pack_names))
+            return d.key
 
-        # Clean up
-        rmtree(install_temp)
+        # Extract the pack into place
+        ensure_dir(CACHE_DIR)
+        try:
+            pack_name, dest = install_pack(pack_path, GLOBAL_DIR, choose, CACHE_DIR)
+        except ValueError as e:
+            bail(e)
+
+        # Add pack to global config
+        with config_file(GLOBAL_CONFIG, True) as config:
+            config.setdefault('packs', {})[pack_name] = dest
+        info("Installed %s" % pack_name)
 
 class Uninstall(OttoCmd):
     """Remove installed packages.
 
     This cmd takes no arguments and will guide you through the process interactively."""
 
+    @in_config_session
     def run(self, *args):
         from shutil import rmtree
         # Get list of installed packages
@@ -244,16 +241,31 @@ class Dr(OttoCmd):
         # Compare cmd name to file name w/o extention
         return cmd_name == file_name[:-3]
 
+    @staticmethod
+    def _pack_dirs(scan):
+        return dict((pack, path) for pack, (path, _) in scan.iteritems())
+
+    @in_config_session
     def run(self):
+        from otto.scanner import Journal, scan_all
         restore_global = os.path.isdir(GLOBAL_DIR)
         restore_local = os.path.isdir(LOCAL_DIR)
 
+        # Scan both trees at once, skipping files unchanged since last time
+        journal = Journal()
+        scans = scan_all(
+                [root for root in (GLOBAL_DIR, LOCAL_DIR) if os.path.isdir(root)],
+                journal
+                )
+        journal.save()
+
         if restore_global:
             info("Restoring global config files...")
-            packs = rebuild_root_config(GLOBAL_DIR)
+            scan = scans[GLOBAL_DIR]
+            packs = rebuild_root_config(GLOBAL_DIR, self._pack_dirs(scan))
 
             for pack, path in packs.iteritems():
-                cmds = rebuild_cmd_config(path)
+                cmds = rebuild_cmd_config(path, scan[pack][1])
 
                 # Rename any files that don't match up with OttoCmd
                 rename_files = {name: file_path
@@ -266,7 +278,7 @@ class Dr(OttoCmd):
 
                 # Update pack config with any changes
                 pack_cmds_config = os.path.join(pack_path(pack), CMDS_FILE)
-                with ConfigFile(pack_cmds_config) as config:
+                with config_file(pack_cmds_config) as config:
                     config['cmds'] = cmds
 
                 if cmds:
@@ -279,10 +291,11 @@ class Dr(OttoCmd):
 
         if restore_local:
             info("Restoring local config files...")
-            packs = rebuild_root_config(LOCAL_DIR)
+            scan = scans[LOCAL_DIR]
+            packs = rebuild_root_config(LOCAL_DIR, self._pack_dirs(scan))
 
             for pack, path in packs.iteritems():
-                cmds = rebuild_cmd_config(path)
+                cmds = rebuild_cmd_config(path, scan[pack][1])
 
                 # Rename any files that don't match up with OttoCmd
                 rename_files = {name: file_path
@@ -295,7 +308,7 @@ class Dr(OttoCmd):
 
                 # Update pack config with any changes
                 pack_cmds_config = os.path.join(pack_path(path), CMDS_FILE)
-                with ConfigFile(pack_cmds_config) as config:
+                with config_file(pack_cmds_config) as config:
                     config['cmds'] = cmds
 
                 if cmds:
@@ -311,4 +324,196 @@ class Dr(OttoCmd):
         else:
             info("Nothing to do!")
 
-BASE_CMDS = {z._name(): z for z in OttoCmd.__subclasses__()}
+class Cache(OttoCmd):
+    """Show or clear the artifact cache shared between checkouts.
+
+    Cmds that declare inputs and outputs have their outputs cached, to see how
+    often that saved running them:
+	$ otto cache
+
+    To empty it:
+	$ otto cache clear
+
+    To cache the index of every pack's cmds in an SQLite database rather than
+    a JSON file, faster with thousands of cmds (packs are still read from their
+    cmds.json, delete ~/.otto/_cache/index.db to switch back):
+	$ otto cache migrate"""
+
+    def run(self, *args):
+        from otto.artifacts import ArtifactCache
+        artifacts = self._store._artifacts or ArtifactCache()
+
+        if args == ('clear',):
+            artifacts.clear()
+            info("Artifact cache cleared")
+            return
+        elif args == ('migrate',):
+            self.migrate()
+            return
+        elif args:
+            self.cmd_usage(['[clear|migrate]'])
+
+        counters = artifacts.counters()
+        entries = artifacts.entries()
+        lookups = counters['hits'] + counters['misses']
+
+        info("Artifact cache (%s):" % artifacts.root)
+        bullets([
+            "%d entries, %.1f of %.1f MB" % (
+                len(entries),
+                sum(size for _, size, _ in entries) / 1048576.0,
+                artifacts.max_size / 1048576.0,
+                ),
+            "%d hits, %d misses (%d%% hit rate)" % (
+                counters['hits'],
+                counters['misses'],
+                100 * counters['hits'] // lookups if lookups else 0,
+                ),
+            "%d stored, %d evicted" % (counters['stores'], counters['evictions']),
+            ])
+
+    def migrate(self):
+        from otto.sqliteindex import SqliteIndex, migrate
+        index = SqliteIndex(SQLITE_INDEX_FILE)
+        packs, cmds = migrate(
+                index,
+                [GLOBAL_CONFIG, LOCAL_CONFIG],
+                [LOCAL_STATE],
+                )
+        info("Indexed %d packs (%d cmds) in %s" % (packs, cmds, index.path))
+
+class Watch(OttoCmd):
+    """Run a cmd again whenever the files it uses change.
+
+    The cmd's inputs are watched, or everything under the current directory if it doesn't declare any:
+	$ otto watch cmd_name arg
+
+    A burst of changes causes a single run, and a run that's still going when more changes arrive is cancelled. Stop watching with Ctrl-C."""
+
+    def run(self, *args):
+        from otto.watch import rerun, watcher
+
+        if not args:
+            self.cmd_usage(['cmd_name', '[arg ...]'])
+        name, cmd_args = args[0], args[1:]
+        remember = remembered()
+        if not cmd_args:
+            cmd_args = remember.get(name, [])
+
+        store = self._store
+        pack, cmd = store.lookup(name)
+        cmd_class = store._load_cmd(cmd, store.cmds_by_pack[pack][cmd], pack)
+
+        patterns = list(cmd_class.inputs) or [os.curdir]
+        ignore = list(cmd_class.outputs) + [os.path.relpath(LOCAL_DIR)]
+        files = watcher(patterns, ignore)
+
+        def _run():
+            # Lead a process group, so a cancelled run can be stopped along
+            # with anything it started
+            os.setpgid(0, 0)
+            return store.run_workflow(name, cmd_args, remember=remember)
+
+        def _report(status):
+            if status is None:
+                orange("Changed again, cancelled %s" % name)
+            elif status:
+                orange("%s failed (exit %d)" % (name, status))
+            info("Watching %s for changes..." % ', '.join(patterns))
+
+        try:
+            rerun(files, lambda: fork_call(_run), _report)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            files.close()
+
+class Stats(OttoCmd):
+    """How long cmds take to run, from the history of every run.
+
+    To see the slowest cmds:
+	$ otto stats
+
+    To only see some cmds:
+	$ otto stats cmd_name pack_name:cmd_name
+
+    Times are wall clock seconds, cpu includes any processes the cmd started. The trend compares the latest 20 runs with the 20 before them."""
+
+    limit = 20
+
+    def run(self, *names):
+        from time import strftime, localtime
+        from otto.history import read, summarise
+
+        summaries = summarise(read(HISTORY_FILE), set(names))
+        if not summaries:
+            info("No runs recorded yet")
+            return
+
+        ranked = sorted(summaries.itervalues(), key=lambda s: s.wall(0.9), reverse=True)
+        if not names:
+            ranked = ranked[:self.limit]
+
+        row = "%-24s %5s %5s %8s %8s %8s %8s %9s %7s  %s"
+        info(row % ('cmd', 'runs', 'fail', 'p50', 'p90', 'p99', 'cpu p50',
+            'max rss', 'trend', 'last run'))
+        for summary in ranked:
+            trend = summary.trend()
+            print row % (
+                    summary.name[:24],
+                    summary.runs,
+                    summary.failures,
+                    "%.2fs" % summary.wall(0.5),
+                    "%.2fs" % summary.wall(0.9),
+                    "%.2fs" % summary.wall(0.99),
+                    "%.2fs" % summary.cpu(0.5),
+                    "%.1fMB" % (summary.max_rss / 1024.0),
+                    '-' if trend is None else "%+d%%" % round(trend * 100),
+                    strftime('%Y-%m-%d %H:%M', localtime(summary.last)),
+                    )
+
+class Check(OttoCmd):
+    """Make sure every cmd can be loaded, without running any of them.
+
+    To check every installed and local cmd:
+	$ otto check
+
+    To only check some packs or cmds:
+	$ otto check pack_name pack_name:cmd_name
+
+    To print the results as JSON instead, for scripts and hooks, use check-json:
+	$ otto check-json pack_name
+
+    Exits with status 1 if any cmd is broken. The cmds are compiled into the bytecode cache as they're checked, so their next run starts faster."""
+
+    def run(self, *names):
+        from otto.check import check_store
+        results = check_store(self._store, names)
+        broken = [result for result in results if result['errors']]
+
+        for result in broken:
+            orange("%s (%s)" % (result['cmd'], result['path']))
+            bullets(result['errors'])
+        info("%d cmds checked, %d broken" % (len(results), len(broken)))
+
+        if broken:
+            sys.exit(1)
+
+class CheckJson(OttoCmd):
+    """Like `otto check`, printing the results as JSON:
+	$ otto check-json pack_name pack_name:cmd_name"""
+
+    @classmethod
+    def _name(cls):
+        return 'check-json'
+
+    def run(self, *names):
+        import json
+        from otto.check import check_store
+        results = check_store(self._store, names)
+        broken = [result for result in results if result['errors']]
+
+        print json.dumps({'ok': not broken, 'cmds': results}, indent=2, sort_keys=True)
+
+        if broken:
+            sys.exit(1)
@@ -5,69 +5,214 @@ variable names should be clarified and standardised:
 * pack, pack_name - the name of a collection of cmds.
 * name - Ambiguous, a cmd name (w/ or w/o pack name) in "[pack:]cmd" format.
 * ottocmd - OttoCmd instance.
-* cmd_ref - Ambiguous, either the path to a cmd file, or the cmd object itself.
+* cmd_ref - Ambiguous, either the path to a cmd file, a BaseCmd or the cmd
+  object itself.
 * pack_keys - a set of pack names.
 * cmds_by_pack - {pack_name : {cmd_name: cmd_ref}}
+* owners - {cmd_name: pack_name}, the pack a bare cmd name resolves to.
 """
 import os.path
-import imp
+import sys
+import json
+from types import GeneratorType
 from otto import LOCAL_CMDS_DIR, CMDS_FILE
-from otto.utils import info, bail, isOttoCmd, cmd_split, orange
-from lament import ConfigFile
+from otto.base import BaseCmd
+from otto.loader import import_cmd
+from otto.utils import info, bail, isOttoCmd, cmd_split, orange, fork_call
+
+
+# Which pack wins when a cmd name is found in more than one
+PRECEDENCE = {'base': 0, 'local': 2}
+INSTALLED_PRECEDENCE = 1
+FS_ENCODING = sys.getfilesystemencoding() or 'utf-8'
+
+
+class PackMap(dict):
+    """cmds_by_pack, keeps count of how often packs are added or removed so
+    the CmdStore knows when to rebuild its owners index."""
+    def __init__(self, *args, **kwargs):
+        super(PackMap, self).__init__(*args, **kwargs)
+        self.version = 0
+
+    def _changed(self):
+        self.version += 1
+
+    def __setitem__(self, key, value):
+        super(PackMap, self).__setitem__(key, value)
+        self._changed()
+
+    def __delitem__(self, key):
+        super(PackMap, self).__delitem__(key)
+        self._changed()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, *args):
+        self._changed()
+        return super(PackMap, self).pop(*args)
+
+    def popitem(self):
+        self._changed()
+        return super(PackMap, self).popitem()
+
+    def update(self, *args, **kwargs):
+        super(PackMap, self).update(*args, **kwargs)
+        self._changed()
+
+    def clear(self):
+        super(PackMap, self).clear()
+        self._changed()
+
+
+def _compact(name):
+    """Store names and paths as interned byte strings rather than the unicode
+    JSON hands us, which takes a quarter of the memory at 100k cmds."""
+    if isinstance(name, unicode):
+        name = name.encode(FS_ENCODING)
+    return intern(name)
 
 
 class CmdStore(object):
     """The CmdStore is a record of all cmds currently available to the user."""
     def __init__(self):
         self.pack_keys = set()
-        self.cmds_by_pack = {}
+        self.cmds_by_pack = PackMap()
         self._pack_dirs = {}
+        self._index = None
+        self._owners = {}
+        self._owners_version = None
+        self._artifacts = None
+
+        # Run cmds even if their inputs are unchanged
+        self.force = False
 
     def init_base(self, default_cmds=None):
         """Loads the base cmds."""
         self.pack_keys = set(['base'])
         self.cmds_by_pack['base'] = default_cmds
 
+    def init_index(self, index):
+        """Use a CmdIndex (or SqliteIndex) to avoid re-reading unchanged packs."""
+        self._index = index
+
+    def init_artifacts(self, artifacts):
+        """Use an ArtifactCache to restore the outputs of cmds that have
+        already been run elsewhere."""
+        self._artifacts = artifacts
+
+    def save_index(self):
+        if self._index is not None:
+            self._index.save()
+
     def load_pack(self, pack_name, pack_dir):
+        config_path = os.path.join(pack_dir, CMDS_FILE)
         try:
-            config_path = os.path.join(pack_dir, CMDS_FILE)
-            with ConfigFile(config_path) as config:
-                if 'cmds' in config:
-                    for name, path in config['cmds'].iteritems():
-                        self._add_cmd(
-                                pack_name,
-                                name,
-                                path
-                                )
+            cmds = None
+            if self._index is not None:
+                cmds = self._index.get(config_path)
+
+            if cmds is None:
+                cmds = self._read_pack(config_path)
+                if self._index is not None:
+                    self._index.put(config_path, cmds)
+
+            for name, path in cmds.iteritems():
+                self._add_cmd(pack_name, name, path, check=False)
 
         except Exception:
+            if self._index is not None:
+                self._index.discard(config_path)
             orange("WARNING: %s may be corrupt, please run `otto dr`" % config_path)
         else:
             self._pack_dirs[pack_name] = pack_dir
 
-    def _add_cmd(self, pack_name, cmd_name, cmd_path):
-        assert os.path.isfile(cmd_path)
+    @staticmethod
+    def _read_pack(config_path):
+        """Read and validate the cmds listed in a pack's CMDS_FILE."""
+        pack_dir = os.path.dirname(config_path) or '.'
+        if os.path.isdir(pack_dir) and not os.path.exists(config_path):
+            return {}
+
+        with open(config_path, 'r') as inp:
+            cmds = json.load(inp).get('cmds', {})
+
+        for path in cmds.itervalues():
+            assert os.path.isfile(path)
+
+        return cmds
+
+    def _add_cmd(self, pack_name, cmd_name, cmd_path, check=True):
+        if check:
+            assert os.path.isfile(cmd_path)
+        pack_name = _compact(pack_name)
         self.pack_keys.add(pack_name)
         cmd_refs = self.cmds_by_pack.setdefault(pack_name, {})
-        cmd_refs[cmd_name] = cmd_path
+        cmd_refs[_compact(cmd_name)] = _compact(cmd_path)
+        self.cmds_by_pack.version += 1
+
+    def owners(self):
+        """Returns {cmd_name: pack_name}, rebuilt only when packs or cmds have
+        been added since it was last needed.
+
+        Local cmds take precedence over installed cmds, which take precedence
+        over base cmds. Ties between installed packs go to the pack whose name
+        sorts first."""
+        if self._owners_version != self.cmds_by_pack.version:
+            def _rank(pack):
+                return PRECEDENCE.get(pack, INSTALLED_PRECEDENCE)
 
-    def _load_cmd(self, cmd_name, cmd_ref):
+            # Assign lowest precedence first so that higher ones overwrite it
+            order = sorted(self.cmds_by_pack, reverse=True)
+            order.sort(key=_rank)
+
+            owners = {}
+            for pack in order:
+                owners.update(dict.fromkeys(self.cmds_by_pack[pack] or (), pack))
+
+            self._owners = owners
+            self._owners_version = self.cmds_by_pack.version
+
+        return self._owners
+
+    def _load_cmd(self, cmd_name, cmd_ref, pack_name=None):
         """Because some cmds are stored in the cache as either a class or as a
         path to the .py file, this method is needed to disambiguate.
 
         Given the following arguments:
             cmd_name: The name of the cmd.
-            cmd_ref: Either the OttoCmd object or the path to it's file.
+            cmd_ref: Either the OttoCmd object, a BaseCmd or the path to it's file.
+            pack_name: The pack the cmd belongs to (defaults to the name of
+                the directory containing it).
 
         This method will always return the corresponding OttoCmd class."""
 
-        # Base cmds are already loaded
+        # Base cmds are already loaded...
         if isOttoCmd(cmd_ref):
             return cmd_ref
 
+        # ... or are imported on demand
+        if isinstance(cmd_ref, BaseCmd):
+            return cmd_ref.load()
+
         # Otherwise, import and return OttoCmd subclass
+        if pack_name is None:
+            pack_name = os.path.basename(os.path.dirname(cmd_ref))
+
+        # Packs loaded from the index weren't checked for missing cmd files,
+        # have the pack re-read next time so `otto dr` is suggested up front
+        if not os.path.isfile(cmd_ref):
+            pack_dir = self._pack_dirs.get(pack_name)
+            if self._index is not None and pack_dir is not None:
+                self._index.discard(os.path.join(pack_dir, CMDS_FILE))
+                self.save_index()
+            bail("'%s' is missing (%s), please run `otto dr`" % (cmd_name, cmd_ref))
+
         try:
-            cmd_module = imp.load_source(
+            cmd_module = import_cmd(
+                    pack_name,
                     cmd_name,
                     cmd_ref
                     )
@@ -84,6 +229,15 @@ class CmdStore(object):
         except Exception as e:
             raise e
 
+    def warm(self):
+        """Import every installed cmd ahead of time, skipping broken ones."""
+        for pack in self.installed_packs():
+            for cmd_name, cmd_ref in self.cmds_by_pack[pack].iteritems():
+                try:
+                    self._load_cmd(cmd_name, cmd_ref, pack)
+                except (Exception, SystemExit):
+                    pass
+
     def list_cmds(self, pack=None):
         def _print_pack_contents(pack):
             if pack in self.pack_keys:
@@ -105,9 +259,85 @@ class CmdStore(object):
         pack_name, cmd_name = self.lookup(name)
         cmd_ref = self.cmds_by_pack[pack_name][cmd_name]
 
-        # Init and run
-        ottocmd = self._load_cmd(cmd_name, cmd_ref)(self)
-        ottocmd.run(*args, **kwargs)
+        cmd_class = self._load_cmd(cmd_name, cmd_ref, pack_name)
+        if not cmd_class.inputs:
+            self._call(cmd_class, args, kwargs)
+            return
+
+        # Skip cmds whose inputs haven't changed since they last succeeded
+        from otto.incremental import State, fingerprint, outputs_exist
+        full_name = "%s:%s" % (pack_name, cmd_name)
+        module = sys.modules.get(cmd_class.__module__)
+        state = self._index.state() if self._index is not None else State()
+        last_digest, known = state.get(full_name)
+        digest, files = fingerprint(
+                cmd_class,
+                args,
+                getattr(module, '__file__', None),
+                known
+                )
+
+        if digest == last_digest and not self.force and outputs_exist(cmd_class):
+            info("%s is up to date" % full_name)
+            return
+
+        # Another checkout may have already run it with the same fingerprint
+        artifacts = self._artifacts if cmd_class.outputs else None
+        if artifacts is not None:
+            key = artifacts.key(full_name, digest)
+            if not self.force and artifacts.restore(key, cmd_class.outputs):
+                info("%s restored from the artifact cache" % full_name)
+                state.put(full_name, digest, files)
+                return
+            artifacts.detach(cmd_class.outputs)
+
+        self._call(cmd_class, args, kwargs)
+        state.put(full_name, digest, files)
+        if artifacts is not None:
+            artifacts.store(key, cmd_class.outputs)
+
+    def _call(self, cmd_class, args, kwargs):
+        result = cmd_class(self).run(*args, **kwargs)
+
+        # run() may be a coroutine that yields shell tasks (see otto.tasks)
+        if isinstance(result, GeneratorType):
+            from otto.tasks import drive
+            drive(result)
+
+    def run_workflow(self, name, args=(), jobs=1, remember=None):
+        """Run a cmd after everything it depends on (see otto.scheduler).
+
+        Independent deps run in parallel, up to jobs at a time. Deps are run
+        with the args remembered for them, if any. Returns an exit status,
+        non-zero if a dep failed (in which case name isn't run)."""
+        from otto.scheduler import CANCELLED, Scheduler, node_name, resolve
+
+        root, deps = resolve(self, name)
+        upstream = dict((node, d) for node, d in deps.iteritems() if node != root)
+
+        if upstream:
+            remember = remember or {}
+
+            def _start(node):
+                dep_args = remember.get(node_name(node), remember.get(node[1], []))
+                info("Running %s..." % node_name(node))
+                return fork_call(self.run, node_name(node), *dep_args)
+
+            statuses = Scheduler(upstream, jobs).run(_start)
+
+            failed = [node for node, status in sorted(statuses.iteritems())
+                    if status != 0]
+            if failed:
+                for node in failed:
+                    if statuses[node] == CANCELLED:
+                        orange("Cancelled %s" % node_name(node))
+                    else:
+                        orange("%s failed (exit %d)" % (
+                            node_name(node), statuses[node]))
+                return max(statuses[node] for node in failed) or 1
+
+        self.run(name, *args)
+        return 0
 
     def installed_packs(self):
         """Returns a set of available pack names, excluding base and local."""
@@ -115,19 +345,7 @@ class CmdStore(object):
 
     def find_pack(self, cmd):
         """Given a cmd, determine which pack it belongs to."""
-        # Local cmds take presidence
-        if 'local' in self.cmds_by_pack:
-            if cmd in self.cmds_by_pack['local']:
-                return 'local'
-
-        # Then check installed cmds
-        for pack in self.installed_packs():
-            if cmd in self.cmds_by_pack[pack]:
-                return pack
-
-        # Default to base cmds if able
-        if cmd in self.cmds_by_pack['base']:
-            return 'base'
+        return self.owners().get(cmd)
 
     def lookup(self, name):
         """Given a name, determine the best possible pack and cmd."""
@@ -144,9 +362,7 @@ class CmdStore(object):
     def docs(self, name):
         # Find OttoCmd class
         pack, cmd = self.lookup(name)
-        ottocmd = self.cmds_by_pack[pack][cmd]
-        if isinstance(ottocmd, unicode):
-            ottocmd = self._load_cmd(cmd, ottocmd)
+        ottocmd = self._load_cmd(cmd, self.cmds_by_pack[pack][cmd], pack)
 
         docs = ottocmd.__doc__
         if docs is None:
@@ -0,0 +1,228 @@
+"""Shell completion for `otto [pack:]cmd [arg ...]`.
+
+`otto --complete WORD ...` is called by the bash/zsh completion scripts in
+res/ with the words typed so far (the last one is the word being completed).
+Completion has to be instant, so this module never imports lament, the
+CmdStore or any cmd module. Cmd names are answered from a prefix trie that is
+cached in CACHE_DIR along with the stat signature of every config file it was
+built from, so it's only rebuilt when packs change.
+
+The trie is path compressed (a radix tree) to keep the cache small and quick
+to unmarshal: each node is a dict, {label: subtrie}, where no two labels share
+a first character and END marks the end of a word."""
+import os
+import os.path
+import json
+import marshal
+import zlib
+
+from otto import (
+        CACHE_DIR, CMDS_FILE, GLOBAL_CONFIG, LOCAL_CONFIG, LOCAL_DIR,
+        )
+
+CACHE_VERSION = 1
+END = '\0'
+OPTIONS = ['-l', '-d', '-V', '-j', '-0', '--no-tone', '--force', '--batch', '--serve']
+
+
+class Trie(object):
+    def __init__(self, root=None):
+        self.root = root if root is not None else {}
+
+    def add(self, word):
+        node = self.root
+        while word:
+            for label, child in node.items():
+                if label == END or label[0] != word[0]:
+                    continue
+
+                # Length of the common prefix of label and word
+                common = 1
+                limit = min(len(label), len(word))
+                while common < limit and label[common] == word[common]:
+                    common += 1
+
+                if common < len(label):
+                    # Split the edge
+                    del node[label]
+                    child = node[label[:common]] = {label[common:]: child}
+
+                node = child
+                word = word[common:]
+                break
+            else:
+                node = node.setdefault(word, {})
+                word = ''
+
+        node[END] = True
+
+    def complete(self, prefix):
+        """Returns every word starting with prefix, sorted."""
+        node = self.root
+        word = ''
+        while prefix:
+            for label, child in node.iteritems():
+                if label == END or label[0] != prefix[0]:
+                    continue
+
+                if label.startswith(prefix):
+                    word += label
+                    prefix = ''
+                elif prefix.startswith(label):
+                    word += label
+                    prefix = prefix[len(label):]
+                else:
+                    return []
+                node = child
+                break
+            else:
+                return []
+
+        words = []
+        stack = [(word, node)]
+        while stack:
+            word, node = stack.pop()
+            for label, child in node.iteritems():
+                if label == END:
+                    words.append(word)
+                else:
+                    stack.append((word + label, child))
+        return sorted(words)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as inp:
+            return json.load(inp)
+    except (IOError, ValueError):
+        return {}
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+def _configs():
+    return [_read_json(GLOBAL_CONFIG), _read_json(LOCAL_CONFIG)]
+
+
+def _pack_dirs(configs):
+    packs = {}
+    for config in configs:
+        packs.update(config.get('packs', {}))
+    return packs
+
+
+def signature(configs):
+    """Stat every file the completions depend on."""
+    sig = [_stat(GLOBAL_CONFIG), _stat(LOCAL_CONFIG)]
+    for pack, pack_dir in sorted(_pack_dirs(configs).iteritems()):
+        sig.append((pack, _stat(os.path.join(pack_dir, CMDS_FILE))))
+    return sig
+
+
+def build(configs):
+    """Build the trie of cmd names and the remembered args from scratch."""
+    from otto.base import BASE_CMDS
+    from otto.cmdindex import open_index
+
+    trie = Trie()
+    for cmd in BASE_CMDS:
+        trie.add(cmd)
+        trie.add('base:%s' % cmd)
+
+    index = open_index()
+    for pack, pack_dir in _pack_dirs(configs).iteritems():
+        config_path = os.path.join(pack_dir, CMDS_FILE)
+        cmds = index.get(config_path)
+        if cmds is None:
+            cmds = _read_json(config_path).get('cmds', {})
+
+        for cmd in cmds:
+            # Byte strings marshal faster and smaller than JSON's unicode
+            cmd = cmd.encode('utf-8')
+            trie.add(cmd)
+            trie.add('%s:%s' % (pack.encode('utf-8'), cmd))
+
+    remember = {}
+    for config in configs:
+        remember.update(config.get('remember', {}))
+
+    return trie, remember
+
+
+def cache_path():
+    """Completions depend on ./.otto, so there's a cache per local dir."""
+    key = "%08x" % (zlib.crc32(LOCAL_DIR) & 0xffffffff)
+    return os.path.join(CACHE_DIR, 'complete', key)
+
+
+def load():
+    """Returns (trie, remember), from the cache if it's still valid."""
+    configs = _configs()
+    sig = signature(configs)
+    path = cache_path()
+
+    try:
+        with open(path, 'rb') as inp:
+            cached = marshal.load(inp)
+        if (cached['version'] == CACHE_VERSION and
+                cached['local_dir'] == LOCAL_DIR and cached['sig'] == sig):
+            return Trie(cached['trie']), cached['remember']
+    except (IOError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    trie, remember = build(configs)
+
+    try:
+        cache_dir = os.path.dirname(path)
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, 'wb') as outp:
+            marshal.dump({
+                'version': CACHE_VERSION,
+                'local_dir': LOCAL_DIR,
+                'sig': sig,
+                'trie': trie.root,
+                'remember': remember,
+                }, outp)
+        os.rename(temp_path, path)
+    except (IOError, OSError, ValueError):
+        pass
+
+    return trie, remember
+
+
+def candidates(words):
+    """Given the words typed after `otto`, the last of which is incomplete,
+    returns the possible completions of the last word."""
+    words = list(words) or ['']
+    prefix = words[-1]
+    typed = [word for word in words[:-1] if not word.startswith('-')]
+
+    # Completing an option
+    if prefix.startswith('-'):
+        return [opt for opt in OPTIONS if opt.startswith(prefix)]
+
+    trie, remember = load()
+
+    # Completing a cmd name
+    if not typed:
+        return trie.complete(prefix)
+
+    # Completing a cmd's args, suggest the ones it remembers
+    args = remember.get(typed[0], [])
+    position = len(typed) - 1
+    if position < len(args) and args[position].startswith(prefix):
+        return [args[position]]
+    return []
+
+
+def complete(words):
+    for candidate in candidates(words):
+        print candidate
@@ -1,3 +1,4 @@
+import json
 from otto.cmdstore import CmdStore
 from lament import *
 
@@ -9,6 +10,15 @@ class CmdsConfig(LamentConfig):
 
 
 class OttoConfig(LamentConfig):
+    def update_from_file(self, file_path):
+        """Like LamentConfig.update_from_file, but never writes file_path back
+        to disk (which would also invalidate the CmdIndex)."""
+        try:
+            with open(file_path, 'r') as inp:
+                self.update(**json.load(inp))
+        except Exception:
+            pass
+
     @config('packs', CmdStore)
     def packs(self, config, obj):
         for key, val in obj.iteritems():
@@ -26,4 +36,9 @@ class OttoConfig(LamentConfig):
 
     @config('tone', str)
     def tone(self, config, obj):
+        # "tone": false in a local config turns it off for that project
+        return obj or ''
+
+    @config('artifact_cache_mb', int)
+    def artifact_cache_mb(self, config, obj):
         return obj
@@ -0,0 +1,222 @@
+"""A resident otto server.
+
+Starting the interpreter and building an OttoDispatcher dominates the run
+time of short cmds. `otto --serve` keeps a dispatcher with the global config,
+the CmdStore and the global packs' cmd classes loaded, then forks a worker for
+each request it receives from otto.client. Each worker takes over the client's
+cwd, environment and stdio, loads ./.otto and runs the request.
+
+The warm state is thrown away and rebuilt whenever the global config or a
+pack's CMDS_FILE changes, which is checked on every request, or one of its
+cmd files does, which is checked at most every CMDS_CHECK seconds. That only
+costs the warm import: a worker re-imports the cmd it runs if its file has
+changed anyway (see otto.loader.import_cmd)."""
+import os
+import os.path
+import sys
+import errno
+import signal
+import socket
+import time
+import traceback
+
+import otto
+from otto.client import send_int, recv_msg, recv_fds
+from otto.utils import info, ensure_dir, exit_status
+
+LOCAL_NAMES = ('LOCAL_DIR', 'LOCAL_CONFIG', 'LOCAL_CMDS_DIR', 'LOCAL_STATE')
+
+# Seconds between checks of every warm cmd file, stat()ing them all on each
+# request costs more than the fork at a few thousand cmds
+CMDS_CHECK = 5.0
+
+
+def relocate(cwd):
+    """Point the LOCAL_* paths at cwd/.otto in every module that has imported
+    them (they're computed from the cwd at import time)."""
+    new_dir = os.path.join(cwd, '.otto')
+    new_paths = {
+            'LOCAL_DIR': new_dir,
+            'LOCAL_CONFIG': os.path.join(new_dir, otto.ROOT_FILE),
+            'LOCAL_CMDS_DIR': os.path.join(new_dir, 'local'),
+            'LOCAL_STATE': os.path.join(new_dir, 'state'),
+            }
+    old_paths = dict((name, getattr(otto, name)) for name in LOCAL_NAMES)
+
+    for module in sys.modules.values():
+        if module is None:
+            continue
+        for name in LOCAL_NAMES:
+            if getattr(module, name, None) == old_paths[name]:
+                setattr(module, name, new_paths[name])
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+def config_signature(store):
+    """Stat the config files the warm state was built from."""
+    sig = [_stat(otto.GLOBAL_CONFIG)]
+    for pack, pack_dir in sorted(store.export().iteritems()):
+        sig.append(_stat(os.path.join(pack_dir, otto.CMDS_FILE)))
+    return sig
+
+
+def cmds_signature(store):
+    """Stat every cmd file the warm state imported."""
+    sig = []
+    for pack in sorted(store.export()):
+        for cmd_path in sorted(store.cmds_by_pack.get(pack, {}).itervalues()):
+            sig.append(_stat(cmd_path))
+    return sig
+
+
+class OttoServer(object):
+    def __init__(self, socket_path, dispatcher_cls, main):
+        self.socket_path = socket_path
+        self.dispatcher_cls = dispatcher_cls
+        self.main = main
+        self.dispatcher = None
+        self._config_signature = None
+        self._cmds_signature = None
+        self._cmds_checked = None
+        self._workers = set()
+
+    def warm(self):
+        """(Re)build the dispatcher and import every cmd it knows about."""
+        import otto.cmds
+
+        self.dispatcher = self.dispatcher_cls(local=False)
+        store = self.dispatcher.config.packs
+        store.warm()
+        self._config_signature = config_signature(store)
+        self._cmds_signature = cmds_signature(store)
+        self._cmds_checked = time.time()
+
+    def is_stale(self):
+        """Whether the warm state is out of date. Cmd files are only checked
+        if they haven't been for CMDS_CHECK seconds."""
+        store = self.dispatcher.config.packs
+        if config_signature(store) != self._config_signature:
+            return True
+
+        now = time.time()
+        if now - self._cmds_checked < CMDS_CHECK:
+            return False
+        self._cmds_checked = now
+        return cmds_signature(store) != self._cmds_signature
+
+    def _listen(self):
+        ensure_dir(os.path.dirname(self.socket_path))
+
+        # Take over from a dead server, but not a live one
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except socket.error:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        else:
+            probe.close()
+            raise Exception("otto server already running on %s" % self.socket_path)
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        os.chmod(self.socket_path, 0600)
+        sock.listen(64)
+        sock.settimeout(1.0)
+        return sock
+
+    def _reap(self):
+        for pid in list(self._workers):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except OSError as e:
+                if e.errno != errno.ECHILD:
+                    raise
+                done = pid
+            if done:
+                self._workers.discard(pid)
+
+    @staticmethod
+    def _stop(signum, frame):
+        raise SystemExit()
+
+    def serve(self):
+        self.warm()
+        sock = self._listen()
+        signal.signal(signal.SIGTERM, self._stop)
+        info("otto server listening on %s" % self.socket_path)
+
+        try:
+            while True:
+                self._reap()
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+
+                if self.is_stale():
+                    self.warm()
+
+                # Make sure children don't inherit anything half written
+                sys.stdout.flush()
+                sys.stderr.flush()
+
+                pid = os.fork()
+                if pid == 0:
+                    sock.close()
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    signal.signal(signal.SIGINT, signal.default_int_handler)
+                    self._work(conn)
+                else:
+                    conn.close()
+                    self._workers.add(pid)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def _work(self, conn):
+        """Handle a single request, runs in a forked worker and never returns."""
+        status = 1
+        try:
+            conn.settimeout(None)
+            argv, cwd, env = recv_msg(conn)
+            fds = recv_fds(conn, 3)
+            send_int(conn, os.getpid())
+
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+
+            os.chdir(cwd)
+            os.environ.clear()
+            os.environ.update(env)
+            relocate(cwd)
+
+            try:
+                self.dispatcher.load_local()
+                self.main(argv, self.dispatcher)
+                status = 0
+            except SystemExit as e:
+                status = exit_status(e)
+            except KeyboardInterrupt:
+                status = 130
+            except Exception:
+                traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                send_int(conn, status)
+            except Exception:
+                pass
+            os._exit(0)
@@ -0,0 +1,187 @@
+"""A log of every cmd run, used by `otto stats`.
+
+Each run appends one tab separated line to HISTORY_FILE:
+    time pack cmd args_hash wall_secs cpu_secs max_rss_kb status
+
+Lines are short enough to be written atomically with O_APPEND, so concurrent
+runs don't need to coordinate. Once the log is bigger than MAX_SIZE it's
+rotated to HISTORY_FILE.1 (replacing the previous one), which caps the space
+it takes at twice that while keeping a few months of history. Rotating is done
+under otto.locking's lock on the log's directory, so runs finishing together
+don't both rotate and lose the first one's HISTORY_FILE.1.
+
+The log is read a line at a time, nothing needs to fit in memory apart from
+the run times of the cmds being summarised."""
+import os
+import time
+import zlib
+import resource
+from collections import namedtuple
+
+from otto import HISTORY_FILE
+
+MAX_SIZE = 4 << 20
+
+Run = namedtuple('Run', 'time pack cmd args_hash wall cpu max_rss status')
+
+
+def args_hash(args):
+    return "%08x" % (zlib.crc32('\0'.join(
+        arg.encode('utf-8') if isinstance(arg, unicode) else arg
+        for arg in args)) & 0xffffffff)
+
+
+def _usage():
+    """(cpu secs, max rss) of this process and its (waited for) children."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, max(usage.ru_maxrss, children.ru_maxrss)
+
+
+class Timer(object):
+    """Measures a run from when it's created until record() is called."""
+    def __init__(self, path=None):
+        self.path = path or HISTORY_FILE
+        self.start = time.time()
+        self.start_cpu, _ = _usage()
+
+    def record(self, pack, cmd, args, status):
+        cpu, max_rss = _usage()
+        line = "%d\t%s\t%s\t%s\t%.3f\t%.3f\t%d\t%d\n" % (
+                self.start,
+                pack,
+                cmd,
+                args_hash(args),
+                time.time() - self.start,
+                cpu - self.start_cpu,
+                max_rss,
+                status,
+                )
+        append(self.path, line)
+
+
+def append(path, line):
+    """Append line to the log, rotating it if it's grown too big. History
+    is best effort, failures are ignored."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        try:
+            os.write(fd, line)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+        if size > MAX_SIZE:
+            rotate(path)
+    except (IOError, OSError):
+        pass
+
+
+def rotate(path):
+    """Move the log to path.1 if it's bigger than MAX_SIZE. Other runs may
+    have seen it grow too, the size is checked again under the lock so only
+    the first of them rotates it."""
+    from otto.locking import locked
+    with locked(os.path.dirname(os.path.abspath(path))):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        if size > MAX_SIZE:
+            os.rename(path, path + '.1')
+
+
+def read(path=None):
+    """Yields a Run for each line in the log, oldest first."""
+    path = path or HISTORY_FILE
+    for log_path in (path + '.1', path):
+        try:
+            log = open(log_path, 'r')
+        except IOError:
+            continue
+
+        with log:
+            for line in log:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != len(Run._fields):
+                    # Torn by a crash, skip it
+                    continue
+                try:
+                    yield Run(
+                            int(fields[0]),
+                            fields[1],
+                            fields[2],
+                            fields[3],
+                            float(fields[4]),
+                            float(fields[5]),
+                            int(fields[6]),
+                            int(fields[7]),
+                            )
+                except ValueError:
+                    continue
+
+
+def percentile(values, fraction):
+    """Nearest rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+class Summary(object):
+    """Statistics for the runs of one cmd."""
+    # How many recent runs are compared with the runs before them for trend
+    TREND_RUNS = 20
+
+    def __init__(self, name):
+        self.name = name
+        self.walls = []
+        self.cpus = []
+        self.max_rss = 0
+        self.failures = 0
+        self.last = 0
+
+    def add(self, run):
+        self.walls.append(run.wall)
+        self.cpus.append(run.cpu)
+        self.max_rss = max(self.max_rss, run.max_rss)
+        self.failures += run.status != 0
+        self.last = max(self.last, run.time)
+
+    @property
+    def runs(self):
+        return len(self.walls)
+
+    def wall(self, fraction):
+        return percentile(sorted(self.walls), fraction)
+
+    def cpu(self, fraction):
+        return percentile(sorted(self.cpus), fraction)
+
+    def trend(self):
+        """How much slower (as a fraction) the median of the latest runs is
+        than the median of the runs before them, None without enough runs."""
+        recent = self.walls[-self.TREND_RUNS:]
+        before = self.walls[-2 * self.TREND_RUNS:-self.TREND_RUNS]
+        if len(before) < self.TREND_RUNS // 2:
+            return None
+        baseline = percentile(sorted(before), 0.5)
+        if not baseline:
+            return None
+        return percentile(sorted(recent), 0.5) / baseline - 1
+
+
+def summarise(runs, names=None):
+    """Returns {"pack:cmd": Summary} for runs, only for names if given."""
+    summaries = {}
+    for run in runs:
+        name = "%s:%s" % (run.pack, run.cmd)
+        if names and name not in names and run.cmd not in names:
+            continue
+        summary = summaries.get(name)
+        if summary is None:
+            summary = summaries[name] = Summary(name)
+        summary.add(run)
+    return summaries
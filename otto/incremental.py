@@ -0,0 +1,138 @@
+"""Skip cmds whose inputs haven't changed since they last succeeded.
+
+An OttoCmd can declare `inputs`, glob patterns relative to the current
+directory (a directory that matches stands for every file beneath it), and
+`outputs`, the paths it creates. After such a cmd succeeds a fingerprint of its
+inputs, args and source is saved in LOCAL_STATE. When it's next run with the
+same fingerprint, and all of its outputs still exist, run() is skipped.
+
+Reading every input on every run would cost more than most cmds save, so the
+digest of each file is stored along with its mtime and size and only files
+whose stat has changed are read again."""
+import os
+import os.path
+import glob
+import time
+import marshal
+from hashlib import sha1
+
+from otto import LOCAL_STATE
+
+STATE_VERSION = 1
+
+# Files modified this recently may change again without their mtime moving
+RACY_WINDOW = 2
+
+
+def expand(patterns):
+    """Returns the sorted paths of every file matched by patterns."""
+    paths = set()
+    for pattern in patterns:
+        for match in glob.glob(pattern):
+            if os.path.isdir(match):
+                for dir_path, _, file_names in os.walk(match):
+                    paths.update(os.path.join(dir_path, name) for name in file_names)
+            else:
+                paths.add(match)
+    return sorted(paths)
+
+
+def file_digest(path):
+    digest = sha1()
+    with open(path, 'rb') as inp:
+        for chunk in iter(lambda: inp.read(65536), ''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _encode(value):
+    # Remembered args come from JSON as unicode, args from argv are bytes
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def fingerprint(cmd_class, args, source=None, known=None):
+    """Returns (digest, files) for a run of cmd_class with args.
+
+    files is {path: (mtime, size, digest)} for the source and each input,
+    digests are reused from known for files whose stat hasn't changed."""
+    known = known or {}
+    files = {}
+    racy_after = time.time() - RACY_WINDOW
+
+    total = sha1(marshal.dumps([
+        map(_encode, args),
+        list(cmd_class.inputs),
+        list(cmd_class.outputs),
+        ]))
+
+    # The source is identified by its content alone, so that the same cmd in
+    # different checkouts has the same fingerprint (see otto.artifacts)
+    paths = [(None, source)] if source is not None else []
+    paths.extend((path, path) for path in expand(cmd_class.inputs))
+
+    for name, path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+
+        entry = known.get(path)
+        if entry is None or entry[:2] != (st.st_mtime, st.st_size):
+            entry = (st.st_mtime, st.st_size, file_digest(path))
+            if st.st_mtime > racy_after:
+                # Don't trust the stat next time, read it again
+                entry = (None,) + entry[1:]
+
+        files[path] = entry
+        total.update(marshal.dumps(name))
+        total.update(entry[2])
+
+    return total.digest(), files
+
+
+def outputs_exist(cmd_class):
+    return all(os.path.exists(path) for path in cmd_class.outputs)
+
+
+class State(object):
+    """Fingerprints of the last successful run of each cmd,
+    {name: (digest, files)}, marshalled to LOCAL_STATE."""
+    def __init__(self, path=None):
+        self.path = path or LOCAL_STATE
+        self.cmds = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as inp:
+                state = marshal.load(inp)
+            if state['version'] == STATE_VERSION:
+                return state['cmds']
+        except (IOError, EOFError, ValueError, TypeError, KeyError):
+            pass
+        return {}
+
+    def get(self, name):
+        return self.cmds.get(name, (None, {}))
+
+    def put(self, name, digest, files):
+        """Record a successful run. The file is re-read under a lock so that
+        cmds finishing in parallel don't drop each other's entries."""
+        from otto.locking import locked, atomic_write
+        cmds = dict(self.cmds)
+        cmds[name] = (digest, files)
+
+        try:
+            state_dir = os.path.dirname(self.path)
+            if not os.path.isdir(state_dir):
+                os.makedirs(state_dir)
+            with locked(state_dir):
+                cmds = self._load()
+                cmds[name] = (digest, files)
+                atomic_write(self.path, marshal.dumps(
+                        {'version': STATE_VERSION, 'cmds': cmds}))
+        except (IOError, OSError):
+            pass
+
+        self.cmds = cmds
@@ -0,0 +1,228 @@
+"""Share a concurrency budget with make and other otto processes.
+
+GNU make's jobserver is a pipe holding one byte (a token) per job slot beyond
+the first. A process that wants to run another job in parallel reads a token
+and writes it back when the job is done; every process also has one implicit
+slot of its own. Its fds are passed down in MAKEFLAGS, as
+--jobserver-auth=R,W (or --jobserver-fds=R,W before make 4.2, or
+--jobserver-auth=fifo:PATH since make 4.4).
+
+When otto is run under a jobserver (from `make -j`, or by another otto) it
+joins it; otherwise, given -j N, it creates one with N - 1 tokens and puts it
+in MAKEFLAGS so that everything it runs shares the same N slots. Deps
+(otto.scheduler), --batch invocations and gather()ed tasks each take a token
+for every job they run beyond the first. shell() runs in the caller's slot,
+its children are passed the jobserver's fds and none of otto's others.
+
+Reading a token must never block while we're also waiting on our own jobs,
+so it's read through a private non-blocking open of the pipe
+(/proc/self/fd/R), leaving the fd make shares untouched."""
+import os
+import re
+import errno
+import select
+
+# How often to check for finished children while waiting for a token
+POLL = 0.05
+
+FDS_FLAG = re.compile(r'--jobserver-(?:auth|fds)=(\d+),(\d+)')
+FIFO_FLAG = re.compile(r'--jobserver-auth=fifo:(\S+)')
+JOBS_FLAG = re.compile(r'(?:^|\s)-j(\d+)(?:\s|$)')
+
+_current = []
+
+
+class JobServer(object):
+    def __init__(self, read_fd, write_fd, jobs=None):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        # The size of the pool (tokens plus the first slot), None if unknown
+        self.jobs = jobs
+        self._poll_fd = None
+        try:
+            self._poll_fd = os.open(
+                    '/proc/self/fd/%d' % read_fd,
+                    os.O_RDONLY | os.O_NONBLOCK,
+                    )
+        except OSError:
+            pass
+
+    @classmethod
+    def from_makeflags(cls, makeflags):
+        """The jobserver described by makeflags, or None if there isn't one
+        we can use (make only passes its fds to cmds it knows are recursive)."""
+        match = JOBS_FLAG.search(makeflags)
+        jobs = int(match.group(1)) if match else None
+
+        match = FIFO_FLAG.search(makeflags)
+        if match:
+            try:
+                fd = os.open(match.group(1), os.O_RDWR)
+            except OSError:
+                return None
+            return cls(fd, fd, jobs)
+
+        match = FDS_FLAG.search(makeflags)
+        if not match:
+            return None
+
+        read_fd, write_fd = int(match.group(1)), int(match.group(2))
+        try:
+            os.fstat(read_fd)
+            os.fstat(write_fd)
+        except OSError:
+            return None
+        return cls(read_fd, write_fd, jobs)
+
+    @classmethod
+    def create(cls, jobs):
+        """A new jobserver for jobs slots, advertised in MAKEFLAGS."""
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, '+' * (jobs - 1))
+
+        flags = "-j%d --jobserver-fds=%d,%d --jobserver-auth=%d,%d" % (
+                jobs, read_fd, write_fd, read_fd, write_fd)
+        makeflags = os.environ.get('MAKEFLAGS', '')
+        os.environ['MAKEFLAGS'] = ("%s %s" % (makeflags, flags)).strip()
+        return cls(read_fd, write_fd, jobs)
+
+    def fileno(self):
+        """Readable when a token may be available, for select()."""
+        return self._poll_fd if self._poll_fd is not None else self.read_fd
+
+    def acquire(self):
+        """Take a token if one is free right now, otherwise returns None."""
+        if self._poll_fd is None:
+            # No private fd, a token can be taken by someone else between the
+            # select and the read, which then blocks until one is returned
+            ready, _, _ = select.select([self.read_fd], [], [], 0)
+            if not ready:
+                return None
+
+        try:
+            token = os.read(self.fileno(), 1)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return None
+            raise
+        return token or None
+
+    def release(self, token):
+        while True:
+            try:
+                os.write(self.write_fd, token)
+                return
+            except OSError as e:
+                if e.errno != errno.EINTR:
+                    raise
+
+
+def current():
+    """The jobserver this process belongs to, if any."""
+    if not _current:
+        _current.append(JobServer.from_makeflags(os.environ.get('MAKEFLAGS', '')))
+    return _current[0]
+
+
+def _open_fds():
+    try:
+        return [int(fd) for fd in os.listdir('/proc/self/fd')]
+    except OSError:
+        try:
+            max_fd = os.sysconf('SC_OPEN_MAX')
+        except (ValueError, OSError):
+            max_fd = 256
+        return range(max_fd)
+
+
+def inherited_fds(keep=()):
+    """The fds a child would inherit, apart from stdio and keep. Close-on-exec
+    fds are left for exec, subprocess reports exec errors through one."""
+    import fcntl
+    fds = []
+    for fd in _open_fds():
+        if fd < 3 or fd in keep:
+            continue
+        try:
+            if not fcntl.fcntl(fd, fcntl.F_GETFD) & fcntl.FD_CLOEXEC:
+                fds.append(fd)
+        except (IOError, OSError):
+            pass
+    return fds
+
+
+def close_fds(keep=()):
+    """Close every fd apart from stdio and keep, in a child that's about to
+    exec."""
+    for fd in inherited_fds(keep):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def shared_fds():
+    """The fds children need to share the jobserver, if there is one."""
+    server = current()
+    if server is None:
+        return set()
+    return set([server.read_fd, server.write_fd])
+
+
+def popen_options():
+    """subprocess.Popen() arguments for a child that gets none of otto's fds
+    apart from the jobserver's, which nested otto and make need."""
+    keep = shared_fds()
+    if not keep:
+        return {'close_fds': True}
+    return {'close_fds': False, 'preexec_fn': lambda: close_fds(keep)}
+
+
+def setup(jobs=None):
+    """Join or create a jobserver, returns how many jobs to run at once.
+
+    jobs is what was asked for with -j, None if nothing was, in which case
+    an existing jobserver's pool size is used. That's None too if make
+    didn't say (as with a bare `make -j`): only its tokens limit us, see
+    has_room()."""
+    server = current()
+    if server is not None:
+        return jobs or server.jobs
+
+    jobs = jobs or 1
+    if jobs > 1:
+        _current[0] = JobServer.create(jobs)
+    return jobs
+
+
+def has_room(running, jobs):
+    """Whether another job may start alongside running ones, jobs being a
+    limit as returned by setup()."""
+    return jobs is None or running < jobs
+
+
+def wait_child(server=None):
+    """Wait for a child to exit and return (pid, exit status). If server is
+    given, returns (None, None) as soon as one of its tokens may be free."""
+    from otto.utils import child_status, wait_child as _wait_child
+    if server is None:
+        return _wait_child()
+
+    while True:
+        try:
+            pid, wait_status = os.waitpid(-1, os.WNOHANG)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+            continue
+        if pid:
+            return pid, child_status(wait_status)
+
+        try:
+            ready, _, _ = select.select([server], [], [], POLL)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            ready = []
+        if ready:
+            return None, None
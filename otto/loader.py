@@ -0,0 +1,126 @@
+"""Loads cmd modules from pack directories.
+
+imp.load_source recompiles cmd files or leaves .pyc files next to them. Instead
+compiled code is kept in BYTECODE_DIR, one directory per source file, with
+each entry named after the source's mtime and size and the interpreter's magic
+number. Pack directories are never written to.
+
+Cmd modules are registered as otto_packs.<pack>.<cmd> so that cmds with the
+same name in different packs don't clobber each other in sys.modules. Once
+imported, a cmd module is reused for the rest of the process unless its source
+changes."""
+import os
+import os.path
+import sys
+import imp
+import marshal
+from hashlib import sha1
+
+from otto import BYTECODE_DIR
+
+MAGIC = imp.get_magic().encode('hex')
+NAMESPACE = 'otto_packs'
+
+# {module_name: ((source_path, mtime, size), module)}
+_registry = {}
+
+
+def cache_path(source_path, st, cache_dir=BYTECODE_DIR):
+    """Where the compiled code for source_path (with stat result st) lives."""
+    source_key = sha1(os.path.abspath(source_path)).hexdigest()
+    entry = "%r-%d-%s.pyc" % (st.st_mtime, st.st_size, MAGIC)
+    return os.path.join(cache_dir, source_key, entry)
+
+
+def _write(path, code):
+    """Atomically store code at path, dropping older entries for the same
+    source. The cache is best effort, failures are ignored."""
+    entry_dir = os.path.dirname(path)
+    try:
+        if os.path.isdir(entry_dir):
+            for old in os.listdir(entry_dir):
+                os.remove(os.path.join(entry_dir, old))
+        else:
+            os.makedirs(entry_dir)
+
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, 'wb') as outp:
+            marshal.dump(code, outp)
+        os.rename(temp_path, path)
+    except (IOError, OSError):
+        pass
+
+
+def load_code(source_path, cache_dir=BYTECODE_DIR):
+    """Return the code object for source_path, compiling it only if the cache
+    doesn't have an up to date copy. Raises SyntaxError like compile()."""
+    st = os.stat(source_path)
+    path = cache_path(source_path, st, cache_dir)
+
+    try:
+        with open(path, 'rb') as inp:
+            return marshal.load(inp)
+    except (IOError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(source_path, 'rU') as inp:
+        source = inp.read()
+    code = compile(source, source_path, 'exec', 0, True)
+
+    _write(path, code)
+    return code
+
+
+def load_source(name, source_path, cache_dir=BYTECODE_DIR):
+    """Drop in replacement for imp.load_source that uses the bytecode cache."""
+    code = load_code(source_path, cache_dir)
+
+    module = imp.new_module(name)
+    module.__file__ = source_path
+    sys.modules[name] = module
+    try:
+        exec code in module.__dict__
+    except:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def module_name(pack_name, cmd_name):
+    return "%s.%s.%s" % (NAMESPACE, pack_name, cmd_name)
+
+
+def _ensure_package(name):
+    """Make sure an (empty) package called name is in sys.modules."""
+    package = sys.modules.get(name)
+    if package is None:
+        package = imp.new_module(name)
+        package.__path__ = []
+        sys.modules[name] = package
+
+        parent, _, child = name.rpartition('.')
+        if parent:
+            setattr(_ensure_package(parent), child, package)
+    return package
+
+
+def import_cmd(pack_name, cmd_name, source_path, cache_dir=BYTECODE_DIR):
+    """Import a cmd as otto_packs.<pack>.<cmd>.
+
+    The module is only executed again if source_path has changed since it was
+    last imported by this process."""
+    name = module_name(pack_name, cmd_name)
+    st = os.stat(source_path)
+    sig = (os.path.abspath(source_path), st.st_mtime, st.st_size)
+
+    cached = _registry.get(name)
+    if cached is not None:
+        cached_sig, module = cached
+        if cached_sig == sig and sys.modules.get(name) is module:
+            return module
+
+    package = _ensure_package(name.rpartition('.')[0])
+    module = load_source(name, source_path, cache_dir)
+    setattr(package, cmd_name, module)
+    _registry[name] = (sig, module)
+    return module
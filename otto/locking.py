@@ -0,0 +1,52 @@
+"""Update shared files safely from concurrent otto processes.
+
+Files are never written in place: the new contents go to a temporary file in
+the same directory, which is fsync'd and renamed over the old one. A reader
+sees either the old file or the new one, never a truncated one, so readers
+don't need to lock.
+
+Writers that read, modify and write a file back take an exclusive flock(2) on
+the file's directory around the whole update, otherwise two of them can read
+the same version and one's changes are lost. Locking the directory rather than
+the file itself means the lock survives the file being replaced, and no lock
+files are left lying around to be packed or copied."""
+import os
+import os.path
+import errno
+from contextlib import contextmanager
+
+
+@contextmanager
+def locked(dir_path):
+    """Hold an exclusive lock on dir_path, blocking until it's free."""
+    import fcntl
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                break
+            except IOError as e:
+                if e.errno != errno.EINTR:
+                    raise
+        yield
+    finally:
+        # Closing the fd releases the lock
+        os.close(fd)
+
+
+def atomic_write(path, data):
+    """Replace the file at path with data (a str)."""
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(temp_path, 'wb') as outp:
+            outp.write(data)
+            outp.flush()
+            os.fsync(outp.fileno())
+        os.rename(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
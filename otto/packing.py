@@ -0,0 +1,396 @@
+"""Write and install .opack archives, for `otto pack` and `otto install`.
+
+A .opack is a tar archive of a pack_root/ directory holding a ROOT_FILE that
+lists the packs in it, and a directory for each pack:
+
+    pack_root/config.json
+    pack_root/<pack>/cmds.json
+    pack_root/<pack>/<cmd>.py
+
+Files are streamed from the source pack straight into the (compressed) archive,
+there's no scratch copy. Compiled files are left out as they're read, and the
+config files are generated rather than copied, their paths are rewritten on
+install anyway.
+
+Archives are reproducible: packing the same files twice gives the same bytes.
+Entries are sorted, owners are dropped, modes are normalised to 0644 or 0755
+and every mtime is SOURCE_DATE_EPOCH (0 if it isn't set). The gzip header's
+timestamp and file name are left out too.
+
+Installing reads the archive once, as a stream: ROOT_FILE comes first so the
+pack can be chosen before any of it is read, then only the chosen pack's
+members are extracted. Member paths are checked as they're read, anything that
+isn't a file or directory beneath pack_root/ is refused. Archives packed by
+older versions of otto, with ROOT_FILE anywhere, are streamed twice instead."""
+import os
+import os.path
+import json
+import stat
+import shutil
+import tarfile
+import tempfile
+
+from otto import CMDS_FILE, ROOT_FILE
+
+PACK_ROOT = 'pack_root'
+
+# {compression: (default level, lowest, highest)}, xz needs the lzma module
+# (backports.lzma before Python 3.3)
+COMPRESSIONS = {
+        'gz': (6, 0, 9),
+        'bz2': (9, 1, 9),
+        'xz': (6, 0, 9),
+        'none': (None, None, None),
+        }
+
+# Never packed
+SKIP_EXTS = ('.pyc', '.pyo')
+
+# (magic, compression), to tell how an archive is compressed
+MAGICS = (
+        ('\x1f\x8b', 'gz'),
+        ('BZh', 'bz2'),
+        ('\xfd7zXZ\x00', 'xz'),
+        )
+
+# Compressed bytes read at once when installing
+CHUNK_SIZE = 64 * 1024
+
+
+def _lzma():
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            return None
+    return lzma
+
+
+class _Identity(object):
+    def compress(self, data):
+        return data
+
+    decompress = compress
+
+    def flush(self):
+        return ''
+
+
+class _Compressor(object):
+    """A write only file that compresses what's written to it into fileobj."""
+    def __init__(self, fileobj, compressor):
+        self.fileobj = fileobj
+        self.compressor = compressor
+
+    def write(self, data):
+        self.fileobj.write(self.compressor.compress(data))
+
+    def close(self):
+        self.fileobj.write(self.compressor.flush())
+
+
+class _Decompressed(object):
+    """A read only file of what's decompressed from fileobj.
+
+    tarfile's own stream reader re-slices everything it has decompressed for
+    every 512 byte header and is several times slower than this."""
+    def __init__(self, fileobj, decompressor):
+        self.fileobj = fileobj
+        self.decompressor = decompressor
+        self.buf = ''
+        self.pos = 0
+
+    def read(self, size):
+        while len(self.buf) - self.pos < size:
+            data = self.fileobj.read(CHUNK_SIZE)
+            if not data:
+                break
+            self.buf = self.buf[self.pos:] + self.decompressor.decompress(data)
+            self.pos = 0
+        data = self.buf[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+
+def compressed(fileobj, compression='gz', level=None):
+    """A file that writes to fileobj with compression (one of COMPRESSIONS)
+    at level. Closing it flushes the compressor but leaves fileobj open."""
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression %r, use one of %s" % (
+            compression, ', '.join(sorted(COMPRESSIONS))))
+    default, lowest, highest = COMPRESSIONS[compression]
+    if level is None:
+        level = default
+    elif compression != 'none' and not lowest <= level <= highest:
+        raise ValueError("%s levels go from %d to %d" % (compression, lowest, highest))
+
+    if compression == 'gz':
+        import gzip
+        return gzip.GzipFile('', 'wb', level, fileobj, mtime=0)
+    elif compression == 'bz2':
+        import bz2
+        return _Compressor(fileobj, bz2.BZ2Compressor(level))
+    elif compression == 'xz':
+        lzma = _lzma()
+        if lzma is None:
+            raise ValueError("xz compression needs the lzma module")
+        return _Compressor(fileobj, lzma.LZMACompressor(preset=level))
+    return _Compressor(fileobj, _Identity())
+
+
+def _epoch():
+    try:
+        return int(os.environ.get('SOURCE_DATE_EPOCH', 0))
+    except ValueError:
+        return 0
+
+
+def _info(name, size=0, executable=False, directory=False):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = _epoch()
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    if directory:
+        info.type = tarfile.DIRTYPE
+        info.mode = 0755
+    else:
+        info.mode = 0755 if executable else 0644
+    return info
+
+
+def _add_bytes(tar, name, data):
+    from cStringIO import StringIO
+    tar.addfile(_info(name, len(data)), StringIO(data))
+
+
+def _pack_files(src_dir):
+    """(relative path, stat) of the files and directories beneath src_dir
+    that are packed, in order. Symlinks are followed, as copytree did."""
+    entries = []
+    for dir_path, dir_names, file_names in os.walk(src_dir, followlinks=True):
+        rel_dir = os.path.relpath(dir_path, src_dir)
+        for name in dir_names + file_names:
+            if name.endswith(SKIP_EXTS) or (name == CMDS_FILE and rel_dir == '.'):
+                continue
+            try:
+                st = os.stat(os.path.join(dir_path, name))
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode) or stat.S_ISREG(st.st_mode):
+                entries.append((os.path.normpath(os.path.join(rel_dir, name)), st))
+    return sorted(entries)
+
+
+def write_pack(fileobj, src_dir, pack_name, compression='gz', level=None):
+    """Write a .opack of the pack in src_dir, named pack_name, to fileobj."""
+    with open(os.path.join(src_dir, CMDS_FILE), 'r') as inp:
+        cmds = json.load(inp).get('cmds', {})
+
+    out = compressed(fileobj, compression, level)
+    tar = tarfile.open(fileobj=out, mode='w|', format=tarfile.GNU_FORMAT)
+    try:
+        pack_dir = os.path.join(PACK_ROOT, pack_name)
+        tar.addfile(_info(PACK_ROOT, directory=True))
+        _add_bytes(tar, os.path.join(PACK_ROOT, ROOT_FILE), json.dumps(
+                {'packs': {pack_name: pack_dir}}, indent=4, sort_keys=True))
+        tar.addfile(_info(pack_dir, directory=True))
+        _add_bytes(tar, os.path.join(pack_dir, CMDS_FILE), json.dumps(
+                {'cmds': dict((name, os.path.join(pack_dir, name + '.py'))
+                    for name in cmds)},
+                indent=4, sort_keys=True))
+
+        for rel_path, st in _pack_files(src_dir):
+            name = os.path.join(pack_dir, rel_path)
+            if stat.S_ISDIR(st.st_mode):
+                tar.addfile(_info(name, directory=True))
+                continue
+            with open(os.path.join(src_dir, rel_path), 'rb') as inp:
+                tar.addfile(
+                        _info(name, st.st_size, bool(st.st_mode & stat.S_IXUSR)),
+                        inp
+                        )
+    finally:
+        tar.close()
+        out.close()
+
+
+def pack(path, src_dir, pack_name, compression='gz', level=None):
+    """write_pack() to the file at path, which is only replaced once the
+    archive is complete."""
+    temp_path = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(temp_path, 'wb') as outp:
+            write_pack(outp, src_dir, pack_name, compression, level)
+        os.rename(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _decompressor(compression):
+    if compression == 'gz':
+        import zlib
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        import bz2
+        return bz2.BZ2Decompressor()
+    elif compression == 'xz':
+        lzma = _lzma()
+        if lzma is None:
+            raise ValueError("The pack is xz compressed, which needs the lzma module")
+        return lzma.LZMADecompressor()
+    return _Identity()
+
+
+def _open(fileobj):
+    """Stream the archive in fileobj, from the start."""
+    fileobj.seek(0)
+    head = fileobj.read(max(len(magic) for magic, _ in MAGICS))
+    fileobj.seek(0)
+    compression = 'none'
+    for magic, name in MAGICS:
+        if head.startswith(magic):
+            compression = name
+            break
+    try:
+        return tarfile.open(
+                fileobj=_Decompressed(fileobj, _decompressor(compression)),
+                mode='r|')
+    except tarfile.TarError as e:
+        raise ValueError("Can't read the archive: %s" % e)
+
+
+def _members(tar):
+    """Each member of tar as it's read, with its path beneath pack_root/
+    as a list of parts (None for members outside pack_root/)."""
+    while True:
+        try:
+            member = tar.next()
+        except tarfile.TarError as e:
+            raise ValueError("Can't read the archive: %s" % e)
+        if member is None:
+            return
+
+        name = member.name.replace('\\', '/')
+        parts = [part for part in name.split('/') if part not in ('', '.')]
+        if name.startswith('/') or '..' in parts:
+            raise ValueError("Refusing to install %s, it's outside the pack" % member.name)
+        if not member.isfile() and not member.isdir():
+            raise ValueError("Refusing to install %s, it isn't a file or directory" % member.name)
+        if parts[:1] != [PACK_ROOT]:
+            yield member, None
+        else:
+            yield member, parts[1:]
+
+
+def _pack_names(tar, member):
+    try:
+        packs = json.load(tar.extractfile(member)).get('packs')
+    except (ValueError, AttributeError):
+        packs = None
+    if not isinstance(packs, dict):
+        raise ValueError("%s is corrupt" % os.path.join(PACK_ROOT, ROOT_FILE))
+    for pack_name in packs:
+        if pack_name in ('', '.', '..') or '/' in pack_name or '\\' in pack_name:
+            raise ValueError("Refusing to install a pack named %r" % pack_name)
+    return sorted(packs)
+
+
+def _extract(tar, members, pack_name, dest, temp_dir):
+    """Write the members of pack_name to temp_dir, with cmds paths pointing
+    beneath dest."""
+    try:
+        cmds = _write_members(tar, members, pack_name, temp_dir)
+        with open(os.path.join(temp_dir, CMDS_FILE), 'w') as outp:
+            json.dump({'cmds': dict((name, os.path.join(dest, name + '.py'))
+                for name in cmds)}, outp, indent=4, sort_keys=True)
+    except (IOError, OSError) as e:
+        # Say, a file and a directory at the same path
+        raise ValueError("%s is corrupt (%s)" % (pack_name, e.strerror or e))
+
+
+def _write_members(tar, members, pack_name, temp_dir):
+    """Write the members of pack_name to temp_dir, returns its cmds."""
+    cmds = {}
+    for member, parts in members:
+        if parts is None or parts[:1] != [pack_name] or len(parts) == 1:
+            continue
+        rel_path = os.path.join(*parts[1:])
+        path = os.path.join(temp_dir, rel_path)
+
+        if member.isdir():
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            continue
+        if rel_path == CMDS_FILE:
+            try:
+                cmds = json.load(tar.extractfile(member)).get('cmds', {})
+            except (ValueError, AttributeError):
+                raise ValueError("%s's %s is corrupt" % (pack_name, CMDS_FILE))
+            continue
+
+        dir_path = os.path.dirname(path)
+        if not os.path.isdir(dir_path):
+            os.makedirs(dir_path)
+        with open(path, 'wb') as outp:
+            shutil.copyfileobj(tar.extractfile(member), outp)
+        os.chmod(path, 0755 if member.mode & stat.S_IXUSR else 0644)
+    return cmds
+
+
+def install_pack(path, dest_root, choose=None, scratch_dir=None):
+    """Install a pack from the .opack at path into dest_root. If the archive
+    holds several packs choose is called with their names and returns the one
+    to install. The pack is extracted into scratch_dir (dest_root by default,
+    it must be on the same filesystem) and moved into place once it's
+    complete. Returns (pack_name, the pack's directory)."""
+    with open(path, 'rb') as inp:
+        return _install(inp, path, dest_root, choose, scratch_dir)
+
+
+def _install(inp, path, dest_root, choose, scratch_dir):
+    tar = _open(inp)
+    try:
+        members = _members(tar)
+        rewind = False
+        for member, parts in members:
+            if parts == [ROOT_FILE]:
+                pack_names = _pack_names(tar, member)
+                break
+            if parts and member.isfile():
+                # Packed by an older otto, this has to be read again once
+                # the pack is chosen
+                rewind = True
+        else:
+            raise ValueError("No packs found in %s" % path)
+        if rewind:
+            tar.close()
+            tar = _open(inp)
+            members = _members(tar)
+
+        if not pack_names:
+            raise ValueError("No packs found in %s" % path)
+        elif len(pack_names) == 1 or choose is None:
+            pack_name = pack_names[0]
+        else:
+            pack_name = choose(pack_names)
+
+        dest = os.path.join(os.path.abspath(dest_root), pack_name)
+        if os.path.exists(dest):
+            raise ValueError("%s is already installed" % pack_name)
+
+        temp_dir = tempfile.mkdtemp(prefix='installing-', dir=scratch_dir or dest_root)
+        try:
+            _extract(tar, members, pack_name, dest, temp_dir)
+            os.chmod(temp_dir, 0755)
+            os.rename(temp_dir, dest)
+        except BaseException:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
+    finally:
+        tar.close()
+    return pack_name, dest
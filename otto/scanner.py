@@ -0,0 +1,178 @@
+"""Find packs and the cmds in them, for `otto dr`.
+
+A pack is a directory with a CMDS_FILE in it, anywhere beneath a root
+(~/.otto or ./.otto). Its cmds are the top level classes of its .py files that
+subclass OttoCmd, found by parsing the files with ast rather than matching
+lines, so helper classes and classes in strings or comments don't count. Like
+isOttoCmd, a class only counts if one of its bases is OttoCmd itself (named
+OttoCmd, otto.OttoCmd, ...).
+
+Parsing is skipped for files whose mtime and size match the Journal, which
+remembers what was found in each file last time. Roots are scanned in
+threads, most of the time is spent in the kernel listing and stat'ing."""
+import os
+import os.path
+import re
+import stat
+import time
+import marshal
+
+from otto import CACHE_DIR, CMDS_FILE, SCAN_JOURNAL
+from otto.incremental import RACY_WINDOW
+
+JOURNAL_VERSION = 1
+
+# Used for files ast can't parse, so that a syntax error doesn't lose the cmd
+CLASS_LINE = re.compile(r'^class\s+(\w+)\s*\((.*OttoCmd.*)\)\s*:', re.MULTILINE)
+
+
+class Journal(object):
+    """{path: (mtime, size, cmd names)} for every file parsed."""
+    def __init__(self, path=None):
+        self.path = path or SCAN_JOURNAL
+        self.files = {}
+        self._dirty = False
+        try:
+            with open(self.path, 'rb') as inp:
+                journal = marshal.load(inp)
+            if journal['version'] == JOURNAL_VERSION:
+                self.files = journal['files']
+        except (IOError, EOFError, ValueError, TypeError, KeyError):
+            pass
+
+    def names(self, path, st):
+        entry = self.files.get(path)
+        if entry is not None and entry[:2] == (st.st_mtime, st.st_size):
+            return entry[2]
+
+        names = cmd_names(path)
+        # Don't trust the stat of a file that may still be being written
+        if st.st_mtime < time.time() - RACY_WINDOW:
+            self.files[path] = (st.st_mtime, st.st_size, names)
+            self._dirty = True
+        return names
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        for path in self.files.keys():
+            if not os.path.isfile(path):
+                del self.files[path]
+
+        from otto.locking import atomic_write
+        try:
+            journal_dir = os.path.dirname(self.path)
+            if not os.path.isdir(journal_dir):
+                os.makedirs(journal_dir)
+            atomic_write(self.path, marshal.dumps(
+                    {'version': JOURNAL_VERSION, 'files': self.files}))
+        except (IOError, OSError):
+            # The journal only saves time, failing to write it isn't fatal
+            return
+        self._dirty = False
+
+
+def _base_name(node):
+    import ast
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def cmd_names(path):
+    """The names of the OttoCmds defined in the file at path, lower cased as
+    cmd names are."""
+    import ast
+    try:
+        with open(path, 'r') as inp:
+            source = inp.read()
+    except IOError:
+        return []
+
+    try:
+        tree = ast.parse(source, path)
+    except (SyntaxError, TypeError, ValueError):
+        return [match.group(1).lower() for match in CLASS_LINE.finditer(source)]
+
+    return [node.name.lower() for node in tree.body
+            if isinstance(node, ast.ClassDef) and
+            any(_base_name(base) == 'OttoCmd' for base in node.bases)]
+
+
+def _listdir(path):
+    """[(name, lstat)] of the entries in path."""
+    entries = []
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return entries
+    for name in names:
+        try:
+            entries.append((name, os.lstat(os.path.join(path, name))))
+        except OSError:
+            continue
+    return entries
+
+
+def find_packs(root):
+    """{pack_name: pack_dir} for every directory beneath root (including
+    root) that has a CMDS_FILE. The cache isn't searched."""
+    packs = {}
+    pending = [root]
+    while pending:
+        dir_path = pending.pop()
+        for name, st in _listdir(dir_path):
+            path = os.path.join(dir_path, name)
+            if stat.S_ISDIR(st.st_mode):
+                if path != CACHE_DIR:
+                    pending.append(path)
+            elif name == CMDS_FILE:
+                packs[os.path.basename(dir_path)] = dir_path
+    return packs
+
+
+def scan_pack(pack_dir, journal):
+    """{cmd_name: file_path} for the cmds in pack_dir's .py files."""
+    cmds = {}
+    for name, st in sorted(_listdir(pack_dir)):
+        if not name.endswith('.py') or not stat.S_ISREG(st.st_mode):
+            continue
+        path = os.path.join(pack_dir, name)
+        for cmd_name in journal.names(path, st):
+            cmds[cmd_name] = path
+    return cmds
+
+
+def scan(root, journal):
+    """{pack_name: (pack_dir, {cmd_name: file_path})} for root."""
+    return dict(
+            (pack, (pack_dir, scan_pack(pack_dir, journal)))
+            for pack, pack_dir in find_packs(root).iteritems()
+            )
+
+
+def scan_all(roots, journal=None):
+    """scan() each of roots at the same time, returns {root: scan}."""
+    import threading
+    journal = journal or Journal()
+    results = {}
+    errors = []
+
+    def _scan(root):
+        try:
+            results[root] = scan(root, journal)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=_scan, args=(root,)) for root in roots]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return results
@@ -0,0 +1,140 @@
+"""Runs cmds along with the cmds they depend on.
+
+An OttoCmd can list other cmds in its `deps`. Before it runs, every cmd it
+depends on (directly or not) is run, each in a child forked from the current
+process, with cmds that don't depend on each other running at the same time
+(up to a limit). If a cmd fails, nothing downstream of it is run.
+
+Nodes in the graph are (pack, cmd) pairs."""
+from otto import jobserver
+from otto.utils import bail
+
+# Status of a node that was never run because something upstream failed
+CANCELLED = -1
+
+
+def node_name(node):
+    return "%s:%s" % node
+
+
+def resolve(store, name):
+    """Returns (root, deps), the node for name and {node: [dep_node, ...]}
+    for root and everything it depends on."""
+    root = tuple(store.lookup(name))
+
+    deps = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node in deps:
+            continue
+
+        pack, cmd = node
+        cmd_class = store._load_cmd(cmd, store.cmds_by_pack[pack][cmd], pack)
+        deps[node] = [tuple(store.lookup(dep)) for dep in cmd_class.deps]
+        stack.extend(deps[node])
+
+    cycle = find_cycle(deps)
+    if cycle:
+        bail("Dependency cycle: %s" % ' -> '.join(map(node_name, cycle)))
+
+    return root, deps
+
+
+def find_cycle(deps):
+    """Returns a list of nodes forming a cycle, or None."""
+    visiting, done = set(), set()
+
+    for start in sorted(deps):
+        if start in done:
+            continue
+
+        path = [start]
+        iters = [iter(deps[start])]
+        visiting.add(start)
+        while iters:
+            for dep in iters[-1]:
+                if dep in visiting:
+                    return path[path.index(dep):] + [dep]
+                if dep not in done:
+                    path.append(dep)
+                    iters.append(iter(deps.get(dep, ())))
+                    visiting.add(dep)
+                    break
+            else:
+                iters.pop()
+                node = path.pop()
+                visiting.discard(node)
+                done.add(node)
+
+    return None
+
+
+class Scheduler(object):
+    """Runs a graph of nodes in dependency order, jobs at a time."""
+    def __init__(self, deps, jobs=1):
+        self.deps = deps
+        # None leaves it to the jobserver's tokens
+        self.jobs = jobs if jobs is None else max(1, jobs)
+
+    def run(self, start):
+        """start(node) should fork a child to run node and return its pid.
+
+        Returns {node: exit status}, nodes that were cancelled because of an
+        upstream failure have a status of CANCELLED."""
+        waiting = dict((node, set(deps)) for node, deps in self.deps.iteritems())
+        dependants = dict((node, []) for node in self.deps)
+        for node, deps in self.deps.iteritems():
+            for dep in deps:
+                dependants[dep].append(node)
+
+        ready = sorted(node for node, deps in waiting.iteritems() if not deps)
+        running = {}
+        statuses = {}
+
+        # Every node run alongside another needs a jobserver token
+        server = jobserver.current()
+        tokens = {}
+
+        try:
+            while ready or running:
+                while ready and jobserver.has_room(len(running), self.jobs):
+                    token = None
+                    if running and server is not None:
+                        token = server.acquire()
+                        if token is None:
+                            break
+                    node = ready.pop(0)
+                    pid = start(node)
+                    running[pid] = node
+                    if token is not None:
+                        tokens[pid] = token
+
+                want_token = ready and jobserver.has_room(len(running), self.jobs)
+                pid, status = jobserver.wait_child(server if want_token else None)
+                if pid is None:
+                    continue
+                if pid in tokens:
+                    server.release(tokens.pop(pid))
+
+                node = running.pop(pid, None)
+                if node is None:
+                    continue
+
+                statuses[node] = status
+                if status != 0:
+                    continue
+
+                for dependant in dependants[node]:
+                    waiting[dependant].discard(node)
+                    if not waiting[dependant]:
+                        ready.append(dependant)
+        finally:
+            for token in tokens.itervalues():
+                server.release(token)
+
+        # Anything left never had all of its deps succeed
+        for node in self.deps:
+            statuses.setdefault(node, CANCELLED)
+
+        return statuses
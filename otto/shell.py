@@ -0,0 +1,276 @@
+"""Run shell commands and consume their output as it's produced.
+
+otto.utils.shell() waits for a command to finish and hands back everything it
+printed, which won't do for commands that run forever (tailing a log) or print
+more than fits in memory. A ShellStream yields the output line by line (or in
+chunks) while the command runs and only ever holds on to:
+
+* the last `tail` lines or chunks, used in error messages,
+* if capture is set, everything in a temporary file that stays in memory until
+  it grows past SPILL_SIZE and is then written to disk.
+
+    with otto.stream('pg_dump db') as dump:
+        for line in dump:
+            ...
+
+Once the output is exhausted the command's exit status is checked and a
+subprocess.CalledProcessError is raised if it failed (unless check=False). A
+stream that isn't read to the end kills the command when it's closed.
+
+Commands are either a command line, run by /bin/sh, or an argv list which is
+executed directly. An argv list costs one less fork/exec and needs no quoting,
+so paths with spaces are safe. run(), which backs shell(), starts argv lists
+with posix_spawnp(3) when libc has it rather than fork() and exec()."""
+import os
+import sys
+import errno
+import subprocess
+from collections import deque
+from tempfile import SpooledTemporaryFile
+
+from otto import jobserver
+
+# Captured output is kept in memory up to this many bytes
+SPILL_SIZE = 1 << 20
+
+# posix_spawn_file_actions_t is opaque, so rather than mirror it we pass a
+# buffer at least this big. It's 80 bytes in glibc and musl on 64 bit
+# platforms (two ints, a pointer and 16 ints of padding, 76 bytes on 32 bit)
+# and a single pointer on the BSDs and macOS. _posix_spawnp() checks the
+# glibc/musl layout fits.
+FILE_ACTIONS_SIZE = 256
+
+
+def uses_shell(cmd):
+    return isinstance(cmd, basestring)
+
+
+def command_line(cmd):
+    """How cmd would be typed into a shell, for echoing."""
+    if uses_shell(cmd):
+        return cmd
+    from pipes import quote
+    return ' '.join(quote(arg) for arg in cmd)
+
+
+_spawn_funcs = []
+
+
+def _posix_spawnp():
+    """Returns libc's posix_spawnp function (and the file action functions it
+    needs) or None if they aren't available."""
+    if not _spawn_funcs:
+        try:
+            import ctypes
+            class FileActions(ctypes.Structure):
+                _fields_ = [
+                        ('allocated', ctypes.c_int),
+                        ('used', ctypes.c_int),
+                        ('actions', ctypes.c_void_p),
+                        ('pad', ctypes.c_int * 16),
+                        ]
+            assert ctypes.sizeof(FileActions) <= FILE_ACTIONS_SIZE
+
+            libc = ctypes.CDLL(None, use_errno=True)
+            _spawn_funcs.append((
+                    ctypes,
+                    libc.posix_spawnp,
+                    libc.posix_spawn_file_actions_init,
+                    libc.posix_spawn_file_actions_adddup2,
+                    libc.posix_spawn_file_actions_addclose,
+                    libc.posix_spawn_file_actions_destroy,
+                    ctypes.POINTER(ctypes.c_char_p).in_dll(libc, 'environ'),
+                    ))
+        except (ImportError, OSError, AttributeError, ValueError):
+            _spawn_funcs.append(None)
+    return _spawn_funcs[0]
+
+
+def spawn(argv, stdout=None):
+    """Start argv (searching PATH) with posix_spawnp, optionally with its
+    stdout connected to the fd stdout. Like the children of a ShellStream, it
+    gets none of otto's fds apart from the jobserver's. Returns the child's
+    pid, or None if posix_spawnp isn't available. Raises OSError if argv
+    can't be run."""
+    funcs = _posix_spawnp()
+    if funcs is None:
+        return None
+    (ctypes, posix_spawnp, actions_init, actions_adddup2, actions_addclose,
+            actions_destroy, environ) = funcs
+
+    argv = [arg.encode('utf-8') if isinstance(arg, unicode) else arg for arg in argv]
+    c_argv = (ctypes.c_char_p * (len(argv) + 1))(*(argv + [None]))
+    actions = ctypes.create_string_buffer(FILE_ACTIONS_SIZE)
+    pid = ctypes.c_int()
+
+    actions_init(actions)
+    try:
+        if stdout is not None:
+            actions_adddup2(actions, stdout, 1)
+        for fd in jobserver.inherited_fds(jobserver.shared_fds()):
+            actions_addclose(actions, fd)
+        error = posix_spawnp(
+                ctypes.byref(pid),
+                argv[0],
+                actions,
+                None,
+                c_argv,
+                environ,
+                )
+    finally:
+        actions_destroy(actions)
+
+    if error:
+        raise OSError(error, "%s: %s" % (argv[0], os.strerror(error)))
+    return pid.value
+
+
+def _wait_status(pid):
+    while True:
+        try:
+            _, status = os.waitpid(pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def _read_all(fd):
+    chunks = []
+    while True:
+        try:
+            chunk = os.read(fd, 65536)
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        if not chunk:
+            return ''.join(chunks)
+        chunks.append(chunk)
+
+
+def run(cmd, capture=True):
+    """Run cmd to completion, returns (exit status, output). The output is
+    only captured if capture is set, otherwise it goes to stdout."""
+    if not uses_shell(cmd) and _posix_spawnp() is not None:
+        if not capture:
+            return _wait_status(spawn(cmd)), ''
+
+        import fcntl
+        read_fd, write_fd = os.pipe()
+        for fd in (read_fd, write_fd):
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+        try:
+            pid = spawn(cmd, write_fd)
+        finally:
+            os.close(write_fd)
+        try:
+            outp = _read_all(read_fd)
+        finally:
+            os.close(read_fd)
+        return _wait_status(pid), outp
+
+    proc = subprocess.Popen(
+            cmd,
+            shell=uses_shell(cmd),
+            stdout=subprocess.PIPE if capture else None,
+            **jobserver.popen_options()
+            )
+    outp, _ = proc.communicate()
+    return proc.returncode, outp or ''
+
+
+class ShellStream(object):
+    def __init__(self, cmd, echo=True, tee=False, tail=100, capture=False,
+            chunk_size=None, stderr=False, check=True):
+        """Start cmd (a shell command line or an argv list).
+
+        tee copies the output to stdout as it's read, chunk_size yields
+        chunks of up to that many bytes rather than lines and stderr merges
+        the command's stderr into the stream."""
+        if echo:
+            from otto.utils import blue
+            blue("  $ %s" % command_line(cmd))
+
+        self.cmd = cmd
+        self.tee = tee
+        self.chunk_size = chunk_size
+        self.check = check
+        self.tail = deque(maxlen=tail)
+        self.captured = SpooledTemporaryFile(SPILL_SIZE) if capture else None
+        self.returncode = None
+
+        self._proc = subprocess.Popen(
+                cmd,
+                shell=uses_shell(cmd),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if stderr else None,
+                **jobserver.popen_options()
+                )
+        self._pipe = self._proc.stdout
+
+    def _pieces(self):
+        if self._pipe.closed:
+            return iter(())
+        if self.chunk_size:
+            fd = self._pipe.fileno()
+            return iter(lambda: os.read(fd, self.chunk_size), '')
+        # readline() rather than the file iterator, which reads ahead
+        return iter(self._pipe.readline, '')
+
+    def __iter__(self):
+        for piece in self._pieces():
+            self.tail.append(piece)
+            if self.captured is not None:
+                self.captured.write(piece)
+            if self.tee:
+                sys.stdout.write(piece)
+                sys.stdout.flush()
+            yield piece
+
+        self._finish()
+
+    def _finish(self):
+        if self.returncode is not None:
+            return
+
+        self._pipe.close()
+        self.returncode = self._proc.wait()
+        if self.check and self.returncode != 0:
+            raise subprocess.CalledProcessError(
+                    self.returncode,
+                    self.cmd,
+                    ''.join(self.tail)
+                    )
+
+    def wait(self):
+        """Read (and drop) any remaining output, then wait for the command to
+        exit. Returns its exit status."""
+        for _ in self:
+            pass
+        return self.returncode
+
+    def output(self):
+        """Everything the command printed, needs capture=True."""
+        self.wait()
+        self.captured.seek(0)
+        return self.captured.read()
+
+    def close(self):
+        """Kill the command if it's still running and clean up."""
+        if self.returncode is None and self._proc.poll() is None:
+            self._proc.kill()
+        self._pipe.close()
+        if self.returncode is None:
+            self.returncode = self._proc.wait()
+        if self.captured is not None:
+            self.captured.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,226 @@
+"""An SQLite backed alternative to the CmdIndex.
+
+The CmdIndex is one JSON file, decoded on every run and written whole
+whenever a single pack changes, which gets slow at tens of thousands of cmds.
+The SqliteIndex caches the same information in indexed tables of an SQLite
+database (SQLITE_INDEX_FILE), read in a couple of queries and updated a pack
+(or a fingerprint) at a time:
+
+* packs: each pack's CMDS_FILE, with the mtime and size it had when read,
+* cmds: the cmds listed in it,
+* fingerprints: what otto.incremental.State keeps in LOCAL_STATE, for every
+  local dir.
+
+It's only a cache, not somewhere packs are stored: config.json and each
+pack's CMDS_FILE stay the source of truth (they're what `otto dr`, packing
+and people editing them work with), and a pack's rows are only used while
+its CMDS_FILE is unchanged. Remembered args and everything else OttoConfig
+reads aren't in it.
+
+`otto cache migrate` fills it from the JSON layout, after which it's used in
+place of the CmdIndex. Deleting it goes back to the CmdIndex."""
+import os
+import os.path
+import marshal
+
+from otto import LOCAL_STATE, SQLITE_INDEX_FILE
+from otto.cmdindex import stat_sig
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packs (
+    config_path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cmds (
+    config_path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (config_path, name)
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    state_path TEXT NOT NULL,
+    cmd TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    files BLOB NOT NULL,
+    PRIMARY KEY (state_path, cmd)
+);
+"""
+
+# How long to wait for another otto process to finish writing
+BUSY_TIMEOUT = 10.0
+
+
+class SqliteIndex(object):
+    """Has the same interface as the CmdIndex. Changes are kept in memory
+    and written in a single short transaction when save() is called, so the
+    database isn't locked against other otto processes while packs are read."""
+    def __init__(self, path=None):
+        self.path = path or SQLITE_INDEX_FILE
+        self._conn = None
+        self._pid = None
+        self._packs = None
+        # {config_path: (sig, cmds), or None to delete it} waiting for save()
+        self._pending = {}
+        # The parent's connection, kept open rather than closed in a child
+        self._inherited = None
+
+    @property
+    def db(self):
+        """The connection, a new one in a forked child (an SQLite connection
+        mustn't be used on both sides of a fork)."""
+        if self._conn is None or self._pid != os.getpid():
+            import sqlite3
+            index_dir = os.path.dirname(self.path)
+            if not os.path.isdir(index_dir):
+                os.makedirs(index_dir)
+
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+            # Names and paths come back as byte strings, as CmdStore keeps them
+            conn.text_factory = str
+            if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                conn.executescript(SCHEMA)
+                conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+                conn.commit()
+
+            self._inherited = self._conn
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _load(self):
+        """Read every pack's cmds in one query, a query per pack costs more
+        than the rows do."""
+        packs = {}
+        for config_path, mtime, size in self.db.execute(
+                'SELECT config_path, mtime, size FROM packs'):
+            packs[config_path] = ([mtime, size], {})
+        for config_path, name, path in self.db.execute(
+                'SELECT config_path, name, path FROM cmds'):
+            packs[config_path][1][name] = path
+        return packs
+
+    def get(self, config_path):
+        """Returns {cmd_name: cmd_path} for config_path, or None if the
+        index doesn't have an up to date copy."""
+        if self._packs is None:
+            self._packs = self._load()
+
+        entry = self._packs.get(os.path.abspath(config_path))
+        if entry is None or entry[0] != stat_sig(config_path):
+            return None
+        return entry[1]
+
+    def put(self, config_path, cmds):
+        """Record the cmds that were just read from config_path."""
+        config_path = os.path.abspath(config_path)
+        sig = stat_sig(config_path)
+        if sig is None:
+            return
+
+        self._pending[config_path] = (sig, dict(cmds))
+        if self._packs is not None:
+            self._packs[config_path] = (sig, dict(cmds))
+
+    def discard(self, config_path):
+        config_path = os.path.abspath(config_path)
+        self._pending[config_path] = None
+        if self._packs is not None:
+            self._packs.pop(config_path, None)
+
+    def save(self):
+        """Write any changes, forgetting packs that have been deleted."""
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        for config_path, in self.db.execute(
+                'SELECT config_path FROM packs').fetchall():
+            if not os.path.isfile(config_path):
+                pending[config_path] = None
+
+        with self.db:
+            for config_path, entry in pending.iteritems():
+                self.db.execute(
+                        'DELETE FROM packs WHERE config_path = ?', (config_path,))
+                self.db.execute(
+                        'DELETE FROM cmds WHERE config_path = ?', (config_path,))
+                if entry is None:
+                    continue
+                sig, cmds = entry
+                self.db.execute(
+                        'INSERT INTO packs (config_path, mtime, size) VALUES (?, ?, ?)',
+                        [config_path] + sig
+                        )
+                self.db.executemany(
+                        'INSERT INTO cmds (config_path, name, path) VALUES (?, ?, ?)',
+                        ((config_path, name, path) for name, path in cmds.iteritems())
+                        )
+
+    def state(self):
+        """Fingerprints of this local dir's runs, like incremental.State."""
+        return SqliteState(self, LOCAL_STATE)
+
+
+class SqliteState(object):
+    def __init__(self, index, state_path):
+        self.index = index
+        self.state_path = state_path
+
+    def get(self, name):
+        row = self.index.db.execute(
+                'SELECT digest, files FROM fingerprints'
+                ' WHERE state_path = ? AND cmd = ?',
+                (self.state_path, name)
+                ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], marshal.loads(str(row[1]))
+
+    def put(self, name, digest, files):
+        import sqlite3
+        db = self.index.db
+        db.execute(
+                'INSERT OR REPLACE INTO fingerprints'
+                ' (state_path, cmd, digest, files) VALUES (?, ?, ?, ?)',
+                (self.state_path, name, digest, sqlite3.Binary(marshal.dumps(files)))
+                )
+        db.commit()
+
+
+def migrate(index, config_paths, state_paths=()):
+    """Fill the index from the JSON layout: the packs listed in each of
+    config_paths (ROOT_FILEs) and the fingerprints in each of state_paths.
+    Returns (packs, cmds) counts."""
+    import json
+    from otto import CMDS_FILE
+    from otto.cmdstore import CmdStore
+    from otto.incremental import State
+
+    packs = cmds = 0
+    for config_path in config_paths:
+        try:
+            with open(config_path, 'r') as inp:
+                pack_dirs = json.load(inp).get('packs', {})
+        except (IOError, ValueError):
+            continue
+
+        for pack_dir in pack_dirs.itervalues():
+            cmds_path = os.path.join(pack_dir, CMDS_FILE)
+            try:
+                pack_cmds = CmdStore._read_pack(cmds_path)
+            except Exception:
+                # Left for `otto dr` to fix, it'll be read when it's fixed
+                continue
+            index.put(cmds_path, pack_cmds)
+            packs += 1
+            cmds += len(pack_cmds)
+
+    for state_path in state_paths:
+        state = SqliteState(index, state_path)
+        for name, (digest, files) in State(state_path).cmds.iteritems():
+            state.put(name, digest, files)
+
+    index.save()
+    return packs, cmds
@@ -0,0 +1,202 @@
+"""Run shell commands concurrently from inside a cmd.
+
+shell() blocks until each command exits, so a cmd that queries dozens of
+hosts or repos does so one at a time. Instead a cmd can spawn() tasks and
+gather() them: every task is started (no more than `limit` at once) and their
+output is read as it arrives by a single select() loop, each line printed with
+the task's prefix.
+
+    outputs = otto.gather([otto.spawn('git -C %s pull' % repo) for repo in repos], limit=8)
+
+OttoCmd.run can also be a generator based coroutine, the dispatcher runs it and
+every task (or list of tasks, or Gather) it yields, sending back the results.
+A failed task raises CalledProcessError at the yield.
+
+    def run(self, *hosts):
+        uptimes = yield [otto.spawn('ssh %s uptime' % host) for host in hosts]
+        yield otto.spawn('notify "%d hosts are up"' % len(uptimes))"""
+import os
+import sys
+import select
+import subprocess
+from collections import deque
+from tempfile import SpooledTemporaryFile
+
+from otto import jobserver
+from otto.shell import SPILL_SIZE, command_line, uses_shell
+
+
+class ShellTask(object):
+    """A shell command (or argv list), started by gather()."""
+    def __init__(self, cmd, prefix=None, echo=True, tee=True, tail=100,
+            capture=True, stderr=True, check=True):
+        self.cmd = cmd
+        if prefix is None:
+            prefix = cmd.split(' ', 1)[0] if uses_shell(cmd) else cmd[0]
+        self.prefix = prefix
+        self.echo = echo
+        self.tee = tee
+        self.stderr = stderr
+        self.check = check
+        self.tail = deque(maxlen=tail)
+        self.captured = SpooledTemporaryFile(SPILL_SIZE) if capture else None
+        self.returncode = None
+        self.error = None
+        self._proc = None
+        self._partial = ''
+
+    def start(self):
+        if self.echo:
+            from otto.utils import blue
+            blue("  $ %s" % command_line(self.cmd))
+
+        self._proc = subprocess.Popen(
+                self.cmd,
+                shell=uses_shell(self.cmd),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT if self.stderr else None,
+                **jobserver.popen_options()
+                )
+
+    def fileno(self):
+        return self._proc.stdout.fileno()
+
+    def _line(self, line):
+        self.tail.append(line)
+        if self.tee:
+            from otto.utils import blue_format
+            sys.stdout.write("%s %s" % (blue_format(self.prefix + ' |'), line))
+            if not line.endswith('\n'):
+                sys.stdout.write('\n')
+
+    def read(self):
+        """Handle whatever output is ready, returns False at the end of it."""
+        chunk = os.read(self.fileno(), 65536)
+        if not chunk:
+            if self._partial:
+                self._line(self._partial)
+            self._finish()
+            return False
+
+        if self.captured is not None:
+            self.captured.write(chunk)
+
+        lines = (self._partial + chunk).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line + '\n')
+        if self.tee:
+            sys.stdout.flush()
+        return True
+
+    def _finish(self):
+        self._proc.stdout.close()
+        self.returncode = self._proc.wait()
+        if self.check and self.returncode != 0:
+            self.error = subprocess.CalledProcessError(
+                    self.returncode,
+                    self.cmd,
+                    ''.join(self.tail)
+                    )
+
+    def kill(self):
+        if self._proc is not None and self.returncode is None:
+            self._proc.kill()
+            self._proc.stdout.close()
+            self.returncode = self._proc.wait()
+
+    @property
+    def result(self):
+        """What the command printed if it was captured, else its status."""
+        if self.captured is None:
+            return self.returncode
+        self.captured.seek(0)
+        return self.captured.read()
+
+
+class Gather(object):
+    """A group of tasks to run at the same time, no more than limit at once."""
+    def __init__(self, tasks, limit=None, return_exceptions=False):
+        self.tasks = list(tasks)
+        self.limit = limit
+        self.return_exceptions = return_exceptions
+
+    def run(self):
+        """Run every task and return their results, in order. If any fail
+        the first error is raised, unless return_exceptions is set in which
+        case it takes the place of the result."""
+        pending = list(self.tasks)
+        running = []
+
+        # Every task run alongside another needs a jobserver token
+        server = jobserver.current()
+        tokens = {}
+
+        try:
+            while pending or running:
+                while pending and (not self.limit or len(running) < self.limit):
+                    token = None
+                    if running and server is not None:
+                        token = server.acquire()
+                        if token is None:
+                            break
+                    task = pending.pop(0)
+                    task.start()
+                    running.append(task)
+                    if token is not None:
+                        tokens[task] = token
+
+                waiting = list(running)
+                if pending and server is not None and (
+                        not self.limit or len(running) < self.limit):
+                    waiting.append(server)
+
+                ready, _, _ = select.select(waiting, [], [])
+                for task in ready:
+                    if task is server or task.read():
+                        continue
+                    running.remove(task)
+                    if task in tokens:
+                        server.release(tokens.pop(task))
+        except BaseException:
+            for task in running:
+                task.kill()
+            raise
+        finally:
+            for token in tokens.itervalues():
+                server.release(token)
+
+        results = []
+        for task in self.tasks:
+            if task.error is not None and not self.return_exceptions:
+                raise task.error
+            results.append(task.error or task.result)
+        return results
+
+
+def gather(tasks, limit=None, return_exceptions=False):
+    return Gather(tasks, limit, return_exceptions).run()
+
+
+def drive(coroutine):
+    """Run a generator based cmd (see the module docstring)."""
+    value, error = None, None
+    while True:
+        try:
+            if error is not None:
+                yielded = coroutine.throw(*error)
+            else:
+                yielded = coroutine.send(value)
+        except StopIteration:
+            return
+
+        value, error = None, None
+        try:
+            if isinstance(yielded, ShellTask):
+                value = Gather([yielded]).run()[0]
+            elif isinstance(yielded, Gather):
+                value = yielded.run()
+            else:
+                value = Gather(yielded).run()
+        except Exception:
+            error = sys.exc_info()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+from otto.artifacts import ArtifactCache, cacheable
+
+class TestArtifactCache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        self.cache = ArtifactCache(os.path.join(self.root, 'cache'))
+        self.checkout('a')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root)
+
+    def checkout(self, name):
+        path = os.path.join(self.root, name)
+        os.makedirs(path)
+        os.chdir(path)
+
+    def write(self, path, content):
+        if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as outp:
+            outp.write(content)
+
+    def read(self, path):
+        with open(path, 'r') as inp:
+            return inp.read()
+
+    def test_cacheable(self):
+        self.assertTrue(cacheable(['out', 'gen/']))
+        self.assertFalse(cacheable([]))
+        self.assertFalse(cacheable(['/tmp/out']))
+        self.assertFalse(cacheable(['../out']))
+
+    def test_store_restore(self):
+        key = self.cache.key('p:gen', 'digest')
+        self.assertFalse(self.cache.restore(key, ['out', 'gen']))
+
+        self.write('out', 'out')
+        self.write('gen/sub/file', 'file')
+        self.assertTrue(self.cache.store(key, ['out', 'gen']))
+
+        # Restored in another checkout
+        self.checkout('b')
+        self.write('out', 'stale')
+        self.assertTrue(self.cache.restore(key, ['out', 'gen']))
+        self.assertEqual(self.read('out'), 'out')
+        self.assertEqual(self.read('gen/sub/file'), 'file')
+
+        counters = self.cache.counters()
+        self.assertEqual((counters['hits'], counters['misses']), (1, 1))
+
+    def test_detach(self):
+        key = self.cache.key('p:gen', 'digest')
+        self.write('out', 'out')
+        self.cache.store(key, ['out'])
+        self.cache.restore(key, ['out'])
+
+        # Rewriting a restored output in place mustn't change the cache
+        self.cache.detach(['out'])
+        self.write('out', 'changed')
+        self.checkout('b')
+        self.cache.restore(key, ['out'])
+        self.assertEqual(self.read('out'), 'out')
+
+    def test_evict(self):
+        self.cache.max_size = 35
+        for i in range(3):
+            self.write('out', 'x' * 10)
+            key = self.cache.key('p:gen', str(i))
+            self.cache.store(key, ['out'])
+            entry = self.cache._entry(key)
+            os.utime(entry, (1e9 + i, 1e9 + i))
+
+        # The least recently used entry goes first
+        self.cache.restore(self.cache.key('p:gen', '0'), ['out'])
+        self.write('out', 'x' * 10)
+        self.cache.store(self.cache.key('p:gen', '3'), ['out'])
+
+        self.assertEqual(len(self.cache.entries()), 3)
+        self.assertTrue(os.path.isdir(self.cache._entry(self.cache.key('p:gen', '0'))))
+        self.assertFalse(os.path.isdir(self.cache._entry(self.cache.key('p:gen', '1'))))
+        self.assertEqual(self.cache.counters()['evictions'], 1)
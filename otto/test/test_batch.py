@@ -0,0 +1,68 @@
+import unittest
+import os
+import sys
+import StringIO
+import tempfile
+
+from otto.batch import read_invocations, run_invocation, run_batch
+
+class FakeDispatcher(object):
+    """Records invocations by touching a file named after them."""
+    def __init__(self, root):
+        self.root = root
+
+    def handle(self, cmd, args, tone=True, jobs=1):
+        with open(os.path.join(self.root, '_'.join([cmd] + args)), 'w'):
+            pass
+        if cmd == 'fail':
+            sys.exit(int(args[0]))
+        if cmd == 'crash':
+            raise ValueError(cmd)
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.dispatcher = FakeDispatcher(self.root)
+
+        # Keep the per-invocation reports out of the test output
+        self._real_stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stderr = self._real_stderr
+        for name in os.listdir(self.root):
+            os.remove(os.path.join(self.root, name))
+        os.rmdir(self.root)
+
+    def test_read_invocations(self):
+        lines = StringIO.StringIO("a 1\n\n# skipped\n  b  \n")
+        self.assertEqual(list(read_invocations(lines)), [(1, 'a 1'), (4, 'b')])
+
+        chunks = StringIO.StringIO("a 1\0b\nc\0")
+        self.assertEqual(list(read_invocations(chunks, True)), [(1, 'a 1'), (2, 'b\nc')])
+
+    def test_run_invocation(self):
+        self.assertEqual(run_invocation(self.dispatcher, 'ok "x y"'), 0)
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'ok_x y')))
+
+        self.assertEqual(run_invocation(self.dispatcher, 'fail 4'), 4)
+
+    def test_run_batch(self):
+        lines = StringIO.StringIO("ok 1\nok 2\nok 3\nok 4\n")
+        self.assertEqual(run_batch(self.dispatcher, lines, jobs=2), 0)
+        self.assertEqual(len(os.listdir(self.root)), 4)
+
+    def test_run_batch_failure(self):
+        lines = StringIO.StringIO("ok 1\nfail 3\nok 2\n")
+        self.assertEqual(run_batch(self.dispatcher, lines, jobs=3), 1)
+        self.assertEqual(len(os.listdir(self.root)), 3)
+
+    def test_run_batch_other_children(self):
+        # A child that isn't an invocation (like a tone player) is reaped
+        # along the way and ignored
+        pid = os.fork()
+        if pid == 0:
+            os._exit(5)
+        lines = StringIO.StringIO("ok 1\nok 2\n")
+        self.assertEqual(run_batch(self.dispatcher, lines, jobs=2), 0)
+        self.assertEqual(len(os.listdir(self.root)), 2)
@@ -0,0 +1,114 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+from otto.check import check_all, check_cmd
+
+CMDS = {
+    'good': """import otto.utils as otto
+
+class Good(otto.OttoCmd):
+    deps = ['other']
+
+    def run(self, src, dest=None, *more):
+        print "imports shouldn't print"
+""",
+    'syntax': "class Syntax(\n",
+    'imports': "import not_a_module_anywhere\n",
+    'exits': "import sys\nsys.exit(3)\n",
+    'named': """import otto.utils as otto
+
+class NamedCmd(otto.OttoCmd):
+    def run(self):
+        pass
+""",
+    'abstract': """import otto.utils as otto
+
+class Abstract(otto.OttoCmd):
+    pass
+""",
+    'noself': """import otto.utils as otto
+
+class Noself(otto.OttoCmd):
+    @staticmethod
+    def run():
+        pass
+""",
+    'deps': """import otto.utils as otto
+
+class Deps(otto.OttoCmd):
+    deps = 'other'
+
+    def run(self):
+        pass
+""",
+    }
+
+class TestCheck(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.jobs = []
+        for name, source in sorted(CMDS.iteritems()):
+            path = os.path.join(self.root, name + '.py')
+            with open(path, 'w') as outp:
+                outp.write(source)
+            self.jobs.append(('checkpack', name, path))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def check(self, name):
+        return check_cmd(('checkpack', name, os.path.join(self.root, name + '.py')))
+
+    def test_good(self):
+        result = self.check('good')
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['cmd'], 'checkpack:good')
+        self.assertEqual(result['usage'], 'src [dest] [more...]')
+
+    def test_errors(self):
+        expected = {
+            'syntax': 'syntax error at line',
+            'imports': 'import failed: ImportError',
+            'exits': 'import failed: SystemExit',
+            'named': 'no class Named (found NamedCmd)',
+            'abstract': "Abstract doesn't implement run()",
+            'noself': "run() doesn't take self",
+            'deps': "deps isn't a list of cmd names",
+            }
+        for name, error in expected.iteritems():
+            errors = self.check(name)['errors']
+            self.assertEqual(len(errors), 1, (name, errors))
+            self.assertTrue(errors[0].startswith(error), (name, errors))
+
+    def test_dead_workers(self):
+        # Ways an import can take its worker down with it, or never return
+        sources = {
+            'hardexit': "import os\nos._exit(0)\n",
+            'killed': "import os, signal\nos.kill(os.getpid(), signal.SIGKILL)\n",
+            'hangs': "import time\ntime.sleep(60)\n",
+            }
+        jobs = []
+        for name, source in sorted(sources.iteritems()):
+            path = os.path.join(self.root, name + '.py')
+            with open(path, 'w') as outp:
+                outp.write(source)
+            jobs.append(('checkpack', name, path))
+        jobs.append(self.jobs[0])
+
+        results = check_all(jobs, 2, timeout=1)
+        self.assertEqual([result['errors'] for result in results], [
+            ["timed out after 1 seconds"],
+            ["worker exited with status 0 while importing"],
+            ["worker killed by signal 9"],
+            self.check(self.jobs[0][1])['errors'],
+            ])
+
+    def test_check_all(self):
+        results = check_all(self.jobs, 3)
+        self.assertEqual([result['cmd'] for result in results],
+                ["checkpack:%s" % name for _, name, _ in self.jobs])
+        self.assertEqual([result['cmd'] for result in results if not result['errors']],
+                ['checkpack:good'])
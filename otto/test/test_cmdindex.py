@@ -0,0 +1,91 @@
+import unittest
+import json
+import os
+import os.path
+import shutil
+import tempfile
+
+from otto import CMDS_FILE
+from otto.cmdindex import CmdIndex
+from otto.cmdstore import CmdStore
+
+class TestCmdIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.pack_dir = os.path.join(self.root, 'pack')
+        os.makedirs(self.pack_dir)
+
+        self.cmd_path = os.path.join(self.pack_dir, 'cmd.py')
+        with open(self.cmd_path, 'w') as outp:
+            outp.write('pass\n')
+
+        self.config_path = os.path.join(self.pack_dir, CMDS_FILE)
+        self.write_cmds({'cmd': self.cmd_path})
+
+        self.index_path = os.path.join(self.root, 'cache', 'index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_cmds(self, cmds):
+        with open(self.config_path, 'w') as outp:
+            json.dump({'cmds': cmds}, outp)
+
+    def load_store(self):
+        store = CmdStore()
+        store.init_base({})
+        store.init_index(CmdIndex(self.index_path))
+        store.load_pack('pack', self.pack_dir)
+        store.save_index()
+        return store
+
+    def test_round_trip(self):
+        self.load_store()
+        self.assertTrue(os.path.isfile(self.index_path))
+
+        index = CmdIndex(self.index_path)
+        self.assertEqual(index.get(self.config_path), {'cmd': self.cmd_path})
+
+    def test_stale(self):
+        self.load_store()
+        self.write_cmds({'cmd': self.cmd_path, 'other': self.cmd_path})
+
+        index = CmdIndex(self.index_path)
+        self.assertEqual(index.get(self.config_path), None)
+
+        store = self.load_store()
+        self.assertEqual(set(store.cmds_by_pack['pack']), set(['cmd', 'other']))
+
+    def test_warm_load_skips_pack_config(self):
+        os.utime(self.config_path, (1e9, 1e9))
+        self.load_store()
+
+        # Corrupt the config without changing its size or mtime
+        with open(self.config_path, 'r+') as outp:
+            outp.write('X')
+        os.utime(self.config_path, (1e9, 1e9))
+
+        store = self.load_store()
+        self.assertEqual(store.cmds_by_pack['pack'], {'cmd': self.cmd_path})
+
+    def test_corrupt_index(self):
+        os.makedirs(os.path.dirname(self.index_path))
+        with open(self.index_path, 'w') as outp:
+            outp.write('{not json')
+
+        store = self.load_store()
+        self.assertEqual(store.cmds_by_pack['pack'], {'cmd': self.cmd_path})
+
+    def test_missing_cmd_file(self):
+        self.load_store()
+        os.remove(self.cmd_path)
+
+        # Still listed, as the pack config is unchanged...
+        store = self.load_store()
+        self.assertEqual(store.cmds_by_pack['pack'], {'cmd': self.cmd_path})
+
+        # ... but it's caught before it's imported, and the pack re-read
+        with self.assertRaises(SystemExit):
+            store._load_cmd('cmd', self.cmd_path, 'pack')
+        index = CmdIndex(self.index_path)
+        self.assertEqual(index.get(self.config_path), None)
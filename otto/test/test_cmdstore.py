@@ -31,7 +31,8 @@ class TestCmdStore(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
-        from otto.utils import ConfigFile, info
+        from lament import ConfigFile
+        from otto.utils import info
         info("Cleaning up after CmdStore tests...")
         with ConfigFile('otto/test/.otto/config.json') as config:
             config['packs']['test'] = ''
@@ -130,3 +131,21 @@ class TestCmdStore(unittest.TestCase):
 
         result = self.target.find_pack('fake')
         self.assertEqual(None, result)
+
+    def test_owners(self):
+        with TF() as _file:
+            # Installed cmds shadow base cmds...
+            self.assertEqual('base', self.target.find_pack('new'))
+            self.target._add_cmd('b', 'new', _file.name)
+            self.assertEqual('b', self.target.find_pack('new'))
+
+            # ... ties between installed packs go to the first by name...
+            self.target._add_cmd('a', 'new', _file.name)
+            self.assertEqual('a', self.target.find_pack('new'))
+
+            # ... and local cmds shadow them all
+            self.target._add_cmd('local', 'new', _file.name)
+            self.assertEqual('local', self.target.find_pack('new'))
+
+            del self.target.cmds_by_pack['local']
+            self.assertEqual('a', self.target.find_pack('new'))
@@ -0,0 +1,42 @@
+import unittest
+
+from otto.complete import Trie, candidates
+
+WORDS = [
+    'new',
+    'edit',
+    'pack:cmd',
+    'pack:cmd2',
+    'pack:other',
+    'packing',
+    ]
+
+class TestTrie(unittest.TestCase):
+    def setUp(self):
+        self.trie = Trie()
+        for word in WORDS:
+            self.trie.add(word)
+
+    def test_complete_all(self):
+        self.assertEqual(self.trie.complete(''), sorted(WORDS))
+
+    def test_complete_prefix(self):
+        self.assertEqual(self.trie.complete('pack'), [
+            'pack:cmd', 'pack:cmd2', 'pack:other', 'packing'])
+        self.assertEqual(self.trie.complete('pack:c'), ['pack:cmd', 'pack:cmd2'])
+        self.assertEqual(self.trie.complete('pack:cmd'), ['pack:cmd', 'pack:cmd2'])
+        self.assertEqual(self.trie.complete('pack:cmd2'), ['pack:cmd2'])
+
+    def test_complete_missing(self):
+        self.assertEqual(self.trie.complete('x'), [])
+        self.assertEqual(self.trie.complete('pack:cmd3'), [])
+        self.assertEqual(self.trie.complete('pack:cmd22'), [])
+
+    def test_word_inside_edge(self):
+        # Adding a word that ends part way along an existing edge
+        self.trie.add('pac')
+        self.assertEqual(self.trie.complete('pac')[0], 'pac')
+        self.assertEqual(len(self.trie.complete('pac')), 5)
+
+    def test_options(self):
+        self.assertEqual(candidates(['--no']), ['--no-tone'])
@@ -0,0 +1,140 @@
+import unittest
+import os
+import os.path
+import json
+import shutil
+import tempfile
+
+from otto.utils import config_file, config_session, copytree, rmtree
+
+class TestConfigSession(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'config.json')
+        self._write(self.path, {'packs': {}})
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _write(self, path, config):
+        with open(path, 'w') as outp:
+            json.dump(config, outp)
+
+    def _read(self, path):
+        with open(path, 'r') as inp:
+            return json.load(inp)
+
+    def test_single_write(self):
+        with config_session():
+            with config_file(self.path) as config:
+                config['packs']['a'] = 'a'
+            # Changed on disk underneath the session, which doesn't notice
+            self._write(self.path, {'packs': {'other': 'other'}})
+            with config_file(self.path) as config:
+                self.assertEqual(config['packs'], {'a': 'a'})
+                config['packs']['b'] = 'b'
+            self.assertEqual(self._read(self.path), {'packs': {'other': 'other'}})
+
+        # Merged with the change made outside the session
+        self.assertEqual(
+                self._read(self.path),
+                {'packs': {'a': 'a', 'b': 'b', 'other': 'other'}},
+                )
+
+    def test_unchanged_not_written(self):
+        mtime = int(os.stat(self.path).st_mtime) - 10
+        os.utime(self.path, (mtime, mtime))
+        with config_file(self.path) as config:
+            config.get('packs')
+        self.assertEqual(os.stat(self.path).st_mtime, mtime)
+
+    def test_no_write_on_error(self):
+        try:
+            with config_session():
+                with config_file(self.path) as config:
+                    config['packs']['a'] = 'a'
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(self._read(self.path), {'packs': {}})
+
+        # The failed session is gone
+        with config_file(self.path) as config:
+            self.assertEqual(config, {'packs': {}})
+
+    def test_nested(self):
+        with config_session() as outer:
+            with config_session() as inner:
+                self.assertTrue(inner is outer)
+                with config_file(self.path) as config:
+                    config['packs']['a'] = 'a'
+            self.assertEqual(self._read(self.path), {'packs': {}})
+        self.assertEqual(self._read(self.path), {'packs': {'a': 'a'}})
+
+    def test_create(self):
+        path = os.path.join(self.root, 'new.json')
+        with config_file(path) as config:
+            config['a'] = 1
+        self.assertFalse(os.path.exists(path))
+
+        with config_file(path, True) as config:
+            config['a'] = 1
+        self.assertEqual(self._read(path), {'a': 1})
+
+    def test_missing_dir(self):
+        path = os.path.join(self.root, 'missing', 'config.json')
+        with self.assertRaises(Exception):
+            with config_file(path):
+                pass
+
+    def test_copytree_flushes(self):
+        src = os.path.join(self.root, 'src')
+        os.mkdir(src)
+        src_path = os.path.join(src, 'cmds.json')
+        self._write(src_path, {})
+
+        with config_session():
+            with config_file(src_path) as config:
+                config['cmds'] = {'a': ''}
+            copytree(src, os.path.join(self.root, 'dest'))
+        self.assertEqual(
+                self._read(os.path.join(self.root, 'dest', 'cmds.json')),
+                {'cmds': {'a': ''}},
+                )
+
+    def test_rmtree_discards(self):
+        src = os.path.join(self.root, 'src')
+        os.mkdir(src)
+        src_path = os.path.join(src, 'cmds.json')
+        self._write(src_path, {})
+
+        with config_session():
+            with config_file(src_path) as config:
+                config['cmds'] = {'a': ''}
+            rmtree(src)
+        self.assertFalse(os.path.exists(src))
+
+    def test_read_then_deleted(self):
+        src = os.path.join(self.root, 'src')
+        os.mkdir(src)
+        src_path = os.path.join(src, 'config.json')
+        self._write(src_path, {'packs': {'a': 'a'}})
+
+        # Removed behind the session's back, as `otto install` does
+        with config_session():
+            with config_file(src_path) as config:
+                self.assertEqual(config['packs'], {'a': 'a'})
+            shutil.rmtree(src)
+        self.assertFalse(os.path.exists(src))
+
+    def test_shutil_arguments(self):
+        # User cmds call these with shutil's optional arguments
+        src = os.path.join(self.root, 'src')
+        os.mkdir(src)
+        self._write(os.path.join(src, 'cmds.json'), {})
+        self._write(os.path.join(src, 'cmds.pyc'), {})
+
+        dest = os.path.join(self.root, 'dest')
+        copytree(src, dest, symlinks=True, ignore=shutil.ignore_patterns('*.pyc'))
+        self.assertEqual(os.listdir(dest), ['cmds.json'])
+        rmtree(os.path.join(self.root, 'missing'), ignore_errors=True)
@@ -0,0 +1,86 @@
+import unittest
+import json
+import os
+import shutil
+import socket
+import tempfile
+
+import otto
+import otto.daemon
+from otto.client import send_fds, recv_fds, send_msg, recv_msg
+from otto.cmdstore import CmdStore
+from otto.daemon import OttoServer, relocate
+
+class TestDaemon(unittest.TestCase):
+    def test_pass_fds(self):
+        client, server = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        read_end, write_end = os.pipe()
+        try:
+            send_msg(client, (['-l'], '/tmp', {'A': 'B'}))
+            send_fds(client, [write_end, write_end, write_end])
+
+            self.assertEqual(recv_msg(server), (['-l'], '/tmp', {'A': 'B'}))
+            fds = recv_fds(server, 3)
+            self.assertEqual(len(fds), 3)
+
+            os.write(fds[1], 'hello')
+            self.assertEqual(os.read(read_end, 5), 'hello')
+
+            for fd in fds:
+                os.close(fd)
+        finally:
+            os.close(read_end)
+            os.close(write_end)
+            client.close()
+            server.close()
+
+    def test_relocate(self):
+        old_dir = otto.LOCAL_DIR
+        try:
+            relocate('/somewhere/else')
+            self.assertEqual(otto.LOCAL_DIR, '/somewhere/else/.otto')
+            self.assertEqual(otto.LOCAL_CONFIG, '/somewhere/else/.otto/config.json')
+        finally:
+            relocate(os.path.dirname(old_dir))
+        self.assertEqual(otto.LOCAL_DIR, old_dir)
+
+    def test_is_stale(self):
+        root = tempfile.mkdtemp()
+        check = otto.daemon.CMDS_CHECK
+        try:
+            cmd_path = os.path.join(root, 'cmd.py')
+            config_path = os.path.join(root, otto.CMDS_FILE)
+            with open(cmd_path, 'w') as outp:
+                outp.write("pass\n")
+            with open(config_path, 'w') as outp:
+                json.dump({'cmds': {'cmd': cmd_path}}, outp)
+
+            class Dispatcher(object):
+                def __init__(self, local=True):
+                    store = CmdStore()
+                    store.init_base({})
+                    store.load_pack('pack', root)
+                    self.config = type('Config', (), {'packs': store})
+
+            server = OttoServer(None, Dispatcher, None)
+            server.warm()
+            self.assertFalse(server.is_stale())
+
+            # Cmd files aren't checked on every request...
+            with open(cmd_path, 'a') as outp:
+                outp.write("pass\n")
+            self.assertFalse(server.is_stale())
+
+            # ... only every CMDS_CHECK seconds
+            otto.daemon.CMDS_CHECK = 0
+            self.assertTrue(server.is_stale())
+            server.warm()
+            otto.daemon.CMDS_CHECK = check
+
+            # The pack's config is, though
+            with open(config_path, 'a') as outp:
+                outp.write("\n")
+            self.assertTrue(server.is_stale())
+        finally:
+            otto.daemon.CMDS_CHECK = check
+            shutil.rmtree(root)
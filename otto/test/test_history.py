@@ -0,0 +1,80 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+import otto.history
+from otto.history import Run, Timer, args_hash, percentile, read, summarise
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'history')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_record(self):
+        Timer(self.path).record('p', 'cmd', ['a', u'b'], 0)
+        Timer(self.path).record('p', 'cmd', [], 3)
+
+        runs = list(read(self.path))
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(runs[0].cmd, 'cmd')
+        self.assertEqual(runs[0].args_hash, args_hash(['a', 'b']))
+        self.assertEqual(runs[1].status, 3)
+        self.assertTrue(runs[0].max_rss > 0)
+
+    def test_torn_lines_skipped(self):
+        Timer(self.path).record('p', 'cmd', [], 0)
+        with open(self.path, 'a') as outp:
+            outp.write('123\tp\tcm')
+        self.assertEqual(len(list(read(self.path))), 1)
+
+    def test_rotate(self):
+        real_size = otto.history.MAX_SIZE
+        otto.history.MAX_SIZE = 200
+        try:
+            for i in range(10):
+                Timer(self.path).record('p', 'cmd%d' % i, [], 0)
+        finally:
+            otto.history.MAX_SIZE = real_size
+
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        cmds = [run.cmd for run in read(self.path)]
+        self.assertTrue(len(cmds) < 10)
+        self.assertEqual(cmds, sorted(cmds))
+        self.assertEqual(cmds[-1], 'cmd9')
+
+    def test_rotate_once(self):
+        # Two runs that both saw the log grow past MAX_SIZE
+        with open(self.path, 'w') as outp:
+            outp.write('x' * (otto.history.MAX_SIZE + 1))
+        otto.history.rotate(self.path)
+        Timer(self.path).record('p', 'cmd', [], 0)
+        otto.history.rotate(self.path)
+
+        self.assertEqual(os.path.getsize(self.path + '.1'), otto.history.MAX_SIZE + 1)
+        self.assertEqual([run.cmd for run in read(self.path)], ['cmd'])
+
+    def test_summarise(self):
+        runs = [Run(i, 'p', 'slow', '0', 1.0 + i / 10.0, 0.5, 1024, i % 4 == 0)
+                for i in range(40)]
+        runs.append(Run(0, 'q', 'fast', '0', 0.1, 0.1, 2048, 0))
+
+        summaries = summarise(runs)
+        slow = summaries['p:slow']
+        self.assertEqual(slow.runs, 40)
+        self.assertEqual(slow.failures, 10)
+        self.assertEqual(slow.wall(0.5), 3.0)
+        self.assertEqual(slow.wall(0.99), 4.9)
+        self.assertAlmostEqual(slow.trend(), 4.0 / 2.0 - 1, 1)
+        self.assertEqual(summaries['q:fast'].trend(), None)
+
+        self.assertEqual(summarise(runs, set(['fast'])).keys(), ['q:fast'])
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 0.5), 0.0)
+        self.assertEqual(percentile([1, 2, 3], 0.5), 2)
+        self.assertEqual(percentile([1, 2, 3], 1), 3)
@@ -0,0 +1,108 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+
+from os.path import abspath, dirname, join
+from shutil import rmtree
+
+ROOT_DIR = dirname(dirname(dirname(abspath(__file__))))
+BIN = join(ROOT_DIR, 'bin', 'otto')
+
+# Never needed just to list cmds
+LIST_BUDGET = set([
+    'subprocess',
+    'getpass',
+    'shutil',
+    'otto.cmds',
+    ])
+
+# Never needed just to print the version
+VERSION_BUDGET = LIST_BUDGET | set([
+    'json',
+    'lament',
+    'otto.utils',
+    'otto.config',
+    'otto.cmdstore',
+    ])
+
+VERSION_SCRIPT = """
+import runpy, sys
+sys.argv = ['otto', '-V']
+runpy.run_path(%r, run_name='__main__')
+sys.stderr.write('\\n'.join(sys.modules))
+""" % BIN
+
+LIST_SCRIPT = """
+import imp, sys
+otto_bin = imp.load_source('otto_bin', %r)
+otto_bin.main(['-l'])
+sys.stderr.write('\\n'.join(sys.modules))
+""" % BIN
+
+class TestImports(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        self.cwd = join(self.home, 'project')
+
+        # A global pack and a local one for `otto -l` to read
+        global_pack = join(self.home, '.otto', 'tools')
+        local_pack = join(self.cwd, '.otto', 'local')
+        self.write(join(self.home, '.otto', 'config.json'), {'packs': {'tools': global_pack}})
+        self.write(join(global_pack, 'cmds.json'), {'cmds': {'lint': join(global_pack, 'lint.py')}})
+        self.write(join(self.cwd, '.otto', 'config.json'), {'packs': {'local': local_pack}})
+        self.write(join(local_pack, 'cmds.json'), {'cmds': {'build': join(local_pack, 'build.py')}})
+        for path in (join(global_pack, 'lint.py'), join(local_pack, 'build.py')):
+            open(path, 'w').close()
+
+    def tearDown(self):
+        rmtree(self.home)
+
+    def write(self, path, config):
+        import json
+        if not os.path.isdir(dirname(path)):
+            os.makedirs(dirname(path))
+        with open(path, 'w') as outp:
+            json.dump(config, outp)
+
+    def imported_by(self, script):
+        python_path = os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get('PYTHONPATH')]))
+        env = dict(os.environ, HOME=self.home, PYTHONPATH=python_path)
+        proc = subprocess.Popen(
+                [sys.executable, '-c', script],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.cwd,
+                env=env,
+                )
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        self.output = out
+        return set(err.splitlines())
+
+    def test_version_budget(self):
+        modules = self.imported_by(VERSION_SCRIPT)
+        self.assertEqual(modules & VERSION_BUDGET, set())
+
+    def test_list_budget(self):
+        modules = self.imported_by(LIST_SCRIPT)
+        self.assertTrue('lint' in self.output and 'build' in self.output, self.output)
+        self.assertEqual(modules & LIST_BUDGET, set())
+
+    def test_base_cmds(self):
+        # BASE_CMDS lets otto know the base cmds without importing otto.cmds,
+        # so it's kept by hand: every entry has to load the cmd it names...
+        import otto.cmds
+        from otto.base import BASE_CMDS
+        from otto.utils import isOttoCmd
+        for name, base_cmd in BASE_CMDS.iteritems():
+            cmd_class = base_cmd.load()
+            self.assertTrue(isOttoCmd(cmd_class), name)
+            self.assertEqual(cmd_class._name(), name)
+
+        # ...and every cmd in otto.cmds has to have an entry
+        for value in vars(otto.cmds).itervalues():
+            if isOttoCmd(value) and value.__module__ == otto.cmds.__name__:
+                self.assertTrue(value._name() in BASE_CMDS,
+                        "%s isn't in BASE_CMDS" % value._name())
@@ -0,0 +1,85 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+import otto.incremental
+from otto.incremental import State, expand, fingerprint, outputs_exist
+
+class Cmd(object):
+    inputs = ['src', '*.txt']
+    outputs = ['out']
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.root)
+        os.makedirs('src/sub')
+        for path in ['src/a', 'src/sub/b', 'c.txt', 'd.py']:
+            self.write(path, path)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root)
+
+    def write(self, path, content, mtime=1e9):
+        with open(path, 'w') as outp:
+            outp.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def test_expand(self):
+        self.assertEqual(expand(Cmd.inputs), ['c.txt', 'src/a', 'src/sub/b'])
+        self.assertEqual(expand(['missing/*']), [])
+
+    def test_fingerprint(self):
+        digest, files = fingerprint(Cmd, ['x'], 'd.py')
+        self.assertEqual(sorted(files), ['c.txt', 'd.py', 'src/a', 'src/sub/b'])
+
+        # Same inputs, same fingerprint. Args from remember are unicode
+        self.assertEqual(fingerprint(Cmd, [u'x'], 'd.py')[0], digest)
+
+        # Different args, source or inputs change it
+        self.assertNotEqual(fingerprint(Cmd, ['y'], 'd.py')[0], digest)
+        self.write('d.py', 'changed')
+        self.assertNotEqual(fingerprint(Cmd, ['x'], 'd.py')[0], digest)
+        self.write('d.py', 'd.py')
+        self.write('src/sub/new', '')
+        self.assertNotEqual(fingerprint(Cmd, ['x'], 'd.py')[0], digest)
+
+    def test_known_digests_reused(self):
+        _, known = fingerprint(Cmd, [])
+        reads = []
+        real_digest = otto.incremental.file_digest
+        otto.incremental.file_digest = lambda path: reads.append(path) or real_digest(path)
+        try:
+            # Only files whose stat changed are read
+            self.write('src/a', 'changed', 1e9 + 1)
+            fingerprint(Cmd, [], None, known)
+            self.assertEqual(reads, ['src/a'])
+        finally:
+            otto.incremental.file_digest = real_digest
+
+    def test_recent_files_reread(self):
+        with open('c.txt', 'w') as outp:
+            outp.write('now')
+        _, files = fingerprint(Cmd, [])
+        self.assertEqual(files['c.txt'][0], None)
+
+    def test_outputs_exist(self):
+        self.assertFalse(outputs_exist(Cmd))
+        self.write('out', '')
+        self.assertTrue(outputs_exist(Cmd))
+
+    def test_state(self):
+        path = os.path.join(self.root, '.otto', 'state')
+        first, second = State(path), State(path)
+        self.assertEqual(first.get('p:a'), (None, {}))
+
+        first.put('p:a', 'digest-a', {'f': (1, 2, 'd')})
+        second.put('p:b', 'digest-b', {})
+
+        state = State(path)
+        self.assertEqual(state.get('p:a'), ('digest-a', {'f': (1, 2, 'd')}))
+        self.assertEqual(state.get('p:b'), ('digest-b', {}))
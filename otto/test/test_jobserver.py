@@ -0,0 +1,121 @@
+import unittest
+import os
+import time
+import shutil
+import tempfile
+
+import otto.jobserver
+from otto.jobserver import JobServer, setup
+from otto.scheduler import Scheduler
+from otto.utils import fork_call
+
+class TestJobServer(unittest.TestCase):
+    def setUp(self):
+        self._makeflags = os.environ.get('MAKEFLAGS')
+        self._current = otto.jobserver._current[:]
+        otto.jobserver._current[:] = []
+        os.environ.pop('MAKEFLAGS', None)
+
+    def tearDown(self):
+        server = otto.jobserver._current[0] if otto.jobserver._current else None
+        if server is not None and server.read_fd != server.write_fd:
+            for fd in (server.read_fd, server.write_fd, server._poll_fd):
+                if fd is not None:
+                    os.close(fd)
+
+        otto.jobserver._current[:] = self._current
+        if self._makeflags is None:
+            os.environ.pop('MAKEFLAGS', None)
+        else:
+            os.environ['MAKEFLAGS'] = self._makeflags
+
+    def test_from_makeflags(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            for flags in ['-j4 --jobserver-auth=%d,%d', 'w --jobserver-fds=%d,%d -j']:
+                server = JobServer.from_makeflags(flags % (read_fd, write_fd))
+                self.assertEqual((server.read_fd, server.write_fd), (read_fd, write_fd))
+                os.close(server._poll_fd)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+        # make didn't pass the fds on
+        self.assertEqual(JobServer.from_makeflags('--jobserver-auth=%d,%d' % (read_fd, write_fd)), None)
+        self.assertEqual(JobServer.from_makeflags('-k'), None)
+
+    def test_fifo(self):
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, 'fifo')
+            os.mkfifo(path)
+            server = JobServer.from_makeflags('-j2 --jobserver-auth=fifo:%s' % path)
+            server.release('+')
+            self.assertEqual(server.acquire(), '+')
+            self.assertEqual(server.acquire(), None)
+            os.close(server.read_fd)
+            os.close(server._poll_fd)
+        finally:
+            shutil.rmtree(root)
+
+    def test_setup(self):
+        self.assertEqual(setup(None), 1)
+        self.assertEqual(otto.jobserver.current(), None)
+
+        self.assertEqual(setup(3), 3)
+        server = otto.jobserver.current()
+        self.assertTrue('--jobserver-auth=%d,%d' % (server.read_fd, server.write_fd)
+                in os.environ['MAKEFLAGS'])
+
+        # Two tokens, the third job runs in our own slot
+        tokens = [server.acquire(), server.acquire()]
+        self.assertEqual(tokens, ['+', '+'])
+        self.assertEqual(server.acquire(), None)
+        for token in tokens:
+            server.release(token)
+
+        # A nested otto joins it, and runs as many jobs as it allows
+        otto.jobserver._current[:] = []
+        self.assertEqual(setup(None), 3)
+        nested = otto.jobserver.current()
+        self.assertEqual(nested.read_fd, server.read_fd)
+        os.close(nested._poll_fd)
+
+        # Under a bare `make -j` only the tokens limit it
+        os.environ['MAKEFLAGS'] = 'k -j --jobserver-auth=%d,%d' % (
+                server.read_fd, server.write_fd)
+        otto.jobserver._current[:] = []
+        self.assertEqual(setup(None), None)
+        self.assertEqual(setup(2), 2)
+        os.close(otto.jobserver.current()._poll_fd)
+        otto.jobserver._current[:] = [server]
+
+    def test_popen_options(self):
+        import subprocess
+        setup(2)
+        server = otto.jobserver.current()
+        with tempfile.TemporaryFile() as private:
+            child = subprocess.Popen(['sh', '-c', 'ls /proc/$$/fd'],
+                    stdout=subprocess.PIPE, **otto.jobserver.popen_options())
+            fds = set(int(fd) for fd in child.communicate()[0].split())
+            self.assertFalse(private.fileno() in fds)
+
+        # Only stdio and the jobserver's fds are passed on
+        self.assertEqual(fds, set([0, 1, 2, server.read_fd, server.write_fd]))
+
+    def test_scheduler_shares_tokens(self):
+        setup(2)
+        deps = dict((node, []) for node in 'abcd')
+        start = lambda node: fork_call(time.sleep, 0.3)
+
+        begin = time.time()
+        statuses = Scheduler(deps, jobs=None).run(start)
+        elapsed = time.time() - begin
+
+        self.assertEqual(set(statuses.values()), set([0]))
+        self.assertTrue(0.55 < elapsed < 1.0, elapsed)
+
+        # Every token was given back
+        server = otto.jobserver.current()
+        self.assertEqual(server.acquire(), '+')
+        self.assertEqual(server.acquire(), None)
@@ -0,0 +1,77 @@
+import unittest
+import os
+import os.path
+import sys
+import shutil
+import tempfile
+
+from otto.loader import load_source, load_code, import_cmd
+
+class TestLoader(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.pack_dir = os.path.join(self.root, 'pack')
+        self.cache_dir = os.path.join(self.root, 'cache')
+        os.makedirs(self.pack_dir)
+        self.cmd_path = os.path.join(self.pack_dir, 'cmd.py')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_cmd(self, source, mtime):
+        with open(self.cmd_path, 'w') as outp:
+            outp.write(source)
+        os.utime(self.cmd_path, (mtime, mtime))
+
+    def cache_entries(self):
+        return [files for _, _, files in os.walk(self.cache_dir) if files]
+
+    def test_load_source(self):
+        self.write_cmd("VALUE = 1\n", 1e9)
+        module = load_source('otto_test_cmd', self.cmd_path, self.cache_dir)
+
+        self.assertEqual(module.VALUE, 1)
+        self.assertEqual(module.__file__, self.cmd_path)
+        self.assertEqual(os.listdir(self.pack_dir), ['cmd.py'])
+        self.assertEqual(len(self.cache_entries()), 1)
+
+    def test_source_changed(self):
+        self.write_cmd("VALUE = 1\n", 1e9)
+        load_source('otto_test_cmd', self.cmd_path, self.cache_dir)
+
+        self.write_cmd("VALUE = 2\n", 1e9 + 1)
+        module = load_source('otto_test_cmd', self.cmd_path, self.cache_dir)
+        self.assertEqual(module.VALUE, 2)
+
+        # Only the latest entry is kept
+        self.assertEqual(len(self.cache_entries()), 1)
+
+    def test_syntax_error(self):
+        self.write_cmd("class Broken(\n", 1e9)
+        with self.assertRaises(SyntaxError):
+            load_code(self.cmd_path, self.cache_dir)
+
+    def test_import_cmd_cached(self):
+        self.write_cmd("import random\nVALUE = random.random()\n", 1e9)
+        first = import_cmd('pack', 'cmd', self.cmd_path, self.cache_dir)
+        second = import_cmd('pack', 'cmd', self.cmd_path, self.cache_dir)
+
+        self.assertTrue(first is second)
+        self.assertTrue(sys.modules['otto_packs.pack.cmd'] is first)
+        self.assertTrue(sys.modules['otto_packs.pack'].cmd is first)
+
+        # Changing the source causes a reload
+        self.write_cmd("VALUE = 3\n", 1e9 + 1)
+        third = import_cmd('pack', 'cmd', self.cmd_path, self.cache_dir)
+        self.assertEqual(third.VALUE, 3)
+
+    def test_import_cmd_namespaced(self):
+        other_path = os.path.join(self.root, 'other.py')
+        with open(other_path, 'w') as outp:
+            outp.write("VALUE = 'other'\n")
+        self.write_cmd("VALUE = 'pack'\n", 1e9)
+
+        first = import_cmd('pack', 'cmd', self.cmd_path, self.cache_dir)
+        second = import_cmd('other', 'cmd', other_path, self.cache_dir)
+        self.assertEqual(first.VALUE, 'pack')
+        self.assertEqual(second.VALUE, 'other')
@@ -0,0 +1,84 @@
+import unittest
+import os
+import os.path
+import json
+import shutil
+import tempfile
+
+from otto.incremental import State
+from otto.locking import atomic_write
+from otto.utils import config_file, merge_config
+
+PROCS = 8
+WRITES = 25
+
+def _fork(func):
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            func()
+            status = 0
+        finally:
+            os._exit(status)
+    return pid
+
+def _wait_all(pids):
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        if status != 0:
+            return False
+    return True
+
+class TestLocking(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'cmds.json')
+        atomic_write(self.path, json.dumps({'cmds': {}}))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_merge_config(self):
+        base = {'packs': {'a': 'a', 'b': 'b'}, 'x': 1}
+        ours = {'packs': {'a': 'a2', 'c': 'c'}, 'x': 1}
+        theirs = {'packs': {'a': 'a', 'b': 'b', 'd': 'd'}, 'x': 2, 'y': 3}
+        self.assertEqual(merge_config(base, ours, theirs), {
+            'packs': {'a': 'a2', 'c': 'c', 'd': 'd'},
+            'x': 2,
+            'y': 3,
+            })
+
+    def test_concurrent_config_writes(self):
+        def _writer(n):
+            for i in range(WRITES):
+                with config_file(self.path) as config:
+                    config.setdefault('cmds', {})["%d-%d" % (n, i)] = ''
+
+        def _reader():
+            for _ in range(PROCS * WRITES):
+                with open(self.path, 'r') as inp:
+                    json.load(inp)
+
+        pids = [_fork(lambda n=n: _writer(n)) for n in range(PROCS)]
+        pids.append(_fork(_reader))
+        self.assertTrue(_wait_all(pids))
+
+        with open(self.path, 'r') as inp:
+            cmds = json.load(inp)['cmds']
+        self.assertEqual(len(cmds), PROCS * WRITES)
+        self.assertEqual(
+                [name for name in os.listdir(self.root) if name.endswith('.tmp')],
+                [],
+                )
+
+    def test_concurrent_state(self):
+        path = os.path.join(self.root, 'state')
+
+        def _writer(n):
+            for i in range(WRITES):
+                State(path).put("%d-%d" % (n, i), 'digest', {})
+
+        pids = [_fork(lambda n=n: _writer(n)) for n in range(PROCS)]
+        self.assertTrue(_wait_all(pids))
+        self.assertEqual(len(State(path).cmds), PROCS * WRITES)
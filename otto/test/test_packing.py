@@ -0,0 +1,196 @@
+import unittest
+import os
+import os.path
+import json
+import shutil
+import tarfile
+import tempfile
+from cStringIO import StringIO
+
+from otto import CMDS_FILE
+from otto.packing import install_pack, pack
+
+class TestPacking(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'local')
+        os.makedirs(os.path.join(self.src, 'lib'))
+        self.write('cmd.py', "pass\n", 1e9)
+        self.write('cmd.pyc', "compiled", 1e9)
+        self.write('lib/helper.py', "pass\n", 1e9)
+        self.write(CMDS_FILE, json.dumps(
+            {'cmds': {'cmd': os.path.join(self.src, 'cmd.py')}}), 1e9)
+        self.path = os.path.join(self.root, 'out.opack')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, data, mtime):
+        path = os.path.join(self.src, name)
+        with open(path, 'w') as outp:
+            outp.write(data)
+        os.utime(path, (mtime, mtime))
+
+    def read(self, path):
+        with open(path, 'rb') as inp:
+            return inp.read()
+
+    def test_layout(self):
+        pack(self.path, self.src, 'mine')
+        with tarfile.open(self.path, 'r:gz') as tar:
+            self.assertEqual(tar.getnames(), [
+                'pack_root',
+                'pack_root/config.json',
+                'pack_root/mine',
+                'pack_root/mine/cmds.json',
+                'pack_root/mine/cmd.py',
+                'pack_root/mine/lib',
+                'pack_root/mine/lib/helper.py',
+                ])
+            cmds = json.load(tar.extractfile('pack_root/mine/cmds.json'))
+            self.assertEqual(cmds, {'cmds': {'cmd': 'pack_root/mine/cmd.py'}})
+            config = json.load(tar.extractfile('pack_root/config.json'))
+            self.assertEqual(config, {'packs': {'mine': 'pack_root/mine'}})
+            self.assertEqual(tar.extractfile('pack_root/mine/cmd.py').read(), "pass\n")
+
+    def test_reproducible(self):
+        pack(self.path, self.src, 'mine')
+        first = self.read(self.path)
+
+        self.write('cmd.py', "pass\n", 2e9)
+        os.chmod(os.path.join(self.src, 'lib', 'helper.py'), 0600)
+        pack(self.path, self.src, 'mine')
+        self.assertEqual(self.read(self.path), first)
+
+    def test_compression(self):
+        pack(self.path, self.src, 'mine', 'bz2', 1)
+        with tarfile.open(self.path, 'r:bz2') as tar:
+            self.assertTrue('pack_root/mine/cmd.py' in tar.getnames())
+
+        pack(self.path, self.src, 'mine', 'none')
+        with tarfile.open(self.path, 'r:') as tar:
+            self.assertTrue('pack_root/mine/cmd.py' in tar.getnames())
+
+    def test_bad_compression(self):
+        for compression, level in (('zip', None), ('gz', 10), ('bz2', 0)):
+            self.assertRaises(ValueError, pack,
+                    self.path, self.src, 'mine', compression, level)
+        self.assertEqual(os.listdir(self.root), ['local'])
+
+
+class TestInstall(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.dest = os.path.join(self.root, 'global')
+        os.mkdir(self.dest)
+        self.path = os.path.join(self.root, 'in.opack')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_archive(self, members, mode='w:gz'):
+        """members is a list of (name, data), data is None for directories."""
+        with tarfile.open(self.path, mode) as tar:
+            for name, data in members:
+                info = tarfile.TarInfo(name)
+                if data is None:
+                    info.type = tarfile.DIRTYPE
+                    tar.addfile(info)
+                else:
+                    info.size = len(data)
+                    tar.addfile(info, StringIO(data))
+
+    def config(self, *pack_names):
+        return json.dumps({'packs': dict((name, name) for name in pack_names)})
+
+    def cmds(self, *cmd_names):
+        return json.dumps({'cmds': dict((name, name + '.py') for name in cmd_names)})
+
+    def test_round_trip(self):
+        src = os.path.join(self.root, 'local')
+        os.makedirs(os.path.join(src, 'lib'))
+        for name in ('cmd.py', 'lib/helper.py'):
+            with open(os.path.join(src, name), 'w') as outp:
+                outp.write("pass\n")
+        with open(os.path.join(src, CMDS_FILE), 'w') as outp:
+            outp.write(self.cmds('cmd'))
+        pack(self.path, src, 'mine', 'bz2')
+
+        pack_name, pack_dir = install_pack(self.path, self.dest)
+        self.assertEqual((pack_name, pack_dir), ('mine', os.path.join(self.dest, 'mine')))
+        self.assertEqual(sorted(os.listdir(pack_dir)), ['cmd.py', 'cmds.json', 'lib'])
+        with open(os.path.join(pack_dir, CMDS_FILE)) as inp:
+            self.assertEqual(json.load(inp),
+                    {'cmds': {'cmd': os.path.join(pack_dir, 'cmd.py')}})
+        self.assertEqual(os.listdir(self.dest), ['mine'])
+
+        self.assertRaises(ValueError, install_pack, self.path, self.dest)
+
+    def test_choose(self):
+        self.make_archive([
+            ('pack_root/config.json', self.config('a', 'b')),
+            ('pack_root/a/cmds.json', self.cmds('one')),
+            ('pack_root/a/one.py', "pass\n"),
+            ('pack_root/b/cmds.json', self.cmds('two')),
+            ('pack_root/b/two.py', "pass\n"),
+            ])
+        offered = []
+        def choose(pack_names):
+            offered.append(pack_names)
+            return 'b'
+
+        self.assertEqual(install_pack(self.path, self.dest, choose)[0], 'b')
+        self.assertEqual(offered, [['a', 'b']])
+        self.assertEqual(os.listdir(self.dest), ['b'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.dest, 'b'))),
+                ['cmds.json', 'two.py'])
+
+    def test_old_archive(self):
+        # As packed with `tar -czf`, ROOT_FILE isn't necessarily first
+        self.make_archive([
+            ('./pack_root/', None),
+            ('./pack_root/old/', None),
+            ('./pack_root/old/cmd.py', "pass\n"),
+            ('./pack_root/old/cmds.json', self.cmds('cmd')),
+            ('./pack_root/config.json', self.config('old')),
+            ])
+        pack_name, pack_dir = install_pack(self.path, self.dest)
+        self.assertEqual(pack_name, 'old')
+        self.assertEqual(sorted(os.listdir(pack_dir)), ['cmd.py', 'cmds.json'])
+
+    def test_unsafe(self):
+        unsafe = [
+            [('pack_root/config.json', self.config('a')),
+                ('pack_root/a/../../escaped.py', "pass\n")],
+            [('pack_root/config.json', self.config('a')),
+                ('/tmp/escaped.py', "pass\n")],
+            [('pack_root/config.json', self.config('../a'))],
+            ]
+        for members in unsafe:
+            self.make_archive(members)
+            self.assertRaises(ValueError, install_pack, self.path, self.dest)
+            self.assertEqual(os.listdir(self.dest), [])
+
+        with tarfile.open(self.path, 'w') as tar:
+            link = tarfile.TarInfo('pack_root/a/link')
+            link.type = tarfile.SYMTYPE
+            link.linkname = '/etc'
+            tar.addfile(link)
+        self.assertRaises(ValueError, install_pack, self.path, self.dest)
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'escaped.py')))
+
+    def test_conflicts(self):
+        conflicting = [
+            # A file where a directory is needed
+            [('pack_root/a/lib', "pass\n"), ('pack_root/a/lib/helper.py', "pass\n")],
+            # And the other way around
+            [('pack_root/a/lib/', None), ('pack_root/a/lib', "pass\n")],
+            [('pack_root/a/cmds.json/', None)],
+            ]
+        scratch = os.path.join(self.root, 'scratch')
+        os.mkdir(scratch)
+        for members in conflicting:
+            self.make_archive([('pack_root/config.json', self.config('a'))] + members)
+            self.assertRaises(ValueError, install_pack, self.path, self.dest, None, scratch)
+            self.assertEqual(os.listdir(self.dest), [])
+            self.assertEqual(os.listdir(scratch), [])
@@ -0,0 +1,92 @@
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+import otto.scanner
+from otto import CMDS_FILE
+from otto.scanner import Journal, cmd_names, find_packs, scan_all
+
+CMD_SOURCE = """import otto.utils as otto
+
+class Helper(object):
+    pass
+
+class Build(otto.OttoCmd):
+    '''class Fake(otto.OttoCmd):'''
+
+# Not loadable as a cmd, see isOttoCmd
+class Release(Build):
+    pass
+"""
+
+class TestScanner(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.journal = Journal(os.path.join(self.root, 'journal'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_pack(self, *parts, **cmds):
+        pack_dir = os.path.join(self.root, *parts)
+        os.makedirs(pack_dir)
+        open(os.path.join(pack_dir, CMDS_FILE), 'w').close()
+        for name, source in cmds.iteritems():
+            with open(os.path.join(pack_dir, name + '.py'), 'w') as outp:
+                outp.write(source)
+        return pack_dir
+
+    def test_cmd_names(self):
+        pack_dir = self.make_pack('pack', build=CMD_SOURCE)
+        path = os.path.join(pack_dir, 'build.py')
+        self.assertEqual(cmd_names(path), ['build'])
+
+    def test_syntax_error(self):
+        pack_dir = self.make_pack('pack', broken="class Broken(otto.OttoCmd):\n    def (\n")
+        path = os.path.join(pack_dir, 'broken.py')
+        self.assertEqual(cmd_names(path), ['broken'])
+
+    def test_find_packs(self):
+        a = self.make_pack('a')
+        b = self.make_pack('nested', 'b')
+        os.makedirs(os.path.join(self.root, 'empty'))
+        self.make_pack('_cache', 'c')
+
+        old_cache, otto.scanner.CACHE_DIR = (
+                otto.scanner.CACHE_DIR, os.path.join(self.root, '_cache'))
+        try:
+            self.assertEqual(find_packs(self.root), {'a': a, 'b': b})
+        finally:
+            otto.scanner.CACHE_DIR = old_cache
+
+    def test_journal(self):
+        pack_dir = self.make_pack('pack', build=CMD_SOURCE)
+        path = os.path.join(pack_dir, 'build.py')
+        os.utime(path, (1e9, 1e9))
+
+        self.assertEqual(scan_all([self.root], self.journal)[self.root]['pack'],
+                (pack_dir, {'build': path}))
+        self.journal.save()
+
+        # Change the file without changing its size or mtime
+        with open(path, 'r+') as outp:
+            outp.write(CMD_SOURCE.replace('Build', 'Xuild'))
+        os.utime(path, (1e9, 1e9))
+
+        journal = Journal(self.journal.path)
+        self.assertEqual(journal.names(path, os.stat(path)), ['build'])
+
+        os.utime(path, (2e9, 2e9))
+        self.assertEqual(journal.names(path, os.stat(path)), ['xuild'])
+
+    def test_scan_all(self):
+        other = os.path.join(self.root, 'other')
+        local = self.make_pack('local', cmd="class Cmd(OttoCmd): pass\n")
+        remote = self.make_pack('other', 'remote', cmd="class Cmd(OttoCmd): pass\n")
+
+        scans = scan_all([local, other], self.journal)
+        self.assertEqual(set(scans[local]), set(['local']))
+        self.assertEqual(scans[other]['remote'],
+                (remote, {'cmd': os.path.join(remote, 'cmd.py')}))
@@ -0,0 +1,79 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from otto.scheduler import CANCELLED, Scheduler, find_cycle, resolve
+from otto.utils import fork_call
+
+class FakeCmd(object):
+    def __init__(self, deps):
+        self.deps = deps
+
+class FakeStore(object):
+    """Just enough of a CmdStore for resolve(), every cmd is in pack p."""
+    def __init__(self, deps):
+        self.cmds_by_pack = {'p': dict((cmd, cmd) for cmd in deps)}
+        self.deps = deps
+
+    def lookup(self, name):
+        return 'p', name.split(':')[-1]
+
+    def _load_cmd(self, cmd_name, cmd_ref, pack_name=None):
+        return FakeCmd(self.deps[cmd_name])
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def touch(self, node, status=0):
+        with open(os.path.join(self.root, node), 'w'):
+            pass
+        return status
+
+    def ran(self):
+        return sorted(os.listdir(self.root))
+
+    def test_resolve(self):
+        store = FakeStore({'all': ['build', 'docs'], 'build': ['gen'],
+            'docs': ['gen'], 'gen': []})
+        root, deps = resolve(store, 'all')
+
+        self.assertEqual(root, ('p', 'all'))
+        self.assertEqual(sorted(deps[root]), [('p', 'build'), ('p', 'docs')])
+        self.assertEqual(deps[('p', 'gen')], [])
+
+    def test_find_cycle(self):
+        self.assertEqual(find_cycle({'a': ['b'], 'b': ['c'], 'c': []}), None)
+        self.assertEqual(find_cycle({'a': ['b'], 'b': ['c'], 'c': ['b']}),
+                ['b', 'c', 'b'])
+        self.assertEqual(find_cycle({'a': ['a']}), ['a', 'a'])
+
+    def test_run(self):
+        deps = {'a': [], 'b': ['a'], 'c': ['a'], 'd': ['b', 'c']}
+        order = []
+
+        def _start(node):
+            # Everything a node depends on has finished before it starts
+            for dep in deps[node]:
+                self.assertTrue(os.path.exists(os.path.join(self.root, dep)))
+            order.append(node)
+            return fork_call(self.touch, node)
+
+        statuses = Scheduler(deps, jobs=2).run(_start)
+        self.assertEqual(statuses, {'a': 0, 'b': 0, 'c': 0, 'd': 0})
+        self.assertEqual(order[0], 'a')
+        self.assertEqual(order[-1], 'd')
+        self.assertEqual(self.ran(), ['a', 'b', 'c', 'd'])
+
+    def test_failure_cancels_downstream(self):
+        deps = {'a': [], 'b': ['a'], 'c': [], 'd': ['b', 'c']}
+        start = lambda node: fork_call(self.touch, node, 3 if node == 'b' else 0)
+
+        statuses = Scheduler(deps, jobs=4).run(start)
+        self.assertEqual(statuses,
+                {'a': 0, 'b': 3, 'c': 0, 'd': CANCELLED})
+        self.assertEqual(self.ran(), ['a', 'b', 'c'])
@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+import time
+import StringIO
+from subprocess import CalledProcessError
+
+import otto.jobserver
+import otto.shell
+from otto.shell import ShellStream, command_line, run
+from otto.utils import shell
+
+class TestShell(unittest.TestCase):
+    def test_shell(self):
+        self.assertEqual(shell('echo hi', echo=False), 'hi\n')
+
+        # Output is still returned when the command fails
+        self.assertEqual(shell('echo hi; exit 3', echo=False), 'hi\n')
+
+    def test_argv(self):
+        # No shell, so no quoting or expansion
+        self.assertEqual(shell(['echo', 'a  b', '$HOME'], echo=False), 'a  b $HOME\n')
+        self.assertEqual(run(['sh', '-c', 'exit 3']), (3, ''))
+        self.assertEqual(command_line(['echo', 'a b']), "echo 'a b'")
+
+        with self.assertRaises(OSError):
+            shell(['otto-no-such-cmd'], echo=False)
+
+    def test_argv_without_posix_spawn(self):
+        real_funcs = otto.shell._spawn_funcs[:]
+        otto.shell._spawn_funcs[:] = [None]
+        try:
+            self.assertEqual(run(['echo', 'a b']), (0, 'a b\n'))
+        finally:
+            otto.shell._spawn_funcs[:] = real_funcs
+
+    def test_argv_fds(self):
+        with open(os.devnull) as private:
+            status, outp = run(['sh', '-c', 'ls /proc/$$/fd'])
+            fds = set(int(fd) for fd in outp.split())
+            self.assertFalse(private.fileno() in fds)
+
+        # Only stdio and the jobserver's fds, if any, are passed on
+        self.assertEqual(fds, set([0, 1, 2]) | otto.jobserver.shared_fds())
+
+    def test_lines(self):
+        with ShellStream('printf "a\\nb\\nc"', echo=False) as lines:
+            self.assertEqual(list(lines), ['a\n', 'b\n', 'c'])
+            self.assertEqual(lines.returncode, 0)
+
+    def test_lines_as_produced(self):
+        with ShellStream('echo a; sleep 5; echo b', echo=False) as lines:
+            start = time.time()
+            self.assertEqual(next(iter(lines)), 'a\n')
+            self.assertTrue(time.time() - start < 4)
+        # The command is killed when a stream is closed early
+        self.assertTrue(time.time() - start < 4)
+        self.assertNotEqual(lines.returncode, 0)
+
+    def test_stream_argv(self):
+        with ShellStream(['printf', '%s\\n', 'a b', 'c'], echo=False) as lines:
+            self.assertEqual(list(lines), ['a b\n', 'c\n'])
+
+    def test_chunks(self):
+        with ShellStream('head -c 10000 /dev/zero', echo=False,
+                chunk_size=4096) as chunks:
+            sizes = [len(chunk) for chunk in chunks]
+        self.assertEqual(sum(sizes), 10000)
+        self.assertTrue(max(sizes) <= 4096)
+
+    def test_failure(self):
+        stream = ShellStream('seq 1 500; exit 4', echo=False, tail=2)
+        with self.assertRaises(CalledProcessError) as cm:
+            stream.wait()
+        self.assertEqual(cm.exception.returncode, 4)
+        self.assertEqual(cm.exception.output, '499\n500\n')
+
+        unchecked = ShellStream('exit 4', echo=False, check=False)
+        self.assertEqual(unchecked.wait(), 4)
+
+    def test_capture_spills(self):
+        real_size = otto.shell.SPILL_SIZE
+        otto.shell.SPILL_SIZE = 100
+        try:
+            with ShellStream('seq 1 1000', echo=False, capture=True) as stream:
+                self.assertEqual(stream.output(), ''.join(
+                    '%d\n' % i for i in range(1, 1001)))
+                self.assertTrue(stream.captured._rolled)
+        finally:
+            otto.shell.SPILL_SIZE = real_size
+
+    def test_tee(self):
+        real_stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            with ShellStream('echo a; echo b', echo=False, tee=True) as stream:
+                stream.wait()
+            self.assertEqual(sys.stdout.getvalue(), 'a\nb\n')
+        finally:
+            sys.stdout = real_stdout
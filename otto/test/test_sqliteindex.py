@@ -0,0 +1,144 @@
+import unittest
+import json
+import os
+import os.path
+import shutil
+import tempfile
+
+from otto import CMDS_FILE, ROOT_FILE
+from otto.cmdstore import CmdStore
+from otto.incremental import State
+from otto.sqliteindex import SqliteIndex, SqliteState, migrate
+
+class TestSqliteIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.pack_dir = os.path.join(self.root, 'pack')
+        os.makedirs(self.pack_dir)
+
+        self.cmd_path = os.path.join(self.pack_dir, 'cmd.py')
+        with open(self.cmd_path, 'w') as outp:
+            outp.write('pass\n')
+
+        self.config_path = os.path.join(self.pack_dir, CMDS_FILE)
+        self.write_cmds({'cmd': self.cmd_path})
+
+        self.index_path = os.path.join(self.root, 'cache', 'index.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_cmds(self, cmds):
+        with open(self.config_path, 'w') as outp:
+            json.dump({'cmds': cmds}, outp)
+
+    def load_store(self):
+        store = CmdStore()
+        store.init_base({})
+        store.init_index(SqliteIndex(self.index_path))
+        store.load_pack('pack', self.pack_dir)
+        store.save_index()
+        return store
+
+    def test_round_trip(self):
+        self.load_store()
+        index = SqliteIndex(self.index_path)
+        self.assertEqual(index.get(self.config_path), {'cmd': self.cmd_path})
+
+    def test_stale(self):
+        self.load_store()
+        self.write_cmds({'cmd': self.cmd_path, 'other': self.cmd_path})
+        self.assertEqual(SqliteIndex(self.index_path).get(self.config_path), None)
+
+        store = self.load_store()
+        self.assertEqual(set(store.cmds_by_pack['pack']), set(['cmd', 'other']))
+        self.assertEqual(
+                set(SqliteIndex(self.index_path).get(self.config_path)),
+                set(['cmd', 'other']),
+                )
+
+    def test_unsaved_changes_discarded(self):
+        index = SqliteIndex(self.index_path)
+        index.put(self.config_path, {'cmd': self.cmd_path})
+        self.assertEqual(SqliteIndex(self.index_path).get(self.config_path), None)
+
+    def test_unsaved_changes_dont_lock(self):
+        import sqlite3
+        index = SqliteIndex(self.index_path)
+        index.get(self.config_path)
+        index.put(self.config_path, {'cmd': self.cmd_path})
+
+        # Another otto process can write until save() is called
+        other = sqlite3.connect(self.index_path, timeout=0)
+        with other:
+            other.execute("INSERT INTO fingerprints VALUES ('s', 'c', 'd', '')")
+        other.close()
+
+        index.save()
+        self.assertEqual(SqliteIndex(self.index_path).get(self.config_path),
+                {'cmd': self.cmd_path})
+
+    def test_deleted_pack_forgotten(self):
+        self.load_store()
+        index = SqliteIndex(self.index_path)
+        index.discard(os.path.join(self.root, 'other', CMDS_FILE))
+        os.remove(self.config_path)
+        index.save()
+        self.assertEqual(
+                index.db.execute('SELECT COUNT(*) FROM cmds').fetchone()[0], 0)
+
+    def test_state(self):
+        state = SqliteState(SqliteIndex(self.index_path), '/a/.otto/state')
+        self.assertEqual(state.get('p:cmd'), (None, {}))
+        state.put('p:cmd', 'digest', {'f': (1.0, 2, 'd')})
+
+        state = SqliteState(SqliteIndex(self.index_path), '/a/.otto/state')
+        self.assertEqual(state.get('p:cmd'), ('digest', {'f': (1.0, 2, 'd')}))
+        other = SqliteState(SqliteIndex(self.index_path), '/b/.otto/state')
+        self.assertEqual(other.get('p:cmd'), (None, {}))
+
+    def test_fork(self):
+        index = SqliteIndex(self.index_path)
+        index.get(self.config_path)
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                index.put(self.config_path, {'cmd': self.cmd_path})
+                index.save()
+                status = 0
+            finally:
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        self.assertEqual(
+                SqliteIndex(self.index_path).get(self.config_path),
+                {'cmd': self.cmd_path},
+                )
+        # The parent's connection still works
+        index.put(self.config_path, {})
+        index.save()
+
+    def test_migrate(self):
+        root_config = os.path.join(self.root, ROOT_FILE)
+        with open(root_config, 'w') as outp:
+            json.dump({'packs': {
+                'pack': self.pack_dir,
+                'gone': os.path.join(self.root, 'gone'),
+                }}, outp)
+        state_path = os.path.join(self.root, 'state')
+        State(state_path).put('pack:cmd', 'digest', {})
+
+        index = SqliteIndex(self.index_path)
+        self.assertEqual(
+                migrate(index, [root_config, '/missing'], [state_path]),
+                (1, 1),
+                )
+
+        index = SqliteIndex(self.index_path)
+        self.assertEqual(index.get(self.config_path), {'cmd': self.cmd_path})
+        self.assertEqual(
+                SqliteState(index, state_path).get('pack:cmd'),
+                ('digest', {}),
+                )
@@ -0,0 +1,63 @@
+import unittest
+import sys
+import time
+import StringIO
+from subprocess import CalledProcessError
+
+from otto.tasks import Gather, drive, gather
+from otto.utils import spawn
+
+class TestTasks(unittest.TestCase):
+    def setUp(self):
+        self._real_stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self._real_stdout
+
+    def task(self, cmd, **kwargs):
+        kwargs.setdefault('echo', False)
+        return spawn(cmd, **kwargs)
+
+    def test_gather(self):
+        start = time.time()
+        outputs = gather([self.task('sleep 0.5; echo %d' % i) for i in range(4)])
+        self.assertEqual(outputs, ['0\n', '1\n', '2\n', '3\n'])
+        self.assertTrue(time.time() - start < 1.5)
+
+    def test_limit(self):
+        start = time.time()
+        gather([self.task('sleep 0.3') for i in range(4)], limit=2)
+        self.assertTrue(time.time() - start >= 0.6)
+
+    def test_prefixed_output(self):
+        gather([self.task('echo a; echo b', prefix='one')])
+        lines = sys.stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].endswith('one |\033[0m a'))
+
+    def test_failure(self):
+        tasks = lambda: [self.task('echo ok'), self.task('echo bad; exit 2')]
+        with self.assertRaises(CalledProcessError) as cm:
+            gather(tasks())
+        self.assertEqual(cm.exception.returncode, 2)
+        self.assertEqual(cm.exception.output, 'bad\n')
+
+        results = Gather(tasks(), return_exceptions=True).run()
+        self.assertEqual(results[0], 'ok\n')
+        self.assertTrue(isinstance(results[1], CalledProcessError))
+
+    def test_drive(self):
+        seen = []
+
+        def coroutine():
+            outputs = yield [self.task('echo a'), self.task('echo b')]
+            seen.append(outputs)
+            seen.append((yield self.task('echo c')))
+            try:
+                yield self.task('exit 1')
+            except CalledProcessError as e:
+                seen.append(e.returncode)
+
+        drive(coroutine())
+        self.assertEqual(seen, [['a\n', 'b\n'], 'c\n', 1])
@@ -1,7 +1,11 @@
 import unittest
 import StringIO
 import sys
+import json
+import shutil
+import tempfile
 
+import otto.utils
 from otto.utils import *
 
 class TestUtil(unittest.TestCase):
@@ -28,3 +32,17 @@ class TestUtil(unittest.TestCase):
 
         self.assertEqual(expected, self.stdout.getvalue())
 
+    def test_remembered(self):
+        root = tempfile.mkdtemp()
+        configs = (otto.utils.GLOBAL_CONFIG, otto.utils.LOCAL_CONFIG)
+        otto.utils.GLOBAL_CONFIG = os.path.join(root, 'global.json')
+        otto.utils.LOCAL_CONFIG = os.path.join(root, 'local.json')
+        try:
+            with open(otto.utils.GLOBAL_CONFIG, 'w') as outp:
+                json.dump({'remember': {'a': ['1'], 'b': ['2']}}, outp)
+            with open(otto.utils.LOCAL_CONFIG, 'w') as outp:
+                json.dump({'remember': {'b': ['3']}}, outp)
+            self.assertEqual(remembered(), {'a': ['1'], 'b': ['3']})
+        finally:
+            otto.utils.GLOBAL_CONFIG, otto.utils.LOCAL_CONFIG = configs
+            shutil.rmtree(root)
@@ -0,0 +1,101 @@
+import unittest
+import os
+import os.path
+import time
+import shutil
+import tempfile
+
+from otto.utils import fork_call
+from otto.watch import (
+        InotifyWatcher, PollWatcher, matches, rerun, watch_roots,
+        )
+
+class FakeWatcher(object):
+    """Reports each batch of changes in turn, then nothing."""
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def changes(self, timeout=None):
+        if self.batches:
+            return self.batches.pop(0)
+        time.sleep(timeout or 0)
+        return []
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.root)
+        os.makedirs('src/sub')
+        os.makedirs('src/.hg')
+        os.makedirs('src/_cache')
+        self.write('src/a.proto')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.root)
+
+    def write(self, path, content=''):
+        with open(path, 'w') as outp:
+            outp.write(content)
+
+    def test_watch_roots(self):
+        self.assertEqual(watch_roots(['src/*.proto', 'src/sub']), ['src', 'src/sub'])
+        self.assertEqual(watch_roots(['*.txt', 'src/a.proto']), ['.', 'src'])
+
+    def test_matches(self):
+        self.assertTrue(matches('src/a.proto', ['src/*.proto']))
+        self.assertTrue(matches('./src/sub/b', ['src']))
+        self.assertFalse(matches('other/a.proto', ['src/*.proto']))
+        self.assertTrue(matches('src/a.proto', ['.']))
+        self.assertTrue(matches('zz.txt', ['./']))
+
+    def check_watcher(self, watcher):
+        try:
+            self.assertEqual(watcher.changes(0.1), [])
+
+            self.write('src/a.proto', 'changed')
+            self.write('src/out', 'ignored')
+            self.write('src/.hg/dirstate')
+            self.write('src/_cache/index.json')
+            self.assertEqual(watcher.changes(2), ['src/a.proto'])
+
+            os.makedirs('src/new')
+            self.write('src/new/b.proto')
+            os.makedirs('src/.git/refs')
+            self.write('src/.git/HEAD')
+            changed = watcher.changes(2)
+            changed += watcher.changes(0.6)
+            self.assertTrue('src/new/b.proto' in changed)
+            self.assertEqual([path for path in changed if '.git' in path], [])
+        finally:
+            watcher.close()
+
+    def test_poll(self):
+        self.check_watcher(PollWatcher(['src'], ['src/out'], interval=0.05))
+
+    def test_inotify(self):
+        self.check_watcher(InotifyWatcher(['src'], ['src/out']))
+
+    # '.' is what `otto watch` uses for cmds without inputs
+    def test_poll_curdir(self):
+        self.check_watcher(PollWatcher(['.'], ['src/out'], interval=0.05))
+
+    def test_inotify_curdir(self):
+        self.check_watcher(InotifyWatcher(['.'], ['src/out']))
+
+    def test_rerun(self):
+        runs = []
+        statuses = []
+
+        def start():
+            runs.append(len(runs))
+            seconds = 5 if len(runs) == 1 else 0
+            return fork_call(time.sleep, seconds)
+
+        # The first (slow) run is cancelled by the changes, the second
+        # covers both batches of them
+        watcher = FakeWatcher([[], ['a'], ['b']])
+        rerun(watcher, start, statuses.append, debounce=0.1, runs=2)
+        self.assertEqual(runs, [0, 1])
+        self.assertEqual(statuses, [None, 0])
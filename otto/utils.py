@@ -1,49 +1,57 @@
+"""Helpers shared by the base cmds and user cmds.
+
+Heavier stdlib modules (subprocess, shutil, getpass, ...) are imported by the
+functions that need them so that `otto -l` and friends don't pay for them."""
 import abc
 import os
 import os.path
 import sys
-import json
-import subprocess
-import re
-
-from getpass import getpass
-from lament import ConfigFile
-from shutil import move, copytree, rmtree
 
 from otto import *
 
-def rebuild_root_config(path):
-    def _ottopack_pair(path):
-        dir_path = os.path.dirname(path)
-        pack_name = dir_path.split('/')[-1]
-        return pack_name, dir_path
+# The file helpers below keep the current config session (if any) in step
+# with the files they touch. They take the same arguments as shutil's.
+
+def move(src, dest, *args, **kwargs):
+    from shutil import move as _move
+    flush_configs()
+    return _move(src, dest, *args, **kwargs)
 
-    find_raw = shell('find %s -name "%s"' % (path, CMDS_FILE), echo=False)
-    results = dict(_ottopack_pair(line) for line in find_raw.splitlines())
+def copytree(src, dest, *args, **kwargs):
+    from shutil import copytree as _copytree
+    flush_configs()
+    return _copytree(src, dest, *args, **kwargs)
+
+def rmtree(path, *args, **kwargs):
+    from shutil import rmtree as _rmtree
+    if _sessions:
+        _sessions[0].discard(path)
+    return _rmtree(path, *args, **kwargs)
+
+def rebuild_root_config(path, results=None):
+    """Point path's ROOT_FILE at the packs beneath it, which are found if
+    they're not given (see otto.scanner)."""
+    if results is None:
+        from otto.scanner import find_packs
+        results = find_packs(path)
 
     config_path = os.path.join(path, ROOT_FILE)
-    with ConfigFile(config_path) as config:
+    with config_file(config_path) as config:
         config['packs'] = results
 
     return results
 
-def rebuild_cmd_config(path):
-    def _ottocmd_name(code):
-        match = re.search("^class (.*?)\(", code)
-        if match:
-            return match.group(1).lower()
-
-    file_pattern = os.path.join(path, '*.py')
-    grep_raw = shell('grep %s -He "^class .*("' % file_pattern, echo=False)
-    grep_results = [line.split(':')[:2] for line in grep_raw.splitlines()]
-    results = {_ottocmd_name(cmd): path for path, cmd in grep_results}
-
-    # Clean up any bad results found
-    if None in results:
-        del results[None]
+def rebuild_cmd_config(path, results=None):
+    """List the cmds in the pack at path in its CMDS_FILE, they're found if
+    they're not given (see otto.scanner)."""
+    if results is None:
+        from otto.scanner import Journal, scan_pack
+        journal = Journal()
+        results = scan_pack(path, journal)
+        journal.save()
 
     cmds_config = os.path.join(path, CMDS_FILE)
-    with ConfigFile(cmds_config) as config:
+    with config_file(cmds_config) as config:
         config['cmds'] = results
 
     return results
@@ -52,6 +60,62 @@ def bail(msg=None):
     info("\nExiting: %s" % msg if msg else "\nExiting...")
     sys.exit()
 
+def exit_status(e):
+    """Convert a SystemExit into the status the interpreter would exit with."""
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    sys.stderr.write("%s\n" % e.code)
+    return 1
+
+### Processes
+
+def fork_call(func, *args):
+    """Call func(*args) in a forked child and return the child's pid.
+
+    The child exits with whatever status func returns, or the status of the
+    SystemExit it raises."""
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            status = func(*args) or 0
+        except SystemExit as e:
+            status = exit_status(e)
+        except KeyboardInterrupt:
+            status = 130
+        except:
+            import traceback
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status & 0xff)
+    return pid
+
+def wait_child():
+    """Wait for any child to exit and return (pid, exit status)."""
+    import errno
+    while True:
+        try:
+            pid, wait_status = os.wait()
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+    return pid, child_status(wait_status)
+
+def child_status(wait_status):
+    """Convert a status from os.wait() into an exit status, like the shell."""
+    if os.WIFSIGNALED(wait_status):
+        return 128 + os.WTERMSIG(wait_status)
+    return os.WEXITSTATUS(wait_status)
+
 ### Pack Info
 
 def pack_root(pack):
@@ -62,12 +126,20 @@ def pack_path(pack):
     return os.path.join(pack_root(pack), pack)
 
 def get_packs(src_dir):
-    with ConfigFile(os.path.join(src_dir, ROOT_FILE)) as config:
+    with config_file(os.path.join(src_dir, ROOT_FILE)) as config:
         return config.get('packs', {})
 
+def remembered():
+    """The args bound to cmds by `otto remember`, globally and then locally,
+    as OttoConfig reads them."""
+    remember = {}
+    for config_path in (GLOBAL_CONFIG, LOCAL_CONFIG):
+        remember.update(_read_config(config_path).get('remember', {}))
+    return remember
+
 def pack_empty(pack):
     path = pack_path(pack)
-    with ConfigFile(os.path.join(path, CMDS_FILE)) as config:
+    with config_file(os.path.join(path, CMDS_FILE)) as config:
         return len(config.get('cmds', {})) == 0
 
 ### Manipulate Packs
@@ -78,23 +150,23 @@ def touch_pack(pack):
     ensure_dir(dest)
 
     root_config = os.path.join(pack_root(pack), ROOT_FILE)
-    with ConfigFile(root_config, True) as config:
+    with config_file(root_config, True) as config:
         packs = config.setdefault('packs', {})
         packs[pack] = dest
 
     cmds_config = os.path.join(pack_path(pack), CMDS_FILE)
-    with ConfigFile(cmds_config, True) as local_cmds:
+    with config_file(cmds_config, True) as local_cmds:
         cmds = local_cmds.setdefault('cmds', {})
 
 def update_packs(src_dir, new_packs):
-    with ConfigFile(os.path.join(src_dir, ROOT_FILE), True) as config:
+    with config_file(os.path.join(src_dir, ROOT_FILE), True) as config:
         packs = config.setdefault('packs', {})
         packs.update(new_packs)
 
 def move_pack(src_path, src_pack, dest_pack):
     dest = os.path.join(src_path, dest_pack)
     # Add pack to dest config
-    with ConfigFile(os.path.join(src_path, ROOT_FILE)) as config:
+    with config_file(os.path.join(src_path, ROOT_FILE)) as config:
         config['packs'][dest_pack] = dest_pack
         del config['packs'][src_pack]
 
@@ -115,7 +187,7 @@ def clone_pack(src_path, src_pack, dest_path, dest_pack=None):
     ensure_dir(dest_path)
 
     # Add pack to dest config
-    with ConfigFile(os.path.join(dest_path, ROOT_FILE), True) as config:
+    with config_file(os.path.join(dest_path, ROOT_FILE), True) as config:
         packs = config.setdefault('packs', {})
         packs[dest_pack] = dest
 
@@ -133,7 +205,7 @@ def rm_pack(parent_path, pack):
     config_path = os.path.join(parent_path, ROOT_FILE)
 
     # Remove pack from config
-    with ConfigFile(config_path) as config:
+    with config_file(config_path) as config:
         packs = config.get('packs', {})
         packs.pop(pack, None)
 
@@ -161,7 +233,7 @@ def cmd_split(name, default_pack=None):
 
 def fix_cmds(dest):
     """Change cmd.json cmds values from file names to absolute paths."""
-    with ConfigFile(os.path.join(dest, CMDS_FILE)) as config:
+    with config_file(os.path.join(dest, CMDS_FILE)) as config:
         cmds = config.setdefault('cmds', {})
         for key in cmds:
             rel_path = os.path.join(dest, "%s.py" % key)
@@ -181,7 +253,7 @@ def move_cmd(src, dest):
 
     # Update old config
     src_file = None
-    with ConfigFile(src_cmds_json) as config:
+    with config_file(src_cmds_json) as config:
         src_file = config['cmds'].pop(src_cmd, None)
 
     # If CMDS_FILE was corrupt, figure out src file path
@@ -201,7 +273,7 @@ def move_cmd(src, dest):
 
     # Update new config
     dest_cmds_json = os.path.join(dest_path, CMDS_FILE)
-    with ConfigFile(dest_cmds_json) as config:
+    with config_file(dest_cmds_json) as config:
         config['cmds'][src_cmd] = ''
     fix_cmds(dest_path)
 
@@ -215,7 +287,7 @@ def rename_cmd(pack, src_cmd, dest_cmd):
     move(src_file, dest_file)
 
     # Update new config
-    with ConfigFile(os.path.join(dest_path, CMDS_FILE)) as config:
+    with config_file(os.path.join(dest_path, CMDS_FILE)) as config:
         config['cmds'].pop(src_cmd)
         config['cmds'][dest_cmd] = ''
     fix_cmds(dest_path)
@@ -227,19 +299,18 @@ def rename_cmd(pack, src_cmd, dest_cmd):
         pass
 
     # Edit OttoCmd class name inside file
-    command = r"sed -i 's/class %s(otto.OttoCmd):/class %s(otto.OttoCmd):/' %s"
-    shell(command % (
+    expression = r's/class %s(otto.OttoCmd):/class %s(otto.OttoCmd):/' % (
         src_cmd.capitalize(),
         dest_cmd.capitalize(),
-        dest_file
-        ), echo=False)
+        )
+    shell(['sed', '-i', expression, dest_file], echo=False)
 
 def clone_all(src, dest): # TODO: Test this
     """Clone a dir containing multiple packs to a different location."""
     ensure_dir(dest)
 
     # Add pack to dest config
-    with ConfigFile(os.path.join(src, ROOT_FILE)) as config:
+    with config_file(os.path.join(src, ROOT_FILE)) as config:
         src_packs = config.setdefault('packs', {})
         for pack_name, pack_path in src_packs:
             clone_pack(
@@ -255,6 +326,14 @@ class OttoCmd(object):
     """Base class for all `otto` commands."""
     __metaclass__ = abc.ABCMeta
 
+    # Other cmds ("[pack:]cmd") that must succeed before this one runs
+    deps = []
+
+    # Glob patterns and paths, if inputs are unchanged since the last
+    # successful run and outputs exist the cmd is skipped (see otto.incremental)
+    inputs = []
+    outputs = []
+
     def __init__(self, store):
         self._store = store
 
@@ -286,6 +365,7 @@ def _config_dir_and_path(config_path):
 
 def open_config(config_path=None):
     """Opens config file, creates .otto/ folder if needed"""
+    import json
     config_dir, config_path = _config_dir_and_path(config_path)
 
     ensure_dir(config_dir)
@@ -300,6 +380,7 @@ def open_config(config_path=None):
 
 def save_config(config, config_path=None):
     """Save config to LOCAL_CONFIG"""
+    import json
     config_dir, config_path = _config_dir_and_path(config_path)
 
     ensure_dir(config_dir)
@@ -313,6 +394,150 @@ def ensure_dir(path):
     if not os.path.isdir(path):
         os.makedirs(path)
 
+### Config sessions
+
+class ConfigSession(object):
+    """A unit of work over JSON config files (see config_session).
+
+    Each file is read once and kept in memory, changed files are written when
+    the session is committed."""
+    def __init__(self):
+        # {path: [config, create, contents as read]}
+        self.files = {}
+
+    def open(self, config_path, create=False):
+        """The config in config_path, like lament's ConfigFile: the directory
+        must exist, the file is only written if it exists or create is set."""
+        import json
+        path = os.path.abspath(config_path)
+        entry = self.files.get(path)
+        if entry is not None:
+            entry[1] = entry[1] or create
+            return entry[0]
+
+        if not os.path.isdir(os.path.dirname(path)):
+            raise Exception("%s doesn't exist" % os.path.dirname(config_path))
+
+        config = _read_config(path)
+        self.files[path] = [config, create, json.dumps(config, sort_keys=True)]
+        return config
+
+    def flush(self):
+        """Write every changed file, atomically. Each file is re-read under a
+        lock and this session's changes are merged into it, so changes made
+        by other otto processes in the meantime aren't lost."""
+        import json
+        from otto.locking import locked, atomic_write
+        for path, entry in sorted(self.files.iteritems()):
+            config, create, contents = entry
+            if json.dumps(config, sort_keys=True) == contents and \
+                    (os.path.isfile(path) or not create):
+                continue
+            if not os.path.isdir(os.path.dirname(path)):
+                continue
+
+            with locked(os.path.dirname(path)):
+                if not (create or os.path.isfile(path)):
+                    continue
+                merged = merge_config(json.loads(contents), config, _read_config(path))
+                atomic_write(path, json.dumps(merged, indent=4))
+
+            config.clear()
+            config.update(merged)
+            entry[2] = json.dumps(merged, sort_keys=True)
+
+    def discard(self, dir_path):
+        """Forget every file under dir_path, it's about to be deleted."""
+        prefix = os.path.join(os.path.abspath(dir_path), '')
+        for path in self.files.keys():
+            if path.startswith(prefix):
+                del self.files[path]
+
+def _read_config(path):
+    import json
+    try:
+        with open(path, 'r') as inp:
+            config = json.load(inp)
+    except (IOError, ValueError):
+        return {}
+    return config if isinstance(config, dict) else {}
+
+def merge_config(base, ours, theirs):
+    """Three way merge of config dicts: the changes made from base to ours,
+    applied to theirs. Where both changed the same value, ours wins."""
+    merged = dict(theirs)
+    for key in set(base) | set(ours):
+        if key not in ours:
+            merged.pop(key, None)
+            continue
+
+        value = ours[key]
+        if key in base and base[key] == value:
+            continue
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            old = base.get(key)
+            merged[key] = merge_config(
+                    old if isinstance(old, dict) else {}, value, merged[key])
+        else:
+            merged[key] = value
+    return merged
+
+_sessions = []
+
+def config_session():
+    """Group config file changes: within a session each config_file() is read
+    at most once and every changed file is written once, at the end, and not
+    at all if it ends with an exception. Nested sessions join the outer one.
+
+    with config_session():
+        touch_pack(pack)
+        move_cmd(src, dest)"""
+    from contextlib import contextmanager
+
+    @contextmanager
+    def _session():
+        if _sessions:
+            yield _sessions[0]
+            return
+
+        session = ConfigSession()
+        _sessions.append(session)
+        try:
+            yield session
+        finally:
+            _sessions.remove(session)
+        session.flush()
+
+    return _session()
+
+def config_file(config_path, create=False):
+    """Use in place of lament's ConfigFile, as part of the current config
+    session (or a session of its own)."""
+    from contextlib import contextmanager
+
+    @contextmanager
+    def _config_file():
+        with config_session() as session:
+            yield session.open(config_path, create)
+
+    return _config_file()
+
+def flush_configs():
+    """Write out the current session's changes, before files are copied."""
+    if _sessions:
+        _sessions[0].flush()
+
+def in_config_session(func):
+    """Decorator, runs func in a config session."""
+    from functools import wraps
+
+    @wraps(func)
+    def _in_session(*args, **kwargs):
+        with config_session():
+            return func(*args, **kwargs)
+
+    return _in_session
+
 def blue_format(msg):
     return "\033[94m%s\033[0m" % str(msg)
 
@@ -336,20 +561,34 @@ def bullets(messages, bullet="-"):
         print " {} {}".format(bullet, message)
 
 def shell(cmd, echo=True, stdout=False):
-    outp = ''
-    try:
-        if echo:
-            blue("  $ %s" % cmd)
-        if stdout:
-            subprocess.call(cmd, shell=True)
-        else:
-            outp = subprocess.check_output(cmd, shell=True)
-    except CalledProcessError as e:
-        pass
-    finally:
-        return outp
+    """Run cmd and return what it printed, even if it failed. For commands
+    with a lot of output (or that never finish), use stream().
+
+    cmd is a shell command line, or an argv list which is run directly rather
+    than through /bin/sh (see otto.shell)."""
+    from otto.shell import command_line, run
+    if echo:
+        blue("  $ %s" % command_line(cmd))
+    _, outp = run(cmd, capture=not stdout)
+    return outp
+
+def stream(cmd, **kwargs):
+    """Run cmd, iterating over its output as it's printed (see otto.shell)."""
+    from otto.shell import ShellStream
+    return ShellStream(cmd, **kwargs)
+
+def spawn(cmd, **kwargs):
+    """A shell task, to be run concurrently by gather() (see otto.tasks)."""
+    from otto.tasks import ShellTask
+    return ShellTask(cmd, **kwargs)
+
+def gather(tasks, limit=None, return_exceptions=False):
+    """Run tasks from spawn() at the same time and return their output."""
+    from otto.tasks import gather as _gather
+    return _gather(tasks, limit, return_exceptions)
 
 def edit_file(file_path):
+    import subprocess
     subprocess.call(['vim', file_path])
 
 class Dialog(object):
@@ -447,6 +686,7 @@ class Dialog(object):
             bail()
 
     def secret(self):
+        from getpass import getpass
         self._validate()
 
         try:
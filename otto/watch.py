@@ -0,0 +1,328 @@
+"""Wait for files to change, used by `otto watch`.
+
+On Linux, inotify(7) (through ctypes) tells us about changes as they happen.
+Everywhere else, or if inotify can't be set up, the files are stat'd every
+POLL_INTERVAL seconds instead.
+
+Watchers are given glob patterns (like OttoCmd.inputs, a matching directory
+covers everything beneath it) and report which paths matching them changed.
+Paths under an ignored prefix (a cmd's outputs, say) or in a directory named
+in IGNORED_DIRS are never reported, and neither watcher descends into them
+(or into hidden directories).
+
+rerun() starts a run (in a child forked from the warm process) and starts it
+again whenever the watcher reports changes, cancelling the current run if it
+hasn't finished yet."""
+import abc
+import os
+import glob
+import os.path
+import time
+import errno
+import select
+import signal
+import struct
+from fnmatch import fnmatch
+
+from otto import CACHE_DIR, LOCAL_DIR
+
+POLL_INTERVAL = 0.5
+
+# Version control and otto's own state, ignored wherever they turn up
+IGNORED_DIRS = frozenset([
+    '.git', '.hg', '.svn',
+    os.path.basename(LOCAL_DIR), os.path.basename(CACHE_DIR),
+    ])
+
+# Changes are acted on once nothing else has changed for this long
+DEBOUNCE = 0.2
+
+# How often to check whether a run has finished while waiting for changes
+CHILD_POLL = 0.1
+
+# From <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x800
+IN_CLOEXEC = 0x80000
+IN_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+EVENT = struct.Struct('iIII')
+
+
+def _has_magic(part):
+    return any(char in part for char in '*?[')
+
+
+def watch_roots(patterns):
+    """The directories that have to be watched to see changes to patterns:
+    the part of each pattern before its first wildcard."""
+    roots = set()
+    for pattern in patterns:
+        parts = os.path.normpath(pattern).split(os.sep)
+        static = []
+        for part in parts:
+            if _has_magic(part):
+                break
+            static.append(part)
+
+        root = os.sep.join(static) or os.curdir
+        if len(static) == len(parts) and not os.path.isdir(root):
+            root = os.path.dirname(root) or os.curdir
+        roots.add(root)
+    return sorted(roots)
+
+
+def matches(path, patterns):
+    """Whether path matches one of patterns, or is beneath a match."""
+    path = os.path.normpath(path)
+    parts = path.split(os.sep)
+    prefixes = [os.sep.join(parts[:i]) for i in range(1, len(parts) + 1)]
+    for pattern in patterns:
+        pattern = os.path.normpath(pattern)
+        if pattern == os.curdir:
+            return True
+        if any(fnmatch(prefix, pattern) for prefix in prefixes):
+            return True
+    return False
+
+
+class Watcher(object):
+    __metaclass__ = abc.ABCMeta
+
+    def __init__(self, patterns, ignore=()):
+        self.patterns = list(patterns)
+        self.ignore = [os.path.normpath(path) for path in ignore]
+
+    def _ignored(self, path):
+        path = os.path.normpath(path)
+        if IGNORED_DIRS.intersection(path.split(os.sep)):
+            return True
+        for ignored in self.ignore:
+            if path == ignored or path.startswith(ignored + os.sep):
+                return True
+        return False
+
+    def _wanted(self, path):
+        return not self._ignored(path) and matches(path, self.patterns)
+
+    def _walk(self, root):
+        """(dir_path, file_names) for root and every directory beneath it
+        that isn't ignored or hidden."""
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = [name for name in dir_names
+                    if not name.startswith('.') and
+                    not self._ignored(os.path.join(dir_path, name))]
+            yield dir_path, file_names
+
+    def _files(self, patterns):
+        """Every file matching patterns (or beneath a matching directory)
+        that isn't ignored."""
+        paths = set()
+        for pattern in patterns:
+            for match in glob.glob(pattern):
+                if self._ignored(match):
+                    continue
+                if not os.path.isdir(match):
+                    paths.add(match)
+                    continue
+                for dir_path, file_names in self._walk(match):
+                    paths.update(os.path.join(dir_path, name) for name in file_names)
+        return sorted(paths)
+
+    @abc.abstractmethod
+    def changes(self, timeout=None):
+        """Wait up to timeout seconds (forever if None) for something to
+        change, returns the sorted paths that did."""
+
+    def close(self):
+        pass
+
+
+class PollWatcher(Watcher):
+    def __init__(self, patterns, ignore=(), interval=POLL_INTERVAL):
+        super(PollWatcher, self).__init__(patterns, ignore)
+        self.interval = interval
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self):
+        snapshot = {}
+        for path in self._files(self.patterns):
+            if not self._wanted(path):
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_mtime, st.st_size, st.st_ino)
+        return snapshot
+
+    def changes(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self.interval
+            if deadline is not None:
+                wait = min(wait, max(0, deadline - time.time()))
+            time.sleep(wait)
+
+            snapshot = self._snapshot()
+            changed = set(snapshot.viewitems() ^ self.snapshot.viewitems())
+            self.snapshot = snapshot
+            if changed or (deadline is not None and time.time() >= deadline):
+                return sorted(set(os.path.normpath(path) for path, _ in changed))
+
+
+class InotifyWatcher(Watcher):
+    def __init__(self, patterns, ignore=()):
+        super(InotifyWatcher, self).__init__(patterns, ignore)
+        import ctypes
+        self._libc = libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._get_errno = ctypes.get_errno
+        self.dirs = {}
+        for root in watch_roots(self.patterns):
+            self._add_tree(root)
+
+    def _add_tree(self, root):
+        for dir_path, _ in self._walk(root):
+            wd = self._libc.inotify_add_watch(self.fd, dir_path, IN_MASK)
+            if wd < 0:
+                err = self._get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, "inotify_add_watch failed for %s" % dir_path)
+            self.dirs[wd] = dir_path
+
+    def _read(self):
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+
+            dir_path = self.dirs.get(wd)
+            if dir_path is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                del self.dirs[wd]
+                continue
+
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                if name.startswith('.') or self._ignored(path):
+                    continue
+                # Watch new directories too, and anything already in them
+                self._add_tree(path)
+                changed.extend(self._files([path]))
+            changed.append(path)
+
+        return [path for path in changed if self._wanted(path)]
+
+    def changes(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = None if deadline is None else max(0, deadline - time.time())
+            try:
+                ready, _, _ = select.select([self.fd], [], [], wait)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                ready = []
+
+            changed = self._read() if ready else []
+            if changed or (deadline is not None and time.time() >= deadline):
+                return sorted(set(os.path.normpath(path) for path in changed))
+
+    def close(self):
+        os.close(self.fd)
+
+
+def watcher(patterns, ignore=()):
+    """An InotifyWatcher if possible, otherwise a PollWatcher."""
+    try:
+        return InotifyWatcher(patterns, ignore)
+    except (OSError, AttributeError):
+        return PollWatcher(patterns, ignore)
+
+
+def _waitpid(pid, options=0):
+    while True:
+        try:
+            return os.waitpid(pid, options)
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+
+def cancel(pid):
+    """Stop a run, along with anything it started. Runs lead their own
+    process group (see rerun)."""
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except OSError:
+        pass
+    _waitpid(pid)
+
+
+def rerun(watcher, start, report, debounce=DEBOUNCE, runs=None):
+    """Call start(), which should fork a child to do a run and return its
+    pid, now and whenever watcher sees changes, once they've settled for
+    debounce seconds. report(status) is called when a run finishes, with None
+    if it was cancelled. Stops once runs runs have finished, if given."""
+    from otto.utils import child_status
+
+    def _start():
+        pid = start()
+        try:
+            # Also done by the child, whichever gets there first
+            os.setpgid(pid, pid)
+        except OSError:
+            pass
+        return pid
+
+    pid = _start()
+    started = 1
+    try:
+        while True:
+            changed = watcher.changes(None if pid is None else CHILD_POLL)
+
+            if pid is not None:
+                done, wait_status = _waitpid(pid, os.WNOHANG)
+                if done:
+                    pid = None
+                    report(child_status(wait_status))
+            if pid is None and runs is not None and started >= runs:
+                return
+            if not changed:
+                continue
+
+            while watcher.changes(debounce):
+                pass
+
+            if pid is not None:
+                cancel(pid)
+                report(None)
+            pid = _start()
+            started += 1
+    finally:
+        if pid is not None:
+            cancel(pid)
@@ -0,0 +1,24 @@
+# bash completion for otto, source this from ~/.bashrc:
+#   . /path/to/otto-completion.bash
+
+_otto() {
+    local cur="${COMP_WORDS[COMP_CWORD]}"
+    local line="${COMP_LINE:0:COMP_POINT}"
+    local words
+
+    # Split the line ourselves so that "pack:cmd" stays one word
+    read -ra words <<< "$line"
+    if [[ -z "$line" || "$line" == *" " ]]; then
+        words+=("")
+    fi
+
+    local IFS=$'\n'
+    local candidates=( $(otto --complete "${words[@]:1}" 2>/dev/null) )
+
+    # bash only replaces the part of the word after the last ':'
+    local word="${words[${#words[@]}-1]}"
+    local strip="${word%"$cur"}"
+    COMPREPLY=( "${candidates[@]#"$strip"}" )
+}
+
+complete -o default -F _otto otto
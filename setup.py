@@ -7,7 +7,11 @@ setup(
     author='Nic Roland',
     author_email='nicroland9@gmail.com',
     packages=['otto'],
-    data_files=[('otto_res', ['res/done.wav'])],
+    data_files=[('otto_res', [
+        'res/done.wav',
+        'res/otto-completion.bash',
+        'res/_otto',
+        ])],
     scripts=['bin/otto'],
     description=OTTO_DESC,
     #long_description=open('README.rst').read(),